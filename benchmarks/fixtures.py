@@ -0,0 +1,541 @@
+#! /usr/bin/env python
+
+# Generates synthetic browser libraries for benchmarks, no browser needed.
+#
+# Usage: python benchmarks/fixtures.py OUTPUT [--size N] [--seed N]
+#
+# OUTPUT/chrome/Default, OUTPUT/firefox/<profile> and OUTPUT/safari are laid
+# out like the real libraries and can be passed as `library`.
+
+import argparse
+import json
+import os
+import plistlib
+import random
+import sqlite3
+import struct
+from typing import Dict, Iterator, List, Tuple
+
+CHROME_EPOCH_OFFSET = 11644473600
+SAFARI_EPOCH_OFFSET = 978307200
+
+DOMAINS = [
+    "github.com",
+    "www.google.com",
+    "stackoverflow.com",
+    "docs.python.org",
+    "en.wikipedia.org",
+    "news.ycombinator.com",
+    "www.youtube.com",
+    "www.example.com",
+    "www.reddit.com",
+    "arxiv.org",
+]
+WORDS = [
+    "python",
+    "sqlite",
+    "browser",
+    "history",
+    "export",
+    "stream",
+    "memory",
+    "index",
+    "profile",
+    "session",
+    "bookmark",
+    "reading",
+    "benchmark",
+    "parser",
+    "cache",
+]
+
+START_TIME = 1577836800  # 2020-01-01
+
+
+class Generator:
+    def __init__(self, size: int, seed: int = 0) -> None:
+        self.size = size
+        self.random = random.Random(seed)
+
+        # Most visits are revisits of a smaller set of urls.
+        self.num_urls = max(1, size // 4)
+
+    def url(self, i: int) -> str:
+        domain = DOMAINS[i % len(DOMAINS)]
+        words = "/".join(self.random.choices(WORDS, k=3))
+
+        # Some urls only differ by tracking parameters or fragments.
+        suffix = ["", "?utm_source=feed", "#comments", "?page=2"][i % 4]
+
+        return f"https://{domain}/{words}/{i}{suffix}"
+
+    def title(self) -> str:
+        return " ".join(self.random.choices(WORDS, k=5)).capitalize()
+
+    def urls(self) -> Iterator[Tuple[int, str, str]]:
+        for i in range(self.num_urls):
+            yield i + 1, self.url(i), self.title()
+
+    def visits(self) -> Iterator[Tuple[int, int, float]]:
+        # (visit id, url id, unix time) in increasing time.
+        step = 3600 * 24 * 365 / self.size
+        for i in range(self.size):
+            url_id = self.random.randrange(self.num_urls) + 1
+            yield i + 1, url_id, START_TIME + i * step + self.random.random()
+
+    def tree(self, num_leaves: int, depth: int = 4, fanout: int = 8) -> Dict:
+        # A bookmark tree as nested {"name", "children"} / {"name", "url"}.
+        root = {"name": "root", "children": []}
+        folders = [(root, 0)]
+        for i in range(num_leaves):
+            if i % fanout == 0:
+                parent, level = self.random.choice(folders)
+                if level < depth:
+                    folder = {"name": f"Folder {i}", "children": []}
+                    parent["children"] += [folder]
+                    folders += [(folder, level + 1)]
+
+            parent, _ = self.random.choice(folders)
+            parent["children"] += [{"name": self.title(), "url": self.url(i)}]
+
+        return root
+
+
+def _executemany(conn, sql, rows, batch_size=100000):
+    batch = []
+    for row in rows:
+        batch += [row]
+        if len(batch) >= batch_size:
+            conn.executemany(sql, batch)
+            batch = []
+
+    if batch:
+        conn.executemany(sql, batch)
+
+
+def generate_chrome(path: str, generator: Generator) -> str:
+    library = os.path.join(path, "chrome", "Default")
+    os.makedirs(library, exist_ok=True)
+
+    history_file = os.path.join(library, "History")
+    if os.path.exists(history_file):
+        os.remove(history_file)
+
+    last_visits = {}
+    with sqlite3.connect(history_file) as conn:
+        conn.executescript("""
+            CREATE TABLE urls (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url LONGVARCHAR,
+                title LONGVARCHAR,
+                visit_count INTEGER DEFAULT 0 NOT NULL,
+                typed_count INTEGER DEFAULT 0 NOT NULL,
+                last_visit_time INTEGER NOT NULL,
+                hidden INTEGER DEFAULT 0 NOT NULL
+            );
+            CREATE INDEX urls_url_index ON urls (url);
+            CREATE TABLE visits (
+                id INTEGER PRIMARY KEY,
+                url INTEGER NOT NULL,
+                visit_time INTEGER NOT NULL,
+                from_visit INTEGER,
+                transition INTEGER DEFAULT 0 NOT NULL
+            );
+            CREATE INDEX visits_time_index ON visits (visit_time);
+            """)
+
+        def _visits():
+            for id_, url_id, time in generator.visits():
+                time = int((time + CHROME_EPOCH_OFFSET) * 1000000)
+                last_visits[url_id] = time
+                yield id_, url_id, time, 0, 0
+
+        _executemany(conn, "INSERT INTO visits VALUES (?, ?, ?, ?, ?)", _visits())
+        _executemany(
+            conn,
+            "INSERT INTO urls VALUES (?, ?, ?, 1, 0, ?, 0)",
+            (
+                (id_, url, title, last_visits.get(id_, 0))
+                for id_, url, title in generator.urls()
+            ),
+        )
+
+    def _node(node, i=[0]):  # pylint: disable=dangerous-default-value
+        i[0] += 1
+        if "url" in node:
+            return {"id": str(i[0]), "name": node["name"], "type": "url", **node}
+
+        return {
+            "id": str(i[0]),
+            "name": node["name"],
+            "type": "folder",
+            "children": [_node(x) for x in node["children"]],
+        }
+
+    tree = generator.tree(max(1, generator.size // 10))
+    roots = {
+        "bookmark_bar": {**_node(tree), "name": "Bookmarks bar"},
+        "other": _node({"name": "Other bookmarks", "children": []}),
+        "synced": _node({"name": "Mobile bookmarks", "children": []}),
+    }
+    with open(os.path.join(library, "Bookmarks"), mode="w", encoding="utf-8") as f:
+        json.dump({"roots": roots, "version": 1}, f)
+
+    os.makedirs(os.path.join(library, "Sessions"), exist_ok=True)
+    write_snss(
+        os.path.join(library, "Sessions", "Session_13300000000000000"),
+        _snss_commands(generator, max(1, generator.size // 100)),
+    )
+
+    return library
+
+
+def _pickle(*fields) -> bytes:
+    # `base::Pickle`: a uint32 payload size, then 4 bytes aligned fields of
+    # int32, string (bytes) or string16 (str).
+    payload = b""
+    for field in fields:
+        if isinstance(field, int):
+            payload += struct.pack("<i", field)
+        else:
+            data = field if isinstance(field, bytes) else field.encode("utf-16-le")
+            length = len(field)
+            payload += struct.pack("<i", length) + data + b"\0" * (-len(data) % 4)
+
+    return struct.pack("<I", len(payload)) + payload
+
+
+def _snss_commands(
+    generator: Generator, num_tabs: int, history: int = 10
+) -> Iterator[Tuple[int, bytes]]:
+    # Commands of a Chrome session: tabs are opened with some history,
+    # navigated back, pruned and a few of them (and a window) closed again.
+    def _tab(window_id, tab_id, index):
+        yield 0, struct.pack("<ii", window_id, tab_id)
+        yield 2, struct.pack("<ii", tab_id, index)
+
+        num_entries = generator.random.randint(1, history)
+        for i in range(num_entries):
+            url = generator.url(generator.random.randrange(generator.num_urls))
+            size = generator.random.randint(64, 2048)
+            page_state = generator.random.getrandbits(8 * size).to_bytes(size, "little")
+            yield 6, _pickle(
+                tab_id, i, url.encode("utf-8"), generator.title(), page_state, 0
+            )
+            yield 7, struct.pack("<ii", tab_id, i)
+
+        if num_entries > 2:
+            yield 7, struct.pack("<ii", tab_id, num_entries - 2)
+            yield 24, struct.pack("<iii", tab_id, 0, 1)
+            yield 7, struct.pack("<ii", tab_id, num_entries - 3)
+
+    tab_id = 100
+    for window_id, start in enumerate(range(0, num_tabs, 20), start=1):
+        for index in range(min(20, num_tabs - start)):
+            tab_id += 1
+            yield from _tab(window_id, tab_id, index)
+
+        tab_id += 1
+        yield from _tab(window_id, tab_id, 20)
+        yield 16, struct.pack("<iiq", tab_id, 0, 0)
+        yield 8, struct.pack("<ii", window_id, 0)
+
+    tab_id += 1
+    yield from _tab(0, tab_id, 0)
+    yield 17, struct.pack("<iiq", 0, 0, 0)
+
+
+def write_snss(filename: str, commands: Iterator[Tuple[int, bytes]]) -> None:
+    with open(filename, mode="wb") as f:
+        f.write(b"SNSS" + struct.pack("<i", 3))
+        for command, payload in commands:
+            f.write(struct.pack("<HB", len(payload) + 1, command) + payload)
+
+
+def _session(generator: Generator, num_tabs: int, history: int = 10) -> Dict:
+    def _tab():
+        entries = [
+            {
+                "url": generator.url(generator.random.randrange(generator.num_urls)),
+                "title": generator.title(),
+                "formdata": {"id": {"q": generator.title()}},
+                "scroll": "0,120",
+            }
+            for _ in range(generator.random.randint(1, history))
+        ]
+
+        return {"entries": entries, "index": len(entries), "lastAccessed": 0}
+
+    windows = []
+    for i in range(0, num_tabs, 20):
+        windows += [
+            {
+                "tabs": [_tab() for _ in range(min(20, num_tabs - i))],
+                "_closedTabs": [
+                    {"state": _tab(), "title": generator.title(), "closedAt": 0}
+                    for _ in range(2)
+                ],
+            }
+        ]
+
+    return {
+        "version": ["sessionrestore", 1],
+        "windows": windows,
+        "_closedWindows": [{"tabs": [_tab() for _ in range(3)]}],
+    }
+
+
+def write_jsonlz4(filename: str, data: Dict) -> None:
+    # pylint: disable=import-outside-toplevel
+    import lz4.block
+
+    with open(filename, mode="wb") as f:
+        f.write(b"mozLz40\0")
+        f.write(lz4.block.compress(json.dumps(data).encode("utf-8")))
+
+
+def generate_firefox(path: str, generator: Generator) -> str:
+    library = os.path.join(path, "firefox", "abcd1234.default-release")
+    os.makedirs(os.path.join(library, "sessionstore-backups"), exist_ok=True)
+
+    places_file = os.path.join(library, "places.sqlite")
+    if os.path.exists(places_file):
+        os.remove(places_file)
+
+    with sqlite3.connect(places_file) as conn:
+        conn.executescript("""
+            CREATE TABLE moz_places (
+                id INTEGER PRIMARY KEY,
+                url LONGVARCHAR,
+                title LONGVARCHAR,
+                rev_host LONGVARCHAR,
+                visit_count INTEGER DEFAULT 0,
+                last_visit_date INTEGER
+            );
+            CREATE TABLE moz_historyvisits (
+                id INTEGER PRIMARY KEY,
+                from_visit INTEGER,
+                place_id INTEGER,
+                visit_date INTEGER,
+                visit_type INTEGER,
+                session INTEGER
+            );
+            CREATE INDEX moz_historyvisits_dateindex ON moz_historyvisits (visit_date);
+            CREATE TABLE moz_bookmarks (
+                id INTEGER PRIMARY KEY,
+                type INTEGER,
+                fk INTEGER DEFAULT NULL,
+                parent INTEGER,
+                position INTEGER,
+                title LONGVARCHAR,
+                dateAdded INTEGER,
+                lastModified INTEGER
+            );
+            """)
+
+        _executemany(
+            conn,
+            "INSERT INTO moz_places (id, url, title) VALUES (?, ?, ?)",
+            generator.urls(),
+        )
+        _executemany(
+            conn,
+            "INSERT INTO moz_historyvisits VALUES (?, 0, ?, ?, 1, 0)",
+            (
+                (id_, url_id, int(time * 1000000))
+                for id_, url_id, time in generator.visits()
+            ),
+        )
+
+        # Root (1) and the built-in menu (2), toolbar (3) and unfiled (5)
+        # folders, as in a fresh profile.
+        rows = [
+            (1, 2, None, 0, 0, "", 0, 0),
+            (2, 2, None, 1, 0, "menu", 0, 0),
+            (3, 2, None, 1, 1, "toolbar", 0, 0),
+            (5, 2, None, 1, 3, "unfiled", 0, 0),
+        ]
+        next_id = [10]
+
+        def _add(node, parent):
+            next_id[0] += 1
+            id_ = next_id[0]
+            if "url" in node:
+                fk = generator.random.randrange(generator.num_urls) + 1
+                rows.append((id_, 1, fk, parent, 0, node["name"], id_, id_))
+            else:
+                rows.append((id_, 2, None, parent, 0, node["name"], id_, id_))
+                for child in node["children"]:
+                    _add(child, id_)
+
+        for child in generator.tree(max(1, generator.size // 10))["children"]:
+            _add(child, 2)
+
+        _executemany(
+            conn,
+            "INSERT INTO moz_bookmarks VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+
+    write_jsonlz4(
+        os.path.join(library, "sessionstore-backups", "recovery.jsonlz4"),
+        _session(generator, max(1, generator.size // 100)),
+    )
+
+    return library
+
+
+def generate_safari(path: str, generator: Generator) -> str:
+    library = os.path.join(path, "safari")
+    os.makedirs(library, exist_ok=True)
+
+    for name in ["History.db", "CloudTabs.db"]:
+        if os.path.exists(os.path.join(library, name)):
+            os.remove(os.path.join(library, name))
+
+    with sqlite3.connect(os.path.join(library, "History.db")) as conn:
+        conn.executescript("""
+            CREATE TABLE history_items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL UNIQUE,
+                domain_expansion TEXT NULL,
+                visit_count INTEGER NOT NULL
+            );
+            CREATE TABLE history_visits (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                history_item INTEGER NOT NULL,
+                visit_time REAL NOT NULL,
+                title TEXT NULL
+            );
+            CREATE INDEX history_visits__last_visit ON history_visits (visit_time);
+            """)
+
+        titles = {}
+
+        def _items():
+            for id_, url, title in generator.urls():
+                titles[id_] = title
+                yield id_, url, 1
+
+        _executemany(conn, "INSERT INTO history_items VALUES (?, ?, NULL, ?)", _items())
+        _executemany(
+            conn,
+            "INSERT INTO history_visits VALUES (?, ?, ?, ?)",
+            (
+                (id_, url_id, time - SAFARI_EPOCH_OFFSET, titles[url_id])
+                for id_, url_id, time in generator.visits()
+            ),
+        )
+
+    with sqlite3.connect(os.path.join(library, "CloudTabs.db")) as conn:
+        conn.executescript("""
+            CREATE TABLE cloud_tab_devices (
+                device_uuid TEXT PRIMARY KEY,
+                device_name TEXT
+            );
+            CREATE TABLE cloud_tabs (
+                tab_uuid TEXT PRIMARY KEY,
+                device_uuid TEXT,
+                title TEXT,
+                url TEXT
+            );
+            """)
+
+        num_devices = 5
+        conn.executemany(
+            "INSERT INTO cloud_tab_devices VALUES (?, ?)",
+            [(f"device-{i}", f"Device {i}") for i in range(num_devices)],
+        )
+        _executemany(
+            conn,
+            "INSERT INTO cloud_tabs VALUES (?, ?, ?, ?)",
+            (
+                (
+                    f"tab-{i}",
+                    f"device-{i % num_devices}",
+                    generator.title(),
+                    generator.url(generator.random.randrange(generator.num_urls)),
+                )
+                for i in range(max(1, generator.size // 100))
+            ),
+        )
+
+    def _node(node):
+        if "url" in node:
+            return {
+                "WebBookmarkType": "WebBookmarkTypeLeaf",
+                "URIDictionary": {"title": node["name"]},
+                "URLString": node["url"],
+            }
+
+        return {
+            "WebBookmarkType": "WebBookmarkTypeList",
+            "Title": node["name"],
+            "Children": [_node(x) for x in node["children"]],
+        }
+
+    readings = [
+        _node({"name": generator.title(), "url": generator.url(i)})
+        for i in range(max(1, generator.size // 100))
+    ]
+    plist = {
+        "WebBookmarkType": "WebBookmarkTypeList",
+        "Title": "",
+        "Children": [
+            {"WebBookmarkType": "WebBookmarkTypeProxy", "Title": "History"},
+            {
+                **_node(generator.tree(max(1, generator.size // 10))),
+                "Title": "BookmarksBar",
+            },
+            {
+                "WebBookmarkType": "WebBookmarkTypeList",
+                "Title": "BookmarksMenu",
+                "Children": [],
+            },
+            {
+                "WebBookmarkType": "WebBookmarkTypeList",
+                "Title": "com.apple.ReadingList",
+                "Children": readings,
+            },
+        ],
+    }
+    with open(os.path.join(library, "Bookmarks.plist"), mode="wb") as f:
+        plistlib.dump(plist, f, fmt=plistlib.FMT_BINARY)
+
+    return library
+
+
+def generate(path: str, size: int, seed: int = 0) -> Dict[str, str]:
+    return {
+        "chrome": generate_chrome(path, Generator(size, seed=seed)),
+        "firefox": generate_firefox(path, Generator(size, seed=seed)),
+        "safari": generate_safari(path, Generator(size, seed=seed)),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("output", type=str, help="Output directory.")
+    parser.add_argument(
+        "--size",
+        type=int,
+        default=10000,
+        help="Number of history visits (default: 10000).",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    libraries: List[Tuple[str, str]] = list(
+        generate(args.output, args.size, seed=args.seed).items()
+    )
+    for browser, library in libraries:
+        print(f"{browser}\t{library}")
+
+
+if __name__ == "__main__":
+    main()
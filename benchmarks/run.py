@@ -0,0 +1,313 @@
+#! /usr/bin/env python
+
+# Measures throughput and peak memory of the extractors, the export, the
+# formatters and every exporter against synthetic libraries.
+#
+# Usage: python benchmarks/run.py [--size N] [--only PATTERN] [--json FILE]
+#
+# Every benchmark runs in its own process, whose peak resident memory (which
+# includes SQLite, pyarrow and other C allocations) is reported against the
+# memory it used before the run. Python allocations are traced in a second run
+# since tracing slows everything down.
+
+import argparse
+import fnmatch
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# pylint: disable=wrong-import-position
+import fixtures
+
+from resworb.archive import ArchiveExporter
+from resworb.base import Record, replace_item
+from resworb.browsers.chrome import Chrome
+from resworb.browsers.firefox import Firefox
+from resworb.browsers.safari import Safari
+from resworb.commands import cli
+from resworb.formatter import Formatter
+from resworb.metrics import peak_memory
+
+SOURCES = {
+    "chrome": ["opened_tabs", "bookmarks", "histories"],
+    "firefox": ["opened_tabs", "bookmarks", "histories"],
+    "safari": ["cloud_tabs", "readings", "bookmarks", "histories"],
+}
+
+
+class TitleFormatter(Formatter):
+    # Formats without network access so that only the runner is measured.
+    def match(self, item):
+        return "example.com" in item["url"]
+
+    def format(self, item):
+        return replace_item(item, title=item["title"].upper())
+
+
+def _count(records) -> int:
+    if isinstance(records, dict):
+        return sum(_count(x) for x in records.values())
+
+    count = 0
+    for x in records:
+        # Cloud tab devices (records or dicts tagged with a profile) count
+        # their tabs.
+        count += len(x["tabs"]) if isinstance(x, (dict, Record)) and "tabs" in x else 1
+
+    return count
+
+
+def _consume(records: Iterator[Tuple[str, Iterator]]) -> int:
+    return sum(_count(value) for _, value in records)
+
+
+class Benchmark(NamedTuple):
+    name: str
+    func: Callable[[], int]
+
+    # Run before the measurements, e.g. to read the input of an exporter.
+    setup: Optional[Callable[[], Any]] = None
+
+
+def measure(benchmark: Benchmark, memory: bool = True) -> Dict[str, Any]:
+    # Meant to run in a fresh process, see `run`.
+    if benchmark.setup is not None:
+        benchmark.setup()
+    baseline = peak_memory()
+
+    start = time.perf_counter()
+    rows = benchmark.func()
+    elapsed = time.perf_counter() - start
+
+    peak = peak_memory()
+    result = {
+        "rows": rows,
+        "seconds": elapsed,
+        "rows_per_second": rows / elapsed if elapsed > 0 else float("inf"),
+        "peak_rss_bytes": peak,
+        "baseline_rss_bytes": baseline,
+    }
+
+    if memory:
+        tracemalloc.start()
+        try:
+            benchmark.func()
+            result["traced_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return result
+
+
+def run(
+    name: str,
+    libraries: Dict[str, str],
+    output: str,
+    memory: bool = True,
+) -> Dict[str, Any]:
+    # Runs one benchmark in a subprocess, so that its peak memory is not that
+    # of the benchmarks before it.
+    command = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "--worker",
+        name,
+        "--libraries",
+        json.dumps(libraries),
+        "--output",
+        output,
+    ]
+    if not memory:
+        command += ["--no-memory"]
+
+    process = subprocess.run(command, stdout=subprocess.PIPE, check=True)
+
+    return json.loads(process.stdout.decode("utf-8").splitlines()[-1])
+
+
+def get_benchmarks(libraries: Dict[str, str], output: str) -> List[Benchmark]:
+    browsers = {
+        "chrome": Chrome,
+        "firefox": Firefox,
+        "safari": Safari,
+    }
+
+    benchmarks = []
+    for name, sources in SOURCES.items():
+        browser_class, library = browsers[name], libraries[name]
+
+        for source in sources:
+            benchmarks += [
+                Benchmark(
+                    f"{name}.get_{source}",
+                    lambda c=browser_class, l=library, s=source: _count(
+                        getattr(c(library=l), f"get_{s}")()
+                    ),
+                )
+            ]
+
+        benchmarks += [
+            Benchmark(
+                f"{name}.export",
+                lambda c=browser_class, l=library, s=sources: _count(
+                    c(library=l).export(s)
+                ),
+            )
+        ]
+
+    def _format_records():
+        records = Safari(library=libraries["safari"]).iter_export(
+            ["cloud_tabs", "histories"]
+        )
+
+        return _consume(cli.format_records(records, [TitleFormatter()]))
+
+    benchmarks += [Benchmark("format_records", _format_records)]
+
+    # Every exporter writes the same records, read before the measurements.
+    records = {}
+
+    def _read_records():
+        if not records:
+            records.update(
+                Safari(library=libraries["safari"]).export(SOURCES["safari"])
+            )
+
+    def _export(extension):
+        filename = os.path.join(output, f"export{extension}")
+        exporter = cli.get_exporter(filename)
+        if isinstance(exporter, ArchiveExporter):
+            exporter.browser, exporter.profile = "safari", "default"
+        exporter.export_stream(iter(records.items()), filename)
+
+        return _count(records)
+
+    # Extensions sharing an exporter are only measured once.
+    exporters = {}
+    for extension, path in cli.EXPORT_FACTORY.items():
+        exporters.setdefault(path, extension)
+
+    for path, extension in exporters.items():
+        benchmarks += [
+            Benchmark(
+                f"{path.rpartition(':')[2]}({extension})",
+                lambda e=extension: _export(e),
+                setup=_read_records,
+            )
+        ]
+
+    return benchmarks
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--size",
+        type=int,
+        nargs="+",
+        default=[1000, 100000],
+        help="Number of history visits of the fixtures (default: 1000 100000).",
+    )
+    parser.add_argument(
+        "--only",
+        type=str,
+        default="*",
+        help="Only run benchmarks matching this glob pattern.",
+    )
+    parser.add_argument(
+        "--fixtures",
+        type=str,
+        default=None,
+        help="Directory of the fixtures (default: a temporary directory).",
+    )
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="Do not trace Python allocations (peak RSS is always measured).",
+    )
+    parser.add_argument(
+        "--json",
+        type=str,
+        default=None,
+        help="Also write the results to this file.",
+    )
+
+    # Arguments of a benchmark process.
+    parser.add_argument("--worker", type=str, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--libraries", type=json.loads, help=argparse.SUPPRESS)
+    parser.add_argument("--output", type=str, help=argparse.SUPPRESS)
+
+    return parser.parse_args()
+
+
+def worker(args):
+    benchmarks = {x.name: x for x in get_benchmarks(args.libraries, args.output)}
+    try:
+        result = measure(benchmarks[args.worker], memory=not args.no_memory)
+    except ImportError as e:
+        result = {"skipped": e.name}
+
+    print(json.dumps(result))
+
+
+def main():
+    args = parse_args()
+    if args.worker is not None:
+        worker(args)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tempdir:
+        for size in args.size:
+            path = os.path.join(args.fixtures or tempdir, str(size))
+            libraries = fixtures.generate(path, size)
+
+            output = os.path.join(tempdir, "output")
+            os.makedirs(output, exist_ok=True)
+
+            print(f"size: {size}")
+            print(
+                f"{'benchmark':<32}{'rows':>10}{'seconds':>10}{'rows/s':>12}"
+                f"{'peak MiB':>10}{'run MiB':>10}{'traced MiB':>12}"
+            )
+            for benchmark in get_benchmarks(libraries, output):
+                if not fnmatch.fnmatch(benchmark.name, args.only):
+                    continue
+
+                name = benchmark.name
+                result = run(name, libraries, output, memory=not args.no_memory)
+                if "skipped" in result:
+                    print(f"{name:<32}skipped ({result['skipped']} is not installed)")
+                    continue
+
+                results += [{"name": name, "size": size, **result}]
+
+                # Peak RSS, what the run added to it, and traced allocations.
+                peak, baseline = result["peak_rss_bytes"], result["baseline_rss_bytes"]
+                memory = [
+                    peak,
+                    peak - baseline if peak is not None else None,
+                    result.get("traced_peak_bytes"),
+                ]
+                peak, delta, traced = [
+                    f"{x / 2 ** 20:.1f}" if x is not None else "-" for x in memory
+                ]
+                print(
+                    f"{name:<32}{result['rows']:>10}{result['seconds']:>10.3f}"
+                    f"{result['rows_per_second']:>12.0f}{peak:>10}{delta:>10}{traced:>12}"
+                )
+
+    if args.json:
+        with open(args.json, mode="w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
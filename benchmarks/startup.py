@@ -0,0 +1,93 @@
+#! /usr/bin/env python
+
+# Guards the startup time of the CLI: preparing a JSON export of histories
+# must not import optional or heavy dependencies.
+#
+# Usage: python benchmarks/startup.py [--runs N] [--max-ms MS]
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = [
+    "yaml",
+    "pytoml",
+    "lxml",
+    "requests",
+    "lz4",
+    "pyarrow",
+    "msgpack",
+    "zstandard",
+]
+
+SCRIPT = """
+import sys
+
+from resworb.commands import cli
+
+sys.argv = ["resworb", "export", "-b", "safari", "-s", "histories", "-t", "out.json"]
+args = cli.parse_args()
+cli.get_browser_class(args.browser)(library=".")
+cli.get_exporter(args.target)
+
+print(",".join(sorted(x for x in {modules!r} if x in sys.modules)))
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=10,
+        help="Number of interpreter launches (default: 10).",
+    )
+    parser.add_argument(
+        "--max-ms",
+        type=float,
+        default=None,
+        help="Fail if the median startup time exceeds this many milliseconds.",
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    script = SCRIPT.format(modules=HEAVY_MODULES)
+
+    # The bare interpreter startup is subtracted to get the cost of resworb.
+    def _run(code):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        return (time.perf_counter() - start) * 1000, output.strip()
+
+    baseline = statistics.median(_run("pass")[0] for _ in range(args.runs))
+    results = [_run(script) for _ in range(args.runs)]
+    elapsed = statistics.median(x[0] for x in results) - baseline
+    imported = results[-1][1]
+
+    print(f"startup: {elapsed:.1f} ms (interpreter: {baseline:.1f} ms)")
+
+    failed = False
+    if imported:
+        print(f"heavy modules imported: {imported}")
+        failed = True
+
+    if args.max_ms is not None and elapsed > args.max_ms:
+        print(f"startup exceeds {args.max_ms:.1f} ms")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
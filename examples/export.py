@@ -10,3 +10,8 @@ print(safari.export(kinds="bookmarks"))
 print(safari.export(kinds="histories"))
 print(safari.export(kinds="all"))
 print(safari.export(kinds=["bookmarks", "histories"]))
+
+# Records are generated lazily without materializing full lists.
+for kind, records in safari.iter_export(kinds="histories"):
+    for record in records:
+        print(kind, record)
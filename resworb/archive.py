@@ -0,0 +1,269 @@
+import itertools
+import json
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from resworb.connection import url_domain
+from resworb.exporter import StreamingExporter, _parse_timestamp
+
+# Every url is stored once, visits, bookmarks and tabs refer to it and to the
+# browser profile they were exported from. Visit times are UTC epoch
+# microseconds, `first_seen` and `last_seen` the unix times of the exports.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    id INTEGER PRIMARY KEY,
+    browser TEXT NOT NULL,
+    name TEXT NOT NULL,
+    UNIQUE (browser, name)
+);
+
+CREATE TABLE IF NOT EXISTS urls (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE,
+    title TEXT,
+    domain TEXT
+);
+CREATE INDEX IF NOT EXISTS urls_domain_index ON urls (domain);
+
+CREATE TABLE IF NOT EXISTS visits (
+    id INTEGER PRIMARY KEY,
+    profile_id INTEGER NOT NULL REFERENCES profiles (id),
+    url_id INTEGER NOT NULL REFERENCES urls (id),
+    visit_time INTEGER NOT NULL,
+    UNIQUE (profile_id, url_id, visit_time)
+);
+CREATE INDEX IF NOT EXISTS visits_time_index ON visits (visit_time);
+CREATE INDEX IF NOT EXISTS visits_url_index ON visits (url_id);
+
+CREATE TABLE IF NOT EXISTS folders (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS bookmarks (
+    id INTEGER PRIMARY KEY,
+    profile_id INTEGER NOT NULL REFERENCES profiles (id),
+    url_id INTEGER NOT NULL REFERENCES urls (id),
+    folder_id INTEGER NOT NULL REFERENCES folders (id),
+    title TEXT,
+    first_seen INTEGER NOT NULL,
+    last_seen INTEGER NOT NULL,
+    UNIQUE (profile_id, url_id, folder_id)
+);
+CREATE INDEX IF NOT EXISTS bookmarks_url_index ON bookmarks (url_id);
+
+CREATE TABLE IF NOT EXISTS devices (
+    id INTEGER PRIMARY KEY,
+    profile_id INTEGER NOT NULL REFERENCES profiles (id),
+    uuid TEXT NOT NULL,
+    name TEXT,
+    UNIQUE (profile_id, uuid)
+);
+
+CREATE TABLE IF NOT EXISTS tabs (
+    id INTEGER PRIMARY KEY,
+    profile_id INTEGER NOT NULL REFERENCES profiles (id),
+    source TEXT NOT NULL,
+    device_id INTEGER NOT NULL DEFAULT 0,
+    url_id INTEGER NOT NULL REFERENCES urls (id),
+    title TEXT,
+    first_seen INTEGER NOT NULL,
+    last_seen INTEGER NOT NULL,
+    UNIQUE (profile_id, source, device_id, url_id)
+);
+CREATE INDEX IF NOT EXISTS tabs_url_index ON tabs (url_id);
+"""
+
+TAB_SOURCES = {"opened_tabs", "readings", "cloud_tabs"}
+
+
+class ArchiveExporter(StreamingExporter):
+    # Exports are upserted into a SQLite archive: urls, visits, bookmarks and
+    # tabs seen before are not added again, so one archive can receive every
+    # export. Each batch of records is one transaction.
+    batch_size = 10000
+    text_timestamps = False
+
+    def __init__(self, compression: Optional[str] = None) -> None:
+        if compression is not None:
+            msg = "Archives can't be compressed."
+            raise ValueError(msg)
+
+        super().__init__(compression=compression)
+
+        # Provenance of records without a `profile` of their own.
+        self.browser: Optional[str] = None
+        self.profile: Optional[str] = None
+
+        self._profile_ids: Dict[str, int] = {}
+
+    def _get_profile_id(self, conn: sqlite3.Connection, name: Optional[str]) -> int:
+        if name is None:
+            msg = "The profile of the records must be set before archiving."
+            raise ValueError(msg)
+
+        profile_id = self._profile_ids.get(name)
+        if profile_id is None:
+            conn.execute(
+                "INSERT INTO profiles (browser, name) VALUES (?, ?)"
+                " ON CONFLICT (browser, name) DO NOTHING",
+                (self.browser, name),
+            )
+            profile_id = conn.execute(
+                "SELECT id FROM profiles WHERE browser = ? AND name = ?",
+                (self.browser, name),
+            ).fetchone()[0]
+            self._profile_ids[name] = profile_id
+
+        return profile_id
+
+    def _insert_urls(self, conn, rows):
+        # Titles are only written when they changed.
+        conn.executemany(
+            """
+            INSERT INTO urls (url, title, domain) VALUES (?, ?, ?)
+            ON CONFLICT (url) DO UPDATE SET title = excluded.title
+            WHERE excluded.title IS NOT NULL AND excluded.title IS NOT urls.title
+            """,
+            ((url, title, url_domain(url)) for url, title in rows),
+        )
+
+    def _insert_histories(self, conn, rows):
+        self._insert_urls(conn, ((x["url"], x["title"]) for x in rows))
+        conn.executemany(
+            """
+            INSERT INTO visits (profile_id, url_id, visit_time)
+            SELECT ?, id, ? FROM urls WHERE url = ?
+            ON CONFLICT (profile_id, url_id, visit_time) DO NOTHING
+            """,
+            (
+                (x["profile_id"], _parse_timestamp(x["visit_time"]), x["url"])
+                for x in rows
+                if x["visit_time"] is not None
+            ),
+        )
+
+    def _insert_bookmarks(self, conn, rows, seen):
+        paths = {}
+        for row in rows:
+            folders = tuple(row.get("folders") or ())
+            path = paths.get(folders)
+            if path is None:
+                path = paths[folders] = json.dumps(folders, ensure_ascii=False)
+            row["path"] = path
+
+        self._insert_urls(conn, ((x["url"], x["title"]) for x in rows))
+        conn.executemany(
+            "INSERT INTO folders (path) VALUES (?) ON CONFLICT (path) DO NOTHING",
+            ((x,) for x in paths.values()),
+        )
+        conn.executemany(
+            """
+            INSERT INTO bookmarks (profile_id, url_id, folder_id, title, first_seen, last_seen)
+            SELECT ?, urls.id, folders.id, ?, ?, ?
+            FROM urls, folders WHERE urls.url = ? AND folders.path = ?
+            ON CONFLICT (profile_id, url_id, folder_id)
+            DO UPDATE SET title = excluded.title, last_seen = excluded.last_seen
+            """,
+            (
+                (x["profile_id"], x["title"], seen, seen, x["url"], x["path"])
+                for x in rows
+            ),
+        )
+
+    def _insert_tabs(self, conn, source, rows, seen):
+        # Cloud tabs are expanded with their device, other tabs have none (0).
+        tabs = []
+        if source == "cloud_tabs":
+            conn.executemany(
+                """
+                INSERT INTO devices (profile_id, uuid, name) VALUES (?, ?, ?)
+                ON CONFLICT (profile_id, uuid) DO UPDATE SET name = excluded.name
+                WHERE excluded.name IS NOT devices.name
+                """,
+                ((x["profile_id"], x["id"], x["name"]) for x in rows),
+            )
+            for row in rows:
+                device_id = conn.execute(
+                    "SELECT id FROM devices WHERE profile_id = ? AND uuid = ?",
+                    (row["profile_id"], row["id"]),
+                ).fetchone()[0]
+                tabs += [
+                    (row["profile_id"], device_id, x["url"], x["title"])
+                    for x in row["tabs"]
+                ]
+        else:
+            tabs = [(x["profile_id"], 0, x["url"], x["title"]) for x in rows]
+
+        self._insert_urls(conn, ((url, title) for _, _, url, title in tabs))
+        conn.executemany(
+            """
+            INSERT INTO tabs (profile_id, source, device_id, url_id, title, first_seen, last_seen)
+            SELECT ?, ?, ?, id, ?, ?, ? FROM urls WHERE url = ?
+            ON CONFLICT (profile_id, source, device_id, url_id)
+            DO UPDATE SET title = excluded.title, last_seen = excluded.last_seen
+            """,
+            (
+                (profile_id, source, device_id, title, seen, seen, url)
+                for profile_id, device_id, url, title in tabs
+            ),
+        )
+
+    def _insert(
+        self,
+        conn: sqlite3.Connection,
+        source: str,
+        items: List[Any],
+        seen: int,
+    ) -> None:
+        rows = []
+        for item in items:
+            row = dict(item.items())
+            row["profile_id"] = self._get_profile_id(
+                conn, row.get("profile") or self.profile
+            )
+            rows += [row]
+
+        if source == "histories":
+            self._insert_histories(conn, rows)
+        elif source == "bookmarks":
+            self._insert_bookmarks(conn, rows, seen)
+        elif source in TAB_SOURCES:
+            self._insert_tabs(conn, source, rows, seen)
+        else:
+            msg = f"Unsupported source: {source}"
+            raise ValueError(msg)
+
+    def export_stream(
+        self,
+        records: Iterable[Tuple[str, Iterable]],
+        filename: str,
+        file_kwargs: Optional[Mapping] = None,
+        dump_kwargs: Optional[Mapping] = None,
+    ) -> None:
+        if self.browser is None:
+            msg = "The browser of the records must be set before archiving."
+            raise ValueError(msg)
+
+        if not file_kwargs:
+            file_kwargs = {}
+
+        seen = int(time.time())
+        self._profile_ids = {}
+
+        conn = sqlite3.connect(filename, **file_kwargs)
+        try:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.executescript(SCHEMA)
+
+            for source, items in records:
+                items = iter(items)
+                batch = list(itertools.islice(items, self.batch_size))
+                while batch:
+                    with conn:
+                        self._insert(conn, source, batch, seen)
+                    batch = list(itertools.islice(items, self.batch_size))
+        finally:
+            conn.close()
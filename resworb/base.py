@@ -1,6 +1,211 @@
-from typing import Dict, Iterable
+import datetime
+import re
+import sys
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
-URLItem = Dict[str, str]
+from resworb.connection import ConnectionManager
+
+
+class Record:
+    # Compact records with a read-only mapping interface, so that they can be
+    # used wherever the former dicts were (`item["url"]`, `{**item}`).
+    __slots__ = ()
+    fields: Tuple[str, ...] = ()
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.fields:
+            raise KeyError(key)
+
+        return getattr(self, key)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.fields
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.fields)
+
+    def __len__(self) -> int:
+        return len(self.fields)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Record):
+            return type(self) is type(other) and self.values() == other.values()
+
+        if isinstance(other, Mapping):
+            return self.to_dict() == dict(other)
+
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        values = ", ".join(f"{k}={v!r}" for k, v in self.items())
+
+        return f"{type(self).__name__}({values})"
+
+    def __getstate__(self) -> Tuple:
+        return self.values()
+
+    def __setstate__(self, state: Tuple) -> None:
+        for field, value in zip(self.fields, state):
+            setattr(self, field, value)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key not in self.fields:
+            return default
+
+        return getattr(self, key)
+
+    def keys(self) -> Tuple[str, ...]:
+        return self.fields
+
+    def values(self) -> Tuple:
+        return tuple(getattr(self, x) for x in self.fields)
+
+    def items(self) -> List[Tuple[str, Any]]:
+        return [(x, getattr(self, x)) for x in self.fields]
+
+    def replace(self, **changes: Any) -> "Record":
+        return type(self)(**{**dict(self.items()), **changes})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return to_dict(self)
+
+
+class Tab(Record):
+    __slots__ = fields = ("title", "url")
+
+    def __init__(self, title: Optional[str] = None, url: Optional[str] = None) -> None:
+        self.title = title
+        self.url = url
+
+
+class HistoryItem(Record):
+    __slots__ = fields = ("id", "url", "title", "visit_time")
+
+    def __init__(
+        self,
+        id: Optional[int] = None,  # pylint: disable=redefined-builtin
+        url: Optional[str] = None,
+        title: Optional[str] = None,
+        visit_time: Optional[Union[int, str]] = None,
+    ) -> None:
+        self.id = id
+        self.url = url
+        self.title = title
+        self.visit_time = visit_time
+
+
+class Bookmark(Record):
+    __slots__ = fields = ("title", "url", "folders")
+
+    def __init__(
+        self,
+        title: Optional[str] = None,
+        url: Optional[str] = None,
+        folders: Sequence[str] = (),
+    ) -> None:
+        self.title = title
+        self.url = url
+        self.folders = folders
+
+
+class CloudTabDevice(Record):
+    __slots__ = fields = ("id", "name", "tabs")
+
+    def __init__(
+        self,
+        id: Optional[str] = None,  # pylint: disable=redefined-builtin
+        name: Optional[str] = None,
+        tabs: Sequence[Tab] = (),
+    ) -> None:
+        self.id = id
+        self.name = name
+        self.tabs = tabs
+
+
+URLItem = Union[Record, Dict[str, Any]]
+
+
+def replace_item(item: URLItem, **changes: Any) -> URLItem:
+    # Records only hold their own fields, other changes make a dict.
+    if isinstance(item, Record) and all(x in item.fields for x in changes):
+        return item.replace(**changes)
+
+    return {**item, **changes}
+
+
+def to_dict(item: URLItem) -> Dict[str, Any]:
+    # A plain dict of a record, or of a dict holding records (e.g. the tabs
+    # of a cloud tab device tagged with its profile).
+    def _convert(value):
+        if isinstance(value, (Record, dict)):
+            return to_dict(value)
+
+        if isinstance(value, list):
+            return [_convert(x) for x in value]
+
+        return value
+
+    return {k: _convert(v) for k, v in item.items()}
+
+
+def to_builtin(data: Any) -> Any:
+    # Records to dicts and tuples to lists, e.g. for serialization.
+    if isinstance(data, Record):
+        data = data.to_dict()
+
+    if isinstance(data, dict):
+        return {key: to_builtin(value) for key, value in data.items()}
+
+    if isinstance(data, (list, tuple)):
+        return [to_builtin(x) for x in data]
+
+    return data
+
+
+def walk_tree(
+    roots: Iterable[Any],
+    get_children: Callable[[Any], Optional[Sequence[Any]]],
+    get_name: Callable[[Any], str],
+) -> Iterator[Tuple[Any, Tuple[str, ...]]]:
+    # Yields every node of the trees in document order with the names of its
+    # ancestors. An explicit stack avoids the recursion limit on deep trees,
+    # and the path tuples are interned: every child of a folder (and every
+    # folder with the same path) shares one tuple.
+    paths: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+    stack = [(x, ()) for x in reversed(list(roots))]
+    while stack:
+        node, path = stack.pop()
+        yield node, path
+
+        children = get_children(node)
+        if children:
+            child_path = (*path, sys.intern(get_name(node)))
+            child_path = paths.setdefault(child_path, child_path)
+            stack.extend((x, child_path) for x in reversed(children))
+
+
+class DatabaseMixin:
+    connections: ConnectionManager
+
+
+class ProfileMixin:
+    @classmethod
+    def get_profiles(cls, library: Optional[str] = None) -> Dict[str, str]:
+        # Maps profile names to libraries the browser can be created with.
+        raise NotImplementedError
 
 
 class OpenedTabMixin:
@@ -8,7 +213,7 @@ class OpenedTabMixin:
         raise NotImplementedError
 
 
-class CloudTabMixin:
+class CloudTabMixin(DatabaseMixin):
     cloud_tab_file: str
 
     def get_cloud_tabs(self) -> Iterable[URLItem]:
@@ -20,15 +225,148 @@ class ReadingMixin:
         raise NotImplementedError
 
 
-class BookmarkMixin:
+class BookmarkMixin(DatabaseMixin):
     bookmark_file: str
 
     def get_bookmarks(self, flatten: bool = True) -> Iterable[URLItem]:
         raise NotImplementedError
 
 
-class HistoryMixin:
+class HistoryMixin(DatabaseMixin):
     history_file: str
 
-    def get_histories(self) -> Iterable[Dict]:
+    # Raw columns of the visit time and the url used in filters, and the
+    # conversion of unix timestamps to the unit of the time column.
+    history_time_column: str
+    history_url_column: str
+
+    # The time column as (UTC) microseconds since the unix epoch.
+    history_epoch_time: str
+
+    # Summaries count every visit: the joined visits and urls tables, their
+    # visit time column and an expression of it in unix seconds.
+    history_summary_from: str
+    history_summary_time_column: str
+    history_summary_unix_time: str
+
+    def _to_history_time(self, timestamp: float) -> float:
         raise NotImplementedError
+
+    def _get_history_conditions(
+        self,
+        after: Optional[float] = None,
+        upto: Optional[float] = None,
+        since: Optional[Union[float, datetime.datetime]] = None,
+        until: Optional[Union[float, datetime.datetime]] = None,
+        url_like: Optional[str] = None,
+        domain: Optional[str] = None,
+        time_column: Optional[str] = None,
+    ) -> Tuple[str, List[Any]]:
+        # `after` and `upto` are raw watermarks, `since` (inclusive) and
+        # `until` (exclusive) are datetimes or unix timestamps. Every filter
+        # compares the raw columns so that SQLite can use their indexes.
+        if time_column is None:
+            time_column = self.history_time_column
+        url_column = self.history_url_column
+
+        conditions, params = [], []
+        if after is not None:
+            conditions += [f"{time_column} > ?"]
+            params += [after]
+
+        if upto is not None:
+            conditions += [f"{time_column} <= ?"]
+            params += [upto]
+
+        for value, operator in [(since, ">="), (until, "<")]:
+            if value is not None:
+                if isinstance(value, datetime.datetime):
+                    value = value.timestamp()
+                conditions += [f"{time_column} {operator} ?"]
+                params += [self._to_history_time(value)]
+
+        if url_like is not None:
+            conditions += [f"{url_column} LIKE ?"]
+            params += [url_like]
+
+        if domain is not None:
+            # Subdomains match too, see `ConnectionManager` for `url_domain`.
+            domain = re.sub(r"([%_\\])", r"\\\1", domain.lower().strip("."))
+            conditions += [f"'.' || url_domain({url_column}) LIKE ? ESCAPE '\\'"]
+            params += [f"%.{domain}"]
+
+        if not conditions:
+            return "", params
+
+        return f"WHERE {' AND '.join(conditions)}", params
+
+    def get_history_watermark(self) -> Optional[float]:
+        raise NotImplementedError
+
+    def get_histories(
+        self,
+        after: Optional[float] = None,
+        upto: Optional[float] = None,
+        since: Optional[Union[float, datetime.datetime]] = None,
+        until: Optional[Union[float, datetime.datetime]] = None,
+        url_like: Optional[str] = None,
+        domain: Optional[str] = None,
+        limit: Optional[int] = None,
+        raw_time: bool = False,
+    ) -> Iterable[Dict]:
+        # Visit times are local time strings, or UTC epoch microseconds when
+        # `raw_time` is set (formatting is then left to the exporters).
+        raise NotImplementedError
+
+    def get_history_summary(
+        self,
+        group_by: str = "url",
+        top_n: Optional[int] = None,
+        since: Optional[Union[float, datetime.datetime]] = None,
+        until: Optional[Union[float, datetime.datetime]] = None,
+        url_like: Optional[str] = None,
+        domain: Optional[str] = None,
+    ) -> Iterable[Dict]:
+        # Visits are counted per url, domain or (local) day inside SQLite.
+        # Urls and domains are ranked by their number of visits, days are
+        # the most recent first.
+        unix_time = self.history_summary_unix_time
+        keys = {
+            "url": self.history_url_column,
+            "domain": f"url_domain({self.history_url_column})",
+            "day": f"date({unix_time}, 'unixepoch', 'localtime')",
+        }
+        if group_by not in keys:
+            msg = f"Unsupported group: {group_by}"
+            raise ValueError(msg)
+
+        where, params = self._get_history_conditions(
+            since=since,
+            until=until,
+            url_like=url_like,
+            domain=domain,
+            time_column=self.history_summary_time_column,
+        )
+        order = "key DESC" if group_by == "day" else "visits DESC, last_visit DESC"
+        if top_n is not None:
+            params += [top_n]
+
+        sql = f"""
+        SELECT {keys[group_by]} AS key, COUNT(*) AS visits, MAX({unix_time}) AS last_visit
+        FROM {self.history_summary_from}
+        {where}
+        GROUP BY key
+        ORDER BY {order}
+        {"LIMIT ?" if top_n is not None else ""}
+        """
+
+        for key, visits, last_visit in self.connections.query(
+            self.history_file, sql, params
+        ):
+            yield {
+                group_by: key,
+                "visits": visits,
+                "last_visit_time": datetime.datetime.fromtimestamp(last_visit).strftime(
+                    "%Y-%m-%d %H:%M:%S"
+                ),
+            }
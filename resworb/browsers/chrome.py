@@ -1,24 +1,38 @@
+import datetime
+import glob
 import json
 import os
 import re
-import sqlite3
 import sys
-from typing import Dict, Iterable
+from typing import Dict, Iterable, Optional, Union
 
 from resworb.base import (
+    Bookmark,
     BookmarkMixin,
     CloudTabMixin,
+    HistoryItem,
     HistoryMixin,
     OpenedTabMixin,
+    ProfileMixin,
     ReadingMixin,
     URLItem,
+    walk_tree,
 )
+from resworb.connection import ConnectionManager
 from resworb.exporter import ExportMixin
+from resworb.snss import read_session
 
 
 class ChromeOpenedTabs(OpenedTabMixin):
+    session_file: Optional[str]
+
     def get_opened_tabs(self) -> Iterable[URLItem]:
-        raise NotImplementedError
+        # A profile which has never been opened has no session.
+        if self.session_file is None:
+            return
+
+        for window in read_session(self.session_file):
+            yield from window["tabs"]
 
 
 class ChromeCloudTabs(CloudTabMixin):
@@ -33,43 +47,76 @@ class ChromeReadings(ReadingMixin):
 
 class ChromeBookmarks(BookmarkMixin):
     def get_bookmarks(self, flatten: bool = True) -> Iterable[URLItem]:
-        def _get_bookmarks(node, folders):
-            children = node.get("children")
-            if children is not None:
-                for child in children:
-                    yield from _get_bookmarks(child, [*folders, node["name"]])
-            else:
-                yield {
-                    "title": node["name"],
-                    "url": node["url"],
-                    "folders": folders,
-                }
-
         with open(self.bookmark_file, encoding="utf-8") as f:
             data = json.load(f)
 
-        roots = data.get("roots", {})
-        for root_value in roots.values():
-            yield from _get_bookmarks(root_value, [root_value["name"]])
+        roots = [x for x in data.get("roots", {}).values() if isinstance(x, dict)]
+        for node, folders in walk_tree(
+            roots,
+            lambda x: x.get("children"),
+            lambda x: x["name"],
+        ):
+            if "children" not in node:
+                yield Bookmark(node["name"], node["url"], folders)
 
 
 class ChromeHistories(HistoryMixin):
-    def get_histories(self) -> Iterable[Dict]:
-        with sqlite3.connect(self.history_file) as conn:
-            sql = """
-            SELECT url, title, datetime((last_visit_time/1000000)-11644473600, 'unixepoch', 'localtime')
-            AS last_visit_time FROM urls ORDER BY last_visit_time DESC"""
+    history_time_column = "urls.last_visit_time"
+    history_url_column = "urls.url"
+    history_epoch_time = "(urls.last_visit_time - 11644473600000000)"
+    history_summary_from = "visits INNER JOIN urls ON urls.id = visits.url"
+    history_summary_time_column = "visits.visit_time"
+    history_summary_unix_time = "(visits.visit_time / 1000000 - 11644473600)"
+
+    def _to_history_time(self, timestamp: float) -> float:
+        # Microseconds since 1601-01-01.
+        return (timestamp + 11644473600) * 1000000
+
+    def get_history_watermark(self) -> Optional[float]:
+        sql = "SELECT MAX(last_visit_time) FROM urls"
+
+        return self.connections.query_one(self.history_file, sql)[0]
+
+    def get_histories(
+        self,
+        after: Optional[float] = None,
+        upto: Optional[float] = None,
+        since: Optional[Union[float, datetime.datetime]] = None,
+        until: Optional[Union[float, datetime.datetime]] = None,
+        url_like: Optional[str] = None,
+        domain: Optional[str] = None,
+        limit: Optional[int] = None,
+        raw_time: bool = False,
+    ) -> Iterable[Dict]:
+        where, params = self._get_history_conditions(
+            after=after,
+            upto=upto,
+            since=since,
+            until=until,
+            url_like=url_like,
+            domain=domain,
+        )
+        if limit is not None:
+            params += [limit]
 
-            for url, title, visit_time in conn.cursor().execute(sql):
-                yield {
-                    "id": None,
-                    "url": url,
-                    "title": title,
-                    "visit_time": visit_time,
-                }
+        if raw_time:
+            visit_time = self.history_epoch_time
+        else:
+            visit_time = "datetime((last_visit_time/1000000)-11644473600, 'unixepoch', 'localtime')"
 
+        sql = f"""
+        SELECT url, title, {visit_time}
+        FROM urls {where} ORDER BY urls.last_visit_time DESC
+        {"LIMIT ?" if limit is not None else ""}
+        """
 
-def get_default_library_path() -> str:
+        for url, title, visit_time in self.connections.query(
+            self.history_file, sql, params
+        ):
+            yield HistoryItem(None, url, title, visit_time)
+
+
+def get_default_user_data_path() -> str:
     platform = sys.platform
 
     if re.match(r"win.*", platform):
@@ -80,7 +127,6 @@ def get_default_library_path() -> str:
             "Google",
             "Chrome",
             "User Data",
-            "Default",
         )
 
     if re.match("darwin", platform):
@@ -90,13 +136,16 @@ def get_default_library_path() -> str:
             "Application Support",
             "Google",
             "Chrome",
-            "Default",
         )
 
     msg = f"Unsupported platform: {platform}"
     raise RuntimeError(msg)
 
 
+def get_default_library_path() -> str:
+    return os.path.join(get_default_user_data_path(), "Default")
+
+
 class Chrome(
     ExportMixin,
     ChromeOpenedTabs,
@@ -104,10 +153,60 @@ class Chrome(
     ChromeReadings,
     ChromeBookmarks,
     ChromeHistories,
+    ProfileMixin,
 ):  # pylint: disable=too-many-ancestors
-    def __init__(self, library: str = get_default_library_path()) -> None:
+    @classmethod
+    def get_profiles(cls, library: Optional[str] = None) -> Dict[str, str]:
+        if library is None:
+            library = get_default_user_data_path()
+
+        # A profile directory is given, look for its siblings.
+        if os.path.exists(os.path.join(library, "History")):
+            library = os.path.dirname(os.path.abspath(library))
+
+        profiles = {}
+        for name in sorted(os.listdir(library)):
+            path = os.path.join(library, name)
+            if (name == "Default" or name.startswith("Profile ")) and any(
+                os.path.exists(os.path.join(path, x)) for x in ["History", "Bookmarks"]
+            ):
+                profiles[name] = path
+
+        return profiles
+
+    def __init__(
+        self,
+        library: Optional[str] = None,
+        batch_size: int = 1000,
+        in_memory: bool = False,
+    ) -> None:
         super().__init__()
 
+        self.connections = ConnectionManager(
+            batch_size=batch_size,
+            in_memory=in_memory,
+        )
+
+        if library is None:
+            library = get_default_library_path()
+
         self.library = library
         self.bookmark_file = os.path.join(library, "Bookmarks")
         self.history_file = os.path.join(library, "History")
+
+    @property
+    def session_file(self) -> Optional[str]:
+        # Chrome writes a new `Sessions/Session_<time>` on every start, older
+        # versions keep the current session in `Current Session`.
+        session_files = sorted(
+            glob.glob(os.path.join(self.library, "Sessions", "Session_*")),
+            key=os.path.getmtime,
+        )
+        if session_files:
+            return session_files[-1]
+
+        session_file = os.path.join(self.library, "Current Session")
+        if not os.path.exists(session_file):
+            return None
+
+        return session_file
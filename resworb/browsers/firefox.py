@@ -1,44 +1,111 @@
+import datetime
+import functools
 import glob
 import json
 import os
 import re
-import sqlite3
 import sys
-from typing import Dict, Iterable
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
 
 from resworb.base import (
+    Bookmark,
     BookmarkMixin,
     CloudTabMixin,
+    HistoryItem,
     HistoryMixin,
     OpenedTabMixin,
+    ProfileMixin,
     ReadingMixin,
+    Tab,
     URLItem,
 )
+from resworb.connection import ConnectionManager
 from resworb.exporter import ExportMixin
 
+# Written by Firefox in this order of freshness: while running, the backup of
+# the previous write, at the previous shutdown, and at a clean shutdown.
+SESSION_FILES = [
+    os.path.join("sessionstore-backups", "recovery.jsonlz4"),
+    os.path.join("sessionstore-backups", "recovery.baklz4"),
+    os.path.join("sessionstore-backups", "previous.jsonlz4"),
+    "sessionstore.jsonlz4",
+]
+
+
+def _prune_session_object(obj: Dict) -> Any:
+    # Called for every object of the session once its children are parsed:
+    # entries are reduced to their url and title (dropping form data, scroll
+    # positions, serialized state and subframes) and tabs to their current
+    # entry, so the parsed session grows with the number of tabs only.
+    entries = obj.get("entries")
+    if entries is not None:
+        if not entries:
+            return Tab(None, None)
+
+        index = min(max(obj.get("index", len(entries)), 1), len(entries))
+        entry = entries[index - 1]
+
+        return Tab(entry.get("title"), entry.get("url"))
+
+    if "url" in obj:
+        return {"title": obj.get("title"), "url": obj["url"]}
+
+    return obj
+
 
 class FirefoxOpenedTabs(OpenedTabMixin):
-    session_file: str
+    session_files: List[str]
+    library: str
 
-    def get_opened_tabs(self) -> Iterable[URLItem]:
+    def get_session(self) -> Dict:
         # References:
         # https://gist.github.com/tmonjalo/33c4402b0d35f1233020bf427b5539fa
         # pylint: disable=import-outside-toplevel
         import lz4.block
 
-        with open(self.session_file, mode="rb") as f:
-            bytes_ = f.read()
-            if bytes_[:8] == b"mozLz40\0":
-                bytes_ = lz4.block.decompress(bytes_[8:])
-                data = json.loads(bytes_)
+        # A profile which has never been opened has no session.
+        if not self.session_files:
+            return {}
+
+        # Session files are LZ4 blocks which cannot be decompressed in a
+        # streaming way, the decompressed bytes are released once parsed.
+        for session_file in self.session_files:
+            try:
+                with open(session_file, mode="rb") as f:
+                    if f.read(8) != b"mozLz40\0":
+                        continue
+
+                    bytes_ = lz4.block.decompress(f.read())
+
+                return json.loads(bytes_, object_hook=_prune_session_object)
+            except (OSError, ValueError, lz4.block.LZ4BlockError):
+                # Truncated or corrupted while being written, try the backups.
+                continue
 
-                for window in data["windows"]:
-                    for tab in window["tabs"]:
-                        i = tab["index"] - 1
-                        yield {
-                            "title": tab["entries"][i]["title"],
-                            "url": tab["entries"][i]["url"],
-                        }
+        msg = f"No readable session file in {self.library}"
+        raise RuntimeError(msg)
+
+    def get_opened_tabs(self) -> Iterable[URLItem]:
+        for window in self.get_session().get("windows", []):
+            for tab in window.get("tabs", []):
+                if tab.url is not None:
+                    yield tab
+
+    def get_closed_tabs(self) -> Iterable[URLItem]:
+        # Recently closed tabs of the open windows.
+        for window in self.get_session().get("windows", []):
+            for closed_tab in window.get("_closedTabs", []):
+                tab = closed_tab.get("state")
+                if tab is not None and tab.url is not None:
+                    yield tab
+
+    def get_closed_windows(self) -> Iterable[Dict[str, Any]]:
+        for window in self.get_session().get("_closedWindows", []):
+            yield {
+                "title": window.get("title"),
+                "closed_at": window.get("closedAt"),
+                "tabs": [x for x in window.get("tabs", []) if x.url is not None],
+            }
 
 
 class FirefoxCloudTabs(CloudTabMixin):
@@ -54,63 +121,113 @@ class FirefoxReadings(ReadingMixin):
 class FirefoxBookmarks(BookmarkMixin):
     history_file: str
 
-    def _get_bookmarks_folders(self):
-        with sqlite3.connect(self.history_file) as conn:
-            sql = """
-            SELECT id, type, parent, title
-            FROM moz_bookmarks
-            WHERE type=2;
-            """
-            columns = ["id", "type", "parent", "title"]
+    def _get_bookmark_folder_paths(self) -> Dict[int, Tuple[str, ...]]:
+        sql = """
+        SELECT id, parent, title
+        FROM moz_bookmarks
+        WHERE type=2;
+        """
+        folders = {
+            id_: (parent, title)
+            for id_, parent, title in self.connections.query(self.history_file, sql)
+        }
 
-            return [dict(zip(columns, r)) for r in conn.cursor().execute(sql)]
+        # Each folder path is resolved once and shared by its sub-folders and
+        # bookmarks. The root folder (whose parent is 0) is not included.
+        paths = {}
+        for id_ in folders:
+            unresolved = []
+            while id_ not in paths:
+                parent, _ = folders[id_]
+                if parent <= 0:
+                    paths[id_] = ()
+                    break
 
-    def get_bookmarks(self, flatten: bool = True) -> Iterable[URLItem]:
-        bookmark_folders = self._get_bookmarks_folders()
-        bookmark_folders = {x["id"]: x for x in bookmark_folders}
+                unresolved += [id_]
+                id_ = parent
 
-        def _get_bookmark_folders(parent):
-            folders = []
-            folder = bookmark_folders[parent]
-            while folder["parent"] > 0:
-                folders += [folder["title"]]
-                folder = bookmark_folders[folder["parent"]]
+            for folder_id in reversed(unresolved):
+                parent, title = folders[folder_id]
+                paths[folder_id] = (*paths[parent], title)
 
-            return list(reversed(folders))
+        return paths
+
+    def get_bookmarks(self, flatten: bool = True) -> Iterable[URLItem]:
+        # Folders and bookmarks are read from the same snapshot.
+        with self.connections.session():
+            folder_paths = self._get_bookmark_folder_paths()
 
-        with sqlite3.connect(self.history_file) as conn:
             sql = """
-            SELECT type, parent, moz_bookmarks.title, moz_places.url
+            SELECT parent, moz_bookmarks.title, moz_places.url
             FROM moz_bookmarks
             INNER JOIN moz_places on moz_bookmarks.fk=moz_places.id
             WHERE type=1
             ORDER BY dateAdded desc;
             """
 
-            for _, parent, title, url in conn.cursor().execute(sql):
-                yield {
-                    "title": title,
-                    "url": url,
-                    "folders": _get_bookmark_folders(parent),
-                }
+            for parent, title, url in self.connections.query(self.history_file, sql):
+                yield Bookmark(title, url, folder_paths[parent])
 
 
 class FirefoxHistories(HistoryMixin):
-    def get_histories(self) -> Iterable[Dict]:
-        with sqlite3.connect(self.history_file) as conn:
-            sql = """
-            SELECT place_id, url, title, datetime((visit_date/1000000), 'unixepoch', 'localtime') AS visit_date
-            FROM moz_places INNER JOIN moz_historyvisits on moz_historyvisits.place_id = moz_places.id
-            ORDER BY visit_date DESC
-            """
+    history_time_column = "moz_historyvisits.visit_date"
+    history_url_column = "moz_places.url"
+    history_epoch_time = "moz_historyvisits.visit_date"
+    history_summary_from = (
+        "moz_historyvisits INNER JOIN moz_places"
+        " ON moz_places.id = moz_historyvisits.place_id"
+    )
+    history_summary_time_column = "moz_historyvisits.visit_date"
+    history_summary_unix_time = "(moz_historyvisits.visit_date / 1000000)"
+
+    def _to_history_time(self, timestamp: float) -> float:
+        # Microseconds since the unix epoch.
+        return timestamp * 1000000
+
+    def get_history_watermark(self) -> Optional[float]:
+        sql = "SELECT MAX(visit_date) FROM moz_historyvisits"
+
+        return self.connections.query_one(self.history_file, sql)[0]
+
+    def get_histories(
+        self,
+        after: Optional[float] = None,
+        upto: Optional[float] = None,
+        since: Optional[Union[float, datetime.datetime]] = None,
+        until: Optional[Union[float, datetime.datetime]] = None,
+        url_like: Optional[str] = None,
+        domain: Optional[str] = None,
+        limit: Optional[int] = None,
+        raw_time: bool = False,
+    ) -> Iterable[Dict]:
+        where, params = self._get_history_conditions(
+            after=after,
+            upto=upto,
+            since=since,
+            until=until,
+            url_like=url_like,
+            domain=domain,
+        )
+        if limit is not None:
+            params += [limit]
 
-            for id_, url, title, visit_time in conn.cursor().execute(sql):
-                yield {
-                    "id": id_,
-                    "url": url,
-                    "title": title,
-                    "visit_time": visit_time,
-                }
+        if raw_time:
+            visit_time = self.history_epoch_time
+        else:
+            visit_time = "datetime((visit_date/1000000), 'unixepoch', 'localtime')"
+
+        sql = f"""
+        SELECT place_id, url, title, {visit_time}
+        FROM moz_places INNER JOIN moz_historyvisits on moz_historyvisits.place_id = moz_places.id
+        {where}
+        ORDER BY moz_historyvisits.visit_date DESC
+        {"LIMIT ?" if limit is not None else ""}
+        """
+
+        for id_, url, title, visit_time in self.connections.query(
+            self.history_file, sql, params
+        ):
+            yield HistoryItem(id_, url, title, visit_time)
 
 
 def get_default_library_path() -> str:
@@ -144,31 +261,71 @@ class Firefox(
     FirefoxReadings,
     FirefoxBookmarks,
     FirefoxHistories,
+    ProfileMixin,
 ):  # pylint: disable=too-many-ancestors
-    def __init__(self, library: str = get_default_library_path()) -> None:
+    @classmethod
+    def get_profiles(cls, library: Optional[str] = None) -> Dict[str, str]:
+        if library is None:
+            library = get_default_library_path()
+
+        # A profile directory is given, look for its siblings.
+        if os.path.exists(os.path.join(library, "places.sqlite")):
+            library = os.path.dirname(os.path.abspath(library))
+
+        return {
+            os.path.basename(os.path.dirname(x)): os.path.dirname(x)
+            for x in sorted(glob.glob(os.path.join(library, "*", "places.sqlite")))
+        }
+
+    def __init__(
+        self,
+        library: Optional[str] = None,
+        batch_size: int = 1000,
+        in_memory: bool = False,
+    ) -> None:
         super().__init__()
 
+        self.connections = ConnectionManager(
+            batch_size=batch_size,
+            in_memory=in_memory,
+        )
+
+        if library is None:
+            library = get_default_library_path()
+
         self.library = library
 
-        session_files = glob.glob(
-            os.path.join(
-                self.library,
-                "*.default*",
-                "sessionstore-backups",
-                "recovery.jsonlz4",
-            ),
-            recursive=True,
-        )
-        if not session_files:
-            msg = f"Session file not found in {self.library}"
-            raise RuntimeError(msg)
-        self.session_file = session_files[0]
+    @property
+    def _profile_pattern(self) -> str:
+        # The library is either a profile directory, or the directory of all
+        # profiles in which case the default profile is used.
+        if os.path.exists(os.path.join(self.library, "places.sqlite")):
+            return ""
+
+        return "*.default*"
+
+    @functools.cached_property
+    def session_files(self) -> List[str]:
+        # All session files of the first profile, then of the next ones.
+        return [
+            os.path.join(profile, name)
+            for profile in glob.glob(os.path.join(self.library, self._profile_pattern))
+            for name in SESSION_FILES
+            if os.path.exists(os.path.join(profile, name))
+        ]
 
+    @property
+    def session_file(self) -> Optional[str]:
+        return self.session_files[0] if self.session_files else None
+
+    @functools.cached_property
+    def history_file(self) -> str:
         history_files = glob.glob(
-            os.path.join(self.library, "*.default*", "places.sqlite"),
+            os.path.join(self.library, self._profile_pattern, "places.sqlite"),
             recursive=True,
         )
         if not history_files:
             msg = f"History file not found in {self.library}"
             raise RuntimeError(msg)
-        self.history_file = history_files[0]
+
+        return history_files[0]
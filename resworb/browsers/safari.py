@@ -1,19 +1,28 @@
+import datetime
+import functools
+import itertools
 import os
 import plistlib
 import re
-import sqlite3
 import subprocess
 import tempfile
-from typing import Any, Dict, Iterable, Mapping, Union
+from typing import Dict, Iterable, Mapping, Optional, Union
 
 from resworb.base import (
+    Bookmark,
     BookmarkMixin,
+    CloudTabDevice,
     CloudTabMixin,
+    HistoryItem,
     HistoryMixin,
     OpenedTabMixin,
+    ProfileMixin,
     ReadingMixin,
+    Tab,
     URLItem,
+    walk_tree,
 )
+from resworb.connection import ConnectionManager
 from resworb.exporter import ExportMixin
 
 
@@ -74,35 +83,43 @@ class SafariOpenedTabs(OpenedTabMixin):
 
                 # Ignore start pages
                 if not re.match(r"favorites://", url):
-                    yield {
-                        "title": title.rstrip(),
-                        "url": url,
-                    }
+                    yield Tab(title.rstrip(), url)
 
 
 class SafariCloudTabs(CloudTabMixin):
     def get_devices(self) -> Iterable[Dict[str, str]]:
-        with sqlite3.connect(self.cloud_tab_file) as conn:
-            sql = "SELECT device_uuid, device_name FROM cloud_tab_devices;"
+        sql = "SELECT device_uuid, device_name FROM cloud_tab_devices;"
 
-            for id_, name in conn.cursor().execute(sql):
-                yield {
-                    "id": id_,
-                    "name": name,
-                }
+        for id_, name in self.connections.query(self.cloud_tab_file, sql):
+            yield {
+                "id": id_,
+                "name": name,
+            }
 
     def get_device_cloud_tabs(self, device_id: str) -> Iterable[URLItem]:
-        with sqlite3.connect(self.cloud_tab_file) as conn:
-            sql = f'SELECT title, url FROM cloud_tabs WHERE device_uuid="{device_id}";'
-            for tab in conn.cursor().execute(sql):
-                yield {
-                    "title": tab[0],
-                    "url": tab[1],
-                }
+        sql = "SELECT title, url FROM cloud_tabs WHERE device_uuid = ?;"
+
+        for title, url in self.connections.query(
+            self.cloud_tab_file, sql, (device_id,)
+        ):
+            yield Tab(title, url)
+
+    def get_cloud_tabs(self) -> Iterable[CloudTabDevice]:
+        # Tabs of all devices are read by one query and grouped here.
+        sql = """
+        SELECT cloud_tab_devices.device_uuid, device_name, title, url
+        FROM cloud_tab_devices
+        LEFT JOIN cloud_tabs ON cloud_tabs.device_uuid = cloud_tab_devices.device_uuid
+        ORDER BY cloud_tab_devices.device_uuid
+        """
 
-    def get_cloud_tabs(self) -> Iterable[Dict[str, Any]]:
-        for device in self.get_devices():
-            yield {**device, "tabs": self.get_device_cloud_tabs(device["id"])}
+        rows = self.connections.query(self.cloud_tab_file, sql)
+        for (id_, name), tabs in itertools.groupby(rows, key=lambda x: x[:2]):
+            yield CloudTabDevice(
+                id=id_,
+                name=name,
+                tabs=[Tab(title, url) for _, _, title, url in tabs if url is not None],
+            )
 
 
 class SafariReadings(ReadingMixin):
@@ -119,10 +136,7 @@ class SafariReadings(ReadingMixin):
             return
 
         for bookmark in bookmarks.get("Children", []):
-            yield {
-                "title": bookmark["URIDictionary"]["title"],
-                "url": bookmark["URLString"],
-            }
+            yield Tab(bookmark["URIDictionary"]["title"], bookmark["URLString"])
 
 
 class SafariBookmarks(BookmarkMixin):
@@ -158,55 +172,96 @@ class SafariBookmarks(BookmarkMixin):
             msg = f"Unknow node type: {node['WebBookmarkType']}"
             raise ValueError(msg)
 
-        def _get_bookmarks_flatten(node, folders):
-            if node["WebBookmarkType"] == "WebBookmarkTypeList":
-                for x in node.get("Children", []):
-                    yield from _get_bookmarks_flatten(x, [*folders, node["Title"]])
-
-            elif node["WebBookmarkType"] == "WebBookmarkTypeLeaf":
-                children = node.get("Children", [])
-                for x in children:
-                    yield from _get_bookmarks_flatten(
-                        x,
-                        [*folders, node["Title"]],
+        def _get_bookmarks_flatten(nodes):
+            for node, folders in walk_tree(
+                nodes,
+                lambda x: x.get("Children"),
+                lambda x: x["Title"],
+            ):
+                node_type = node["WebBookmarkType"]
+                if node_type == "WebBookmarkTypeLeaf":
+                    yield Bookmark(
+                        node["URIDictionary"]["title"],
+                        node["URLString"],
+                        folders,
                     )
 
-                yield {
-                    "title": node["URIDictionary"]["title"],
-                    "url": node["URLString"],
-                    "folders": folders,
-                }
-
-            else:
-                msg = f"Unknow node type: {node['WebBookmarkType']}"
-                raise ValueError(msg)
+                elif node_type != "WebBookmarkTypeList":
+                    msg = f"Unknow node type: {node_type}"
+                    raise ValueError(msg)
 
         bookmarks = self.bookmark_plist["Children"][1]["Children"]
         if flatten:
-            return _get_bookmarks_flatten(bookmarks, [])
+            return _get_bookmarks_flatten(bookmarks)
 
         return _get_bookmarks(bookmarks)
 
 
 class SafariHistories(HistoryMixin):
-    def get_histories(self) -> Iterable[Dict]:
-        with sqlite3.connect(self.history_file) as conn:
-            sql = """
-            SELECT history_item, url, title, datetime(visit_time + 978307200, 'unixepoch', 'localtime')
-            FROM history_visits INNER JOIN history_items ON history_items.id = history_visits.history_item
-            ORDER BY visit_time DESC
-            """
+    history_time_column = "history_visits.visit_time"
+    history_url_column = "history_items.url"
+    history_epoch_time = (
+        "CAST(ROUND((history_visits.visit_time + 978307200) * 1000000) AS INTEGER)"
+    )
+    history_summary_from = (
+        "history_visits INNER JOIN history_items"
+        " ON history_items.id = history_visits.history_item"
+    )
+    history_summary_time_column = "history_visits.visit_time"
+    history_summary_unix_time = "(history_visits.visit_time + 978307200)"
+
+    def _to_history_time(self, timestamp: float) -> float:
+        # Seconds since 2001-01-01.
+        return timestamp - 978307200
+
+    def get_history_watermark(self) -> Optional[float]:
+        sql = "SELECT MAX(visit_time) FROM history_visits"
+
+        return self.connections.query_one(self.history_file, sql)[0]
+
+    def get_histories(
+        self,
+        after: Optional[float] = None,
+        upto: Optional[float] = None,
+        since: Optional[Union[float, datetime.datetime]] = None,
+        until: Optional[Union[float, datetime.datetime]] = None,
+        url_like: Optional[str] = None,
+        domain: Optional[str] = None,
+        limit: Optional[int] = None,
+        raw_time: bool = False,
+    ) -> Iterable[Dict]:
+        where, params = self._get_history_conditions(
+            after=after,
+            upto=upto,
+            since=since,
+            until=until,
+            url_like=url_like,
+            domain=domain,
+        )
+        if limit is not None:
+            params += [limit]
+
+        if raw_time:
+            visit_time = self.history_epoch_time
+        else:
+            visit_time = "datetime(visit_time + 978307200, 'unixepoch', 'localtime')"
+
+        sql = f"""
+        SELECT history_item, url, title, {visit_time}
+        FROM history_visits INNER JOIN history_items ON history_items.id = history_visits.history_item
+        {where}
+        ORDER BY history_visits.visit_time DESC
+        {"LIMIT ?" if limit is not None else ""}
+        """
 
-            for id_, url, title, visit_time in conn.cursor().execute(sql):
-                yield {
-                    "id": id_,
-                    "url": url,
-                    "title": title,
-                    "visit_time": visit_time,
-                }
+        for id_, url, title, visit_time in self.connections.query(
+            self.history_file, sql, params
+        ):
+            yield HistoryItem(id_, url, title, visit_time)
 
 
-DEFAULT_LIBRARY_PATH = os.path.join(os.environ["HOME"], "Library", "Safari")
+def get_default_library_path() -> str:
+    return os.path.join(os.path.expanduser("~"), "Library", "Safari")
 
 
 class Safari(
@@ -216,14 +271,39 @@ class Safari(
     SafariReadings,
     SafariBookmarks,
     SafariHistories,
+    ProfileMixin,
 ):  # pylint: disable=too-many-ancestors
-    def __init__(self, library: str = DEFAULT_LIBRARY_PATH) -> None:
+    @classmethod
+    def get_profiles(cls, library: Optional[str] = None) -> Dict[str, str]:
+        if library is None:
+            library = get_default_library_path()
+
+        return {"default": library}
+
+    def __init__(
+        self,
+        library: Optional[str] = None,
+        batch_size: int = 1000,
+        in_memory: bool = False,
+    ) -> None:
         super().__init__()
 
+        self.connections = ConnectionManager(
+            batch_size=batch_size,
+            in_memory=in_memory,
+        )
+
+        if library is None:
+            library = get_default_library_path()
+
         self.library = library
         self.cloud_tab_file = os.path.join(library, "CloudTabs.db")
         self.history_file = os.path.join(library, "History.db")
 
         self.bookmark_file = os.path.join(library, "Bookmarks.plist")
+
+    @functools.cached_property
+    def bookmark_plist(self) -> Mapping:
+        # Only parsed when bookmarks or readings are requested.
         with open(self.bookmark_file, mode="rb") as plist_file:
-            self.bookmark_plist = plistlib.load(plist_file)
+            return plistlib.load(plist_file)
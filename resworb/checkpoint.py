@@ -0,0 +1,31 @@
+import json
+import os
+from typing import Dict, Optional
+
+from resworb.files import write_atomic
+
+
+class Checkpoint:
+    # Watermarks are stored per profile and per source in the browser's native
+    # units (e.g. the raw last visit timestamp) so they can be compared in SQL.
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self.watermarks: Dict[str, Dict[str, float]] = {}
+
+        if os.path.exists(filename):
+            with open(filename, encoding="utf-8") as f:
+                self.watermarks = json.load(f)
+
+    def get(self, profile: str, source: str) -> Optional[float]:
+        return self.watermarks.get(profile, {}).get(source)
+
+    def update(self, profile: str, source: str, watermark: float) -> None:
+        self.watermarks.setdefault(profile, {})[source] = watermark
+
+    def save(self) -> None:
+        # An interrupted run never leaves a truncated checkpoint behind.
+        write_atomic(
+            self.filename,
+            lambda f: json.dump(self.watermarks, f, ensure_ascii=False, indent=4),
+        )
@@ -1,63 +1,144 @@
 #! /usr/bin/env python
 
 import argparse
+import cProfile
+import datetime
+import functools
+import importlib
 import logging
 import os
-from typing import Optional, Type
-
-from resworb.browsers.safari import Safari
-from resworb.exporter import JSONExporter, PickleExporter, TOMLExporter, YAMLExporter
-from resworb.formatter import WeixinFormatter
+import re
+import time
+from typing import Any, Callable, Optional, Type
+
+from resworb.archive import ArchiveExporter
+from resworb.base import replace_item
+from resworb.checkpoint import Checkpoint
+from resworb.compression import split_compression
+from resworb.dedup import BloomDeduplicator, DigestDeduplicator, ExactDeduplicator
+from resworb.diff import DIFF_SOURCES, diff_records, iter_browser_records
+from resworb.formatter import FormatterCache, FormatterRunner
+from resworb.metrics import Metrics, get_sink
+from resworb.profiles import export_profiles, merge_profiles
+from resworb.reader import read_export
+from resworb.search import SearchIndex
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Exporters and formatters are registered by import path so that only the
+# ones in use (and their dependencies) are imported.
 DEFAULT_FORMATTERS = [
-    WeixinFormatter(),
+    "resworb.formatter:WeixinFormatter",
 ]
 
 EXPORT_FACTORY = {
-    ".yml": YAMLExporter,
-    ".yaml": YAMLExporter,
-    ".toml": TOMLExporter,
-    ".json": JSONExporter,
-    ".pkl": PickleExporter,
-    ".pickle": PickleExporter,
+    ".yml": "resworb.exporter:YAMLExporter",
+    ".yaml": "resworb.exporter:YAMLExporter",
+    ".toml": "resworb.exporter:TOMLExporter",
+    ".json": "resworb.exporter:JSONExporter",
+    ".jsonl": "resworb.exporter:JSONLinesExporter",
+    ".ndjson": "resworb.exporter:JSONLinesExporter",
+    ".pkl": "resworb.exporter:PickleExporter",
+    ".pickle": "resworb.exporter:PickleExporter",
+    ".parquet": "resworb.exporter:ParquetExporter",
+    ".arrows": "resworb.exporter:ArrowExporter",
+    ".msgpack": "resworb.exporter:MessagePackExporter",
+    ".sqlite": "resworb.archive:ArchiveExporter",
 }
 
+SOURCES = ["opened_tabs", "cloud_tabs", "readings", "bookmarks", "histories"]
 
-def library_path() -> Optional[str]:
-    home = os.getenv("HOME")
-    if not home:
-        return None
 
-    path = os.path.join(home, "Library", "Safari")
+def import_object(path: str) -> Any:
+    module_name, _, name = path.partition(":")
 
-    return path
+    return getattr(importlib.import_module(module_name), name)
 
 
-def add_export_arguments(parser):
+def cache_path() -> Optional[str]:
+    cache_home = os.getenv("XDG_CACHE_HOME")
+    if not cache_home:
+        home = os.getenv("HOME")
+        if not home:
+            return None
+
+        cache_home = os.path.join(home, ".cache")
+
+    return os.path.join(cache_home, "resworb")
+
+
+def parse_time(value: str) -> float:
+    # A duration before now (e.g. `24h`, `7d`) or an ISO date in local time.
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhdw])", value)
+    if match:
+        seconds = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+        return time.time() - float(match.group(1)) * seconds[match.group(2)]
+
+    try:
+        return datetime.datetime.fromisoformat(value).timestamp()
+    except ValueError as e:
+        msg = f"Invalid time: {value!r}"
+        raise argparse.ArgumentTypeError(msg) from e
+
+
+def add_browser_arguments(parser, required=True, help_="Selected browser."):
     parser.add_argument(
         "-b",
         "--browser",
         type=str,
-        required=True,
-        help="Seleted browser.",
+        required=required,
+        default=None,
+        help=help_,
+    )
+    parser.add_argument(
+        "-l",
+        "--library",
+        type=str,
+        default=None,
+        help="Library location (default: the default location of the browser)",
     )
 
-    sources = [
-        "opened_tabs",
-        "cloud_tabs",
-        "readings",
-        "bookmarks",
-        "histories",
-    ]
+    return parser
+
+
+def add_history_filter_arguments(parser):
+    parser.add_argument(
+        "--since",
+        type=parse_time,
+        default=None,
+        help="Only export histories visited since this time (e.g. '24h', '2023-01-31').",
+    )
+    parser.add_argument(
+        "--until",
+        type=parse_time,
+        default=None,
+        help="Only export histories visited before this time.",
+    )
+    parser.add_argument(
+        "--url-like",
+        type=str,
+        default=None,
+        help="Only export histories whose url matches this SQL LIKE pattern.",
+    )
+    parser.add_argument(
+        "--domain",
+        type=str,
+        default=None,
+        help="Only export histories of this domain and its subdomains.",
+    )
+
+    return parser
+
+
+def add_export_arguments(parser):
+    add_browser_arguments(parser)
     parser.add_argument(
         "-s",
         "--source",
         type=str,
         nargs="+",
-        choices=sources,
+        choices=SOURCES,
         default=None,
         help="If not given, export all sources.",
     )
@@ -68,14 +149,225 @@ def add_export_arguments(parser):
         required=True,
         help="Output file name.",
     )
+    parser.add_argument(
+        "-a",
+        "--all-profiles",
+        action="store_true",
+        help="Export all profiles found in the library, tagged with the profile.",
+    )
+    parser.add_argument(
+        "-p",
+        "--processes",
+        type=int,
+        default=None,
+        help="Number of processes exporting profiles (default: number of CPUs).",
+    )
+    parser.add_argument(
+        "-c",
+        "--checkpoint",
+        type=str,
+        default=None,
+        help="Checkpoint file, only export histories added since the last run.",
+    )
+    add_history_filter_arguments(parser)
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=None,
+        help="Only export the most recent histories.",
+    )
+    parser.add_argument(
+        "--dedup",
+        type=str,
+        choices=["exact", "digest", "bloom"],
+        default="exact",
+        help=(
+            "Deduplication of urls: keep them ('exact', the default), their"
+            " 64 bits digests ('digest') or a Bloom filter ('bloom')."
+        ),
+    )
+    parser.add_argument(
+        "--canonicalize",
+        action="store_true",
+        help="Drop fragments and tracking parameters of urls before deduplicating.",
+    )
+    parser.add_argument(
+        "--bloom-capacity",
+        type=int,
+        default=1000000,
+        help="Expected number of urls of '--dedup bloom' (default: 1000000).",
+    )
+    parser.add_argument(
+        "--bloom-error-rate",
+        type=float,
+        default=0.001,
+        help="False positive rate of '--dedup bloom' (default: 0.001).",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=8,
+        help="Maximum number of concurrent formatter requests (default: 8).",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=10.0,
+        help="Timeout in seconds of each formatter request (default: 10).",
+    )
 
-    library = library_path()
+    cache = cache_path()
+    if cache:
+        cache = os.path.join(cache, "formatters.sqlite")
     parser.add_argument(
-        "-l",
-        "--library",
+        "--cache",
+        type=str,
+        default=cache,
+        help=f"Formatter cache location (default: {cache!r})",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not cache formatter results.",
+    )
+    parser.add_argument(
+        "--cache-max-entries",
+        type=int,
+        default=100000,
+        help=(
+            "Maximum number of cached formatter results, the least recently"
+            " used are evicted (default: 100000)."
+        ),
+    )
+    parser.add_argument(
+        "--stats",
+        type=str,
+        nargs="?",
+        const="log",
+        default=None,
+        help=(
+            "Report timings, rows/s, bytes and peak memory of every stage: "
+            "'log' (default), a '.prom' Prometheus textfile or a JSON file."
+        ),
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        default=None,
+        help="Dump cProfile statistics of the export to this file.",
+    )
+
+    return parser
+
+
+def add_summary_arguments(parser):
+    add_browser_arguments(parser)
+    parser.add_argument(
+        "-g",
+        "--group-by",
+        type=str,
+        choices=["url", "domain", "day"],
+        default="domain",
+        help="Count visits per url, domain or day (default: 'domain').",
+    )
+    parser.add_argument(
+        "-n",
+        "--top-n",
+        type=int,
+        default=100,
+        help="Number of rows, 0 for all (default: 100).",
+    )
+    parser.add_argument(
+        "-t",
+        "--target",
         type=str,
-        default=library,
-        help=f"Library location (default: {library!r})",
+        default=None,
+        help="Output file name (default: print to stdout).",
+    )
+    add_history_filter_arguments(parser)
+
+    return parser
+
+
+def add_search_arguments(parser):
+    parser.add_argument(
+        "query",
+        type=str,
+        nargs="+",
+        help="Words to search in titles, urls and bookmark folders.",
+    )
+    add_browser_arguments(
+        parser,
+        required=False,
+        help_="Update the index with all profiles of the browser before searching.",
+    )
+    parser.add_argument(
+        "-s",
+        "--source",
+        type=str,
+        nargs="+",
+        choices=SOURCES,
+        help="Only search these sources.",
+    )
+    parser.add_argument(
+        "-n",
+        "--limit",
+        type=int,
+        default=20,
+        help="Number of results (default: 20).",
+    )
+    parser.add_argument(
+        "-i",
+        "--index",
+        type=str,
+        default=os.path.join(cache_path() or "", "search.sqlite"),
+        help="Search index (default: search.sqlite in the cache directory).",
+    )
+
+    return parser
+
+
+def add_diff_arguments(parser):
+    parser.add_argument(
+        "old",
+        type=str,
+        help="Previous export, of any supported file type.",
+    )
+    parser.add_argument(
+        "new",
+        type=str,
+        nargs="?",
+        default=None,
+        help="Newer export (default: the live browser given by -b).",
+    )
+    add_browser_arguments(
+        parser,
+        required=False,
+        help_="Compare with the live data of the browser.",
+    )
+    parser.add_argument(
+        "-s",
+        "--source",
+        type=str,
+        nargs="+",
+        choices=SOURCES,
+        help=(
+            "Only compare these sources (default: all of the exports, or"
+            " cloud tabs, readings and bookmarks of a browser)."
+        ),
+    )
+    parser.add_argument(
+        "-t",
+        "--target",
+        type=str,
+        default=None,
+        help="Output file name (default: print to stdout).",
+    )
+    parser.add_argument(
+        "--trust-pickle",
+        action="store_true",
+        help="Read pickle exports, which can run arbitrary code when loaded.",
     )
 
     return parser
@@ -88,71 +380,318 @@ def parse_args():
     subparsers = parser.add_subparsers(required=True)
     export_parser = subparsers.add_parser("export", help="Export browser data")
     add_export_arguments(export_parser)
+    export_parser.set_defaults(command="export")
+
+    summary_parser = subparsers.add_parser(
+        "summary", help="Summarize histories by url, domain or day"
+    )
+    add_summary_arguments(summary_parser)
+    summary_parser.set_defaults(command="summary")
+
+    search_parser = subparsers.add_parser(
+        "search", help="Search titles, urls and bookmark folders"
+    )
+    add_search_arguments(search_parser)
+    search_parser.set_defaults(command="search")
+
+    diff_parser = subparsers.add_parser(
+        "diff", help="Compare an export with a newer one or the browser"
+    )
+    add_diff_arguments(diff_parser)
+    diff_parser.set_defaults(command="diff")
 
     args = parser.parse_args()
 
-    if not args.source:
-        args.source = "all"
+    args.history_filters = {
+        key: getattr(args, key)
+        for key in ["since", "until", "url_like", "domain", "limit"]
+        if getattr(args, key, None) is not None
+    }
 
-    return args
+    if args.command == "diff" and (args.new is None) == (args.browser is None):
+        parser.error("Either a newer export or a browser is required.")
 
+    if args.command == "export":
+        if not args.source:
+            args.source = "all"
+
+        if args.history_filters and args.checkpoint:
+            parser.error("History filters cannot be used with a checkpoint.")
+
+    return args
 
-def format_records(records, formatters):
-    def _format(record):
-        for f in formatters:
-            record = f(record)
 
-        return record
+def format_records(records, formatters, max_workers=8):
+    runner = FormatterRunner(formatters, max_workers=max_workers)
 
-    results = {}
-    for key, value in records.items():
+    for key, value in records:
         if key == "cloud_tabs":
-            results[key] = [
-                {
-                    k: list(map(_format, v)) if k == "tabs" else v
-                    for k, v in device_value.items()
-                }
-                for device_value in value
-            ]
+            yield key, (
+                replace_item(device, tabs=list(runner(device["tabs"])))
+                for device in value
+            )
         else:
-            results[key] = list(map(_format, value))
+            yield key, runner(value)
 
-    return results
+
+def count_records(records, counts):
+    def _count(key, value):
+        counts[key] = 0
+        for x in value:
+            counts[key] += len(x["tabs"]) if key == "cloud_tabs" else 1
+            yield x
+
+    for key, value in records:
+        yield key, _count(key, value)
 
 
 def get_browser_class(name) -> Type:
+    # pylint: disable=import-outside-toplevel
+
     if name == "safari":
+        from resworb.browsers.safari import Safari
+
         return Safari
 
-    msg = "Unsupported browser: {name}"
+    if name == "chrome":
+        from resworb.browsers.chrome import Chrome
+
+        return Chrome
+
+    if name == "firefox":
+        from resworb.browsers.firefox import Firefox
+
+        return Firefox
+
+    msg = f"Unsupported browser: {name}"
+    raise ValueError(msg)
+
+
+def get_profile_name(browser_class, browser) -> str:
+    # The name `get_profiles` gives the profile the browser reads, which may
+    # be resolved from its library (e.g. the default profile of Firefox).
+    library = os.path.abspath(os.path.dirname(browser.history_file))
+    for name, path in browser_class.get_profiles(browser.library).items():
+        if os.path.abspath(path) == library:
+            return name
+
+    return os.path.basename(library)
+
+
+def get_deduplicator(
+    name, capacity=1000000, error_rate=0.001, canonicalize=False
+) -> Callable:
+    if name == "exact":
+        return functools.partial(ExactDeduplicator, canonicalize=canonicalize)
+
+    if name == "digest":
+        return functools.partial(DigestDeduplicator, canonicalize=canonicalize)
+
+    if name == "bloom":
+        return functools.partial(
+            BloomDeduplicator,
+            canonicalize=canonicalize,
+            capacity=capacity,
+            error_rate=error_rate,
+        )
+
+    msg = f"Unsupported deduplicator: {name}"
     raise ValueError(msg)
 
 
 def get_exporter(filename) -> Type:
+    # Compound extensions (e.g. `.jsonl.zst`) compress the output.
+    filename, compression = split_compression(filename)
     file_type = os.path.splitext(filename)[1]
     exporter_class = EXPORT_FACTORY.get(file_type)
     if exporter_class is None:
         msg = f"Unsupported file type: {file_type}"
         raise ValueError(msg)
 
-    return exporter_class()
+    return import_object(exporter_class)(compression=compression)
 
 
-def main():
-    args = parse_args()
-
+def export(args):
     browser_class = get_browser_class(args.browser)
-    browser = browser_class(library=args.library)
 
-    records = browser.export(args.source)
-    records = format_records(records, DEFAULT_FORMATTERS)
+    checkpoint = Checkpoint(args.checkpoint) if args.checkpoint else None
+
+    cache = None
+    if args.cache and not args.no_cache:
+        os.makedirs(os.path.dirname(os.path.abspath(args.cache)), exist_ok=True)
+        cache = FormatterCache(args.cache, max_entries=args.cache_max_entries)
+
+    formatters = [
+        import_object(formatter_class)(
+            timeout=args.timeout,
+            pool_size=args.workers,
+            cache=cache,
+        )
+        for formatter_class in DEFAULT_FORMATTERS
+    ]
+
+    counts = {}
+    metrics = Metrics() if args.stats else None
+    deduplicator = get_deduplicator(
+        args.dedup,
+        capacity=args.bloom_capacity,
+        error_rate=args.bloom_error_rate,
+        canonicalize=args.canonicalize,
+    )
 
+    if args.all_profiles:
+        results = export_profiles(
+            browser_class,
+            library=args.library,
+            max_workers=args.processes,
+            checkpoint=checkpoint,
+            kinds=args.source,
+            deduplicator=deduplicator,
+            history_filters=args.history_filters,
+            raw_time=True,
+        )
+        records = merge_profiles(results)
+        if metrics is not None:
+            records = metrics.track_records("extract", records)
+    else:
+        browser_kwargs = {"library": args.library} if args.library else {}
+        browser = browser_class(**browser_kwargs)
+        records = browser.iter_export(
+            args.source,
+            checkpoint=checkpoint,
+            deduplicator=deduplicator,
+            metrics=metrics,
+            history_filters=args.history_filters,
+            raw_time=True,
+        )
+    records = format_records(records, formatters, max_workers=args.workers)
+    if metrics is not None:
+        records = metrics.track_records("format", records)
+
+    records = count_records(records, counts)
+
+    start = time.perf_counter()
     exporter = get_exporter(args.target)
-    exporter.export_to_file(records, args.target)
+    if isinstance(exporter, ArchiveExporter):
+        # Records of all profiles carry their profile.
+        exporter.browser = args.browser
+        if not args.all_profiles:
+            exporter.profile = get_profile_name(browser_class, browser)
+    if metrics is None:
+        exporter.export_stream(records, args.target)
+    else:
+        # Documents are only serialized once all records are read.
+        metrics.consume(
+            "serialize",
+            records,
+            lambda x: exporter.export_stream(x, args.target),
+            bytes_=lambda: exporter.bytes_written,
+        )
+        metrics.add(
+            "total",
+            "all",
+            rows=sum(counts.values()),
+            seconds=time.perf_counter() - start,
+            bytes_=os.path.getsize(args.target),
+        )
+
+    # Only advance the watermarks once the delta has been written.
+    if checkpoint is not None:
+        checkpoint.save()
+
+    if cache is not None:
+        cache.close()
 
     logger.info("Export statistics:")
-    for source, data in records.items():
-        if source == "cloud_tabs":
-            logger.info("%s\t%d", source, sum(len(x["tabs"]) for x in data))
-        else:
-            logger.info("%s\t%d", source, len(data))
+    for source, count in counts.items():
+        logger.info("%s\t%d", source, count)
+
+    if metrics is not None:
+        get_sink(args.stats)(metrics.report())
+
+
+def summary(args):
+    browser_class = get_browser_class(args.browser)
+    browser_kwargs = {"library": args.library} if args.library else {}
+    browser = browser_class(**browser_kwargs)
+
+    rows = browser.get_history_summary(
+        group_by=args.group_by,
+        top_n=args.top_n or None,
+        **args.history_filters,
+    )
+
+    if args.target:
+        get_exporter(args.target).export_stream([("summary", rows)], args.target)
+        return
+
+    for row in rows:
+        print(f"{row['visits']}\t{row['last_visit_time']}\t{row[args.group_by]}")
+
+
+def search(args):
+    os.makedirs(os.path.dirname(os.path.abspath(args.index)), exist_ok=True)
+    index = SearchIndex(args.index)
+    try:
+        if args.browser:
+            browser_class = get_browser_class(args.browser)
+            for name, library in browser_class.get_profiles(args.library).items():
+                counts = index.update(
+                    browser_class(library=library), args.browser, name
+                )
+                logger.info("Indexed %s/%s: %s", args.browser, name, counts)
+
+        for row in index.search(
+            " ".join(args.query),
+            limit=args.limit,
+            sources=args.source,
+        ):
+            print(f"{row['score']:.2f}\t{row['source']}\t{row['title']}\t{row['url']}")
+    finally:
+        index.close()
+
+
+def diff(args):
+    sources = args.source
+    if args.new is not None:
+        new = read_export(args.new, trust_pickle=args.trust_pickle)
+    else:
+        browser_class = get_browser_class(args.browser)
+        browser_kwargs = {"library": args.library} if args.library else {}
+        browser = browser_class(**browser_kwargs)
+
+        sources = sources or DIFF_SOURCES
+        new = iter_browser_records(browser, sources)
+
+    changes = diff_records(
+        functools.partial(read_export, args.old, trust_pickle=args.trust_pickle),
+        new,
+        sources=sources,
+    )
+
+    if args.target:
+        get_exporter(args.target).export_stream(changes, args.target)
+        return
+
+    for change, rows in changes:
+        for row in rows:
+            print(f"{change}\t{row['source']}\t{row.get('title')}\t{row['url']}")
+
+
+def main():
+    args = parse_args()
+
+    if args.command == "summary":
+        summary(args)
+    elif args.command == "search":
+        search(args)
+    elif args.command == "diff":
+        diff(args)
+    elif args.profile:
+        profiler = cProfile.Profile()
+        try:
+            profiler.runcall(export, args)
+        finally:
+            profiler.dump_stats(args.profile)
+    else:
+        export(args)
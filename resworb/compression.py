@@ -0,0 +1,61 @@
+import os
+from typing import IO, Any, Optional, Tuple
+
+# Extensions of the supported codecs, e.g. `histories.jsonl.zst`.
+COMPRESSIONS = {
+    ".gz": "gzip",
+    ".zst": "zstd",
+    ".lz4": "lz4",
+}
+
+
+def split_compression(filename: str) -> Tuple[str, Optional[str]]:
+    # The file name without the compression extension, and the codec.
+    base, extension = os.path.splitext(filename)
+    compression = COMPRESSIONS.get(extension.lower())
+    if compression is None:
+        return filename, None
+
+    return base, compression
+
+
+def open_compressed(
+    filename: str,
+    mode: str = "rb",
+    compression: Optional[str] = None,
+    **kwargs: Any,
+) -> IO:
+    # Like `open`, but (de)compresses on the fly: the uncompressed data never
+    # touches the disk. Text modes and their `encoding` are supported.
+    if compression is None:
+        # pylint: disable=unspecified-encoding
+        return open(filename, mode=mode, **kwargs)
+
+    # Unlike `open`, the codecs default to binary modes.
+    if "b" not in mode and "t" not in mode:
+        mode += "t"
+
+    # pylint: disable=import-outside-toplevel
+    if compression == "gzip":
+        import gzip
+
+        return gzip.open(filename, mode=mode, compresslevel=6, **kwargs)
+
+    if compression == "zstd":
+        import zstandard
+
+        # Compression uses all cores, `threads` has no effect on reading.
+        return zstandard.open(
+            filename,
+            mode=mode,
+            cctx=zstandard.ZstdCompressor(level=3, threads=-1),
+            **kwargs,
+        )
+
+    if compression == "lz4":
+        import lz4.frame
+
+        return lz4.frame.open(filename, mode=mode, **kwargs)
+
+    msg = f"Unsupported compression: {compression}"
+    raise ValueError(msg)
@@ -0,0 +1,84 @@
+import contextlib
+import functools
+import sqlite3
+import urllib.parse
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+from resworb import snapshot
+
+
+@functools.lru_cache(maxsize=65536)
+def url_domain(url: Optional[str]) -> Optional[str]:
+    if not url:
+        return None
+
+    try:
+        return urllib.parse.urlsplit(url).hostname
+    except ValueError:
+        return None
+
+
+class ConnectionManager:
+    def __init__(self, batch_size: int = 1000, in_memory: bool = False) -> None:
+        self.batch_size = batch_size
+        self.in_memory = in_memory
+
+        self._connections: Dict[str, sqlite3.Connection] = {}
+        self._sessions = 0
+
+    def connect(self, filename: str) -> sqlite3.Connection:
+        # Connections are only kept (and shared) while a session is active.
+        conn = self._connections.get(filename)
+        if conn is None:
+            conn = snapshot.connect(filename, in_memory=self.in_memory)
+            conn.create_function("url_domain", 1, url_domain, deterministic=True)
+            if self._sessions > 0:
+                self._connections[filename] = conn
+
+        return conn
+
+    @contextlib.contextmanager
+    def session(self) -> Iterator["ConnectionManager"]:
+        # Within the outermost session, every query of the same database reads
+        # the same snapshot. Sessions may be nested.
+        self._sessions += 1
+        try:
+            yield self
+        finally:
+            self._sessions -= 1
+            if self._sessions == 0:
+                self.close()
+
+    def query(
+        self,
+        filename: str,
+        sql: str,
+        params: Sequence[Any] = (),
+        batch_size: Optional[int] = None,
+    ) -> Iterator[Tuple]:
+        if batch_size is None:
+            batch_size = self.batch_size
+
+        with self.session():
+            cursor = self.connect(filename).execute(sql, params)
+            try:
+                rows = cursor.fetchmany(batch_size)
+                while rows:
+                    yield from rows
+                    rows = cursor.fetchmany(batch_size)
+            finally:
+                cursor.close()
+
+    def query_one(
+        self,
+        filename: str,
+        sql: str,
+        params: Sequence[Any] = (),
+    ) -> Optional[Tuple]:
+        with self.session():
+            return self.connect(filename).execute(sql, params).fetchone()
+
+    def close(self) -> None:
+        for conn in self._connections.values():
+            conn.close()
+        self._connections = {}
@@ -0,0 +1,230 @@
+import abc
+import array
+import functools
+import hashlib
+import math
+import sys
+import urllib.parse
+from typing import Iterable, Iterator
+
+from resworb.base import URLItem
+
+TRACKING_PARAMS = frozenset(
+    [
+        "fbclid",
+        "gclid",
+        "dclid",
+        "msclkid",
+        "yclid",
+        "igshid",
+        "mc_cid",
+        "mc_eid",
+        "_hsenc",
+        "_hsmi",
+        "spm",
+    ]
+)
+
+
+@functools.lru_cache(maxsize=65536)
+def canonicalize_url(url: str) -> str:
+    # Drop fragments and tracking parameters, and normalize the case of the
+    # scheme and host, so that links to the same page compare equal.
+    try:
+        parts = urllib.parse.urlsplit(url)
+    except ValueError:
+        return url
+
+    query = parts.query
+    if query:
+        params = urllib.parse.parse_qsl(query, keep_blank_values=True)
+        kept = [
+            (key, value)
+            for key, value in params
+            if not key.startswith("utm_") and key not in TRACKING_PARAMS
+        ]
+        if len(kept) < len(params):
+            query = urllib.parse.urlencode(kept)
+
+    path = parts.path
+    if not path and parts.scheme in {"http", "https"}:
+        path = "/"
+
+    return urllib.parse.urlunsplit(
+        (parts.scheme.lower(), parts.netloc.lower(), path, query, "")
+    )
+
+
+def url_digest(url: str, bits: int = 64) -> int:
+    digest = hashlib.blake2b(
+        url.encode("utf-8", errors="surrogatepass"),
+        digest_size=bits // 8,
+    ).digest()
+
+    return int.from_bytes(digest, "big")
+
+
+class Deduplicator(metaclass=abc.ABCMeta):
+    # Urls are matched exactly unless `canonicalize`, which is much slower.
+    def __init__(self, canonicalize: bool = False) -> None:
+        self.canonicalize = canonicalize
+
+    def __call__(self, items: Iterable[URLItem]) -> Iterator[URLItem]:
+        add = self.add
+        if not self.canonicalize:
+            for x in items:
+                if add(x["url"]):
+                    yield x
+            return
+
+        for x in items:
+            if add(canonicalize_url(x["url"])):
+                yield x
+
+    @abc.abstractmethod
+    def add(self, url: str) -> bool:
+        # Returns whether the url was not seen before.
+        raise NotImplementedError
+
+
+class ExactDeduplicator(Deduplicator):
+    def __init__(self, canonicalize: bool = False) -> None:
+        super().__init__(canonicalize=canonicalize)
+
+        self.seen = set()
+
+    def add(self, url: str) -> bool:
+        if url in self.seen:
+            return False
+
+        self.seen.add(url)
+
+        return True
+
+
+class DigestDeduplicator(Deduplicator):
+    # Keeps fixed width digests instead of the urls, in an open addressing
+    # table packed in an array: 8 (or 16) bytes a slot, at most half of them
+    # used. With 64 bits collisions are negligible below billions of urls.
+    min_slots = 1024
+
+    def __init__(self, canonicalize: bool = False, bits: int = 64) -> None:
+        super().__init__(canonicalize=canonicalize)
+
+        if bits not in {64, 128}:
+            msg = f"Unsupported digest size: {bits}"
+            raise ValueError(msg)
+
+        self.bits = bits
+        self.width = bits // 64
+        self.size = 0
+        self.num_slots = self.min_slots
+        self.table = array.array("Q", [0]) * (self.width * self.num_slots)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def digest(self, url: str) -> int:
+        # Digests only have to agree within the process: 64 bits ones are the
+        # (keyed, SipHash) hash of the url, which is much faster than blake2b.
+        # Digests are never zero, which marks empty slots.
+        if self.bits <= sys.hash_info.width:
+            return hash(url) & 0xFFFFFFFFFFFFFFFF or 1
+
+        return url_digest(url, bits=self.bits) or 1
+
+    def _insert(self, table: array.array, num_slots: int, digest: int) -> bool:
+        # Digests are uniform, their low bits are the slot.
+        mask = num_slots - 1
+        i = digest & mask
+        if self.width == 1:
+            while True:
+                value = table[i]
+                if value == digest:
+                    return False
+
+                if not value:
+                    table[i] = digest
+                    return True
+
+                i = (i + 1) & mask
+
+        high, low = digest >> 64, digest & 0xFFFFFFFFFFFFFFFF
+        while True:
+            j = 2 * i
+            if table[j] == high and table[j + 1] == low:
+                return False
+
+            if not table[j] and not table[j + 1]:
+                table[j], table[j + 1] = high, low
+                return True
+
+            i = (i + 1) & mask
+
+    def _grow(self) -> None:
+        num_slots = 2 * self.num_slots
+        table = array.array("Q", [0]) * (self.width * num_slots)
+        if self.width == 1:
+            for value in self.table:
+                if value:
+                    self._insert(table, num_slots, value)
+        else:
+            values = iter(self.table)
+            for high, low in zip(values, values):
+                if high or low:
+                    self._insert(table, num_slots, high << 64 | low)
+
+        self.table, self.num_slots = table, num_slots
+
+    def add(self, url: str) -> bool:
+        if not self._insert(self.table, self.num_slots, self.digest(url)):
+            return False
+
+        self.size += 1
+        if 2 * self.size > self.num_slots:
+            self._grow()
+
+        return True
+
+
+class BloomDeduplicator(Deduplicator):
+    # Approximate deduplication in constant memory: a new url is dropped as a
+    # duplicate with probability `error_rate` once `capacity` urls are seen.
+    def __init__(
+        self,
+        canonicalize: bool = False,
+        capacity: int = 1000000,
+        error_rate: float = 0.001,
+    ) -> None:
+        super().__init__(canonicalize=canonicalize)
+
+        if capacity <= 0:
+            msg = f"Invalid capacity: {capacity}"
+            raise ValueError(msg)
+
+        if not 0 < error_rate < 1:
+            msg = f"Invalid error rate: {error_rate}"
+            raise ValueError(msg)
+
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(
+            8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        )
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def add(self, url: str) -> bool:
+        # Double hashing from the two halves of a 128 bits digest.
+        digest = url_digest(url, bits=128)
+        h1, h2 = digest >> 64, digest & 0xFFFFFFFFFFFFFFFF
+
+        new = False
+        for i in range(self.num_hashes):
+            position = (h1 + i * h2) % self.num_bits
+            byte, mask = position >> 3, 1 << (position & 7)
+            if not self.bits[byte] & mask:
+                self.bits[byte] |= mask
+                new = True
+
+        return new
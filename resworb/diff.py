@@ -0,0 +1,142 @@
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from resworb.base import Record, to_dict
+from resworb.dedup import url_digest
+from resworb.exporter import _parse_timestamp
+
+# Sources compared with a live browser by default.
+DIFF_SOURCES = ["cloud_tabs", "readings", "bookmarks"]
+
+# Besides the url, these fields identify a record of a source, other fields
+# can change. Profiles are left out so that exports with and without them
+# (e.g. archives and single profile exports) compare.
+KEY_FIELDS = {
+    "bookmarks": ("folders",),
+    "cloud_tabs": ("device_id",),
+    "histories": ("visit_time",),
+}
+CONTENT_FIELDS = ("title", "device_name")
+
+Records = Iterable[Tuple[str, Any]]
+
+
+def iter_records(records: Iterable[Tuple[str, Iterable]]) -> Iterator[Tuple[str, Any]]:
+    # (source, items) pairs of `iter_export` to (source, record) pairs.
+    for source, items in records:
+        for item in items:
+            yield source, item
+
+
+def iter_browser_records(
+    browser: Any, kinds: Iterable[str]
+) -> Iterator[Tuple[str, Any]]:
+    # Records of a live browser, sources it doesn't support are skipped.
+    for kind in kinds:
+        try:
+            yield from iter_records(browser.iter_export(kind, raw_time=True))
+        except NotImplementedError:
+            continue
+
+
+def _flatten(
+    records: Records,
+    sources: Optional[Iterable[str]],
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    # Plain dicts, cloud tab devices are expanded to their tabs.
+    for source, item in records:
+        if sources is not None and source not in sources:
+            continue
+
+        item = to_dict(item) if isinstance(item, Record) else dict(item)
+        if source == "cloud_tabs" and "tabs" in item:
+            device = {"device_id": item.get("id"), "device_name": item.get("name")}
+            if "profile" in item:
+                device["profile"] = item["profile"]
+
+            for tab in item["tabs"]:
+                yield source, {**to_dict(tab), **device}
+
+        else:
+            if "visit_time" in item:
+                item["visit_time"] = _parse_timestamp(item["visit_time"])
+
+            yield source, item
+
+
+def record_key(source: str, row: Dict[str, Any]) -> int:
+    parts = [source, row.get("url") or ""]
+    for field in KEY_FIELDS.get(source, ()):
+        value = row.get(field)
+        if field == "visit_time" and isinstance(value, int):
+            # Text timestamps only keep the seconds.
+            value //= 1000000
+        elif field == "folders":
+            value = "\x1f".join(value or ())
+        parts += [str(value)]
+
+    return url_digest("\0".join(parts), bits=128)
+
+
+def _content_digest(row: Dict[str, Any]) -> int:
+    return url_digest("\0".join(str(row.get(x)) for x in CONTENT_FIELDS))
+
+
+def diff_records(
+    old: Callable[[], Records],
+    new: Records,
+    sources: Optional[Iterable[str]] = None,
+) -> Iterator[Tuple[str, Iterator[Dict[str, Any]]]]:
+    # Yields the "added", "removed" and "changed" records, each tagged with
+    # its change and source. Only digests of the old records are kept: `old`
+    # is read twice (it returns a new iterator), once to index them and once
+    # to emit the removed and changed ones after `new` has been read. The
+    # streams have to be consumed in order.
+    if sources is not None:
+        sources = set(sources)
+
+    # Matched (or added) keys are set to `None`, those left are removed.
+    digests: Dict[int, Optional[int]] = {}
+    for source, row in _flatten(old(), sources):
+        digests[record_key(source, row)] = _content_digest(row)
+
+    changes: Dict[int, Dict[str, Any]] = {}
+    changed: List[Dict[str, Any]] = []
+
+    def _added():
+        for source, row in _flatten(new, sources):
+            key = record_key(source, row)
+            if key not in digests:
+                digests[key] = None
+                yield {"change": "added", "source": source, **row}
+                continue
+
+            digest = digests[key]
+            if digest is not None and digest != _content_digest(row):
+                changes[key] = {x: row.get(x) for x in CONTENT_FIELDS if x in row}
+            digests[key] = None
+
+    def _removed():
+        # Changed records are collected on the way, they are few.
+        for source, row in _flatten(old(), sources):
+            key = record_key(source, row)
+            if digests.get(key) is not None:
+                digests[key] = None
+                yield {"change": "removed", "source": source, **row}
+            elif key in changes:
+                values = changes.pop(key)
+                changed.append(
+                    {
+                        "change": "changed",
+                        "source": source,
+                        **row,
+                        **values,
+                        "previous": {x: row.get(x) for x in values},
+                    }
+                )
+
+    def _changed():
+        yield from changed
+
+    yield "added", _added()
+    yield "removed", _removed()
+    yield "changed", _changed()
@@ -1,12 +1,42 @@
 import abc
+import datetime
+import functools
+import io
+import itertools
 import json
+import os
 import pickle
-from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Union
+import struct
+import time
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    Union,
+)
 
-import pytoml
-import yaml
+from resworb.base import URLItem, replace_item, to_builtin, to_dict
+from resworb.checkpoint import Checkpoint
+from resworb.compression import open_compressed
+from resworb.connection import ConnectionManager
+from resworb.dedup import Deduplicator, ExactDeduplicator
+from resworb.metrics import Metrics
 
-from resworb.base import URLItem
+
+def _peek(items: Iterator) -> Iterator:
+    # Reads the first item ahead, so that getters failing lazily (e.g.
+    # generators of unsupported sources) fail here.
+    for first in items:
+        return itertools.chain([first], items)
+
+    return iter(())
 
 
 class ExportMixin:
@@ -15,56 +45,277 @@ class ExportMixin:
     get_readings: Callable
     get_bookmarks: Callable
     get_histories: Callable
+    get_history_watermark: Callable
+    history_file: str
+    connections: ConnectionManager
 
-    def _deduplicate(self, items: Iterable[URLItem]) -> Iterable[URLItem]:
+    def _deduplicate(
+        self,
+        items: Iterable[URLItem],
+        deduplicator: Optional[Callable[[], Deduplicator]] = None,
+    ) -> Iterable[URLItem]:
         # pylint: disable=no-self-use
 
-        processed = set()
-        for x in items:
-            if x["url"] not in processed:
-                processed.add(x["url"])
-                yield x
+        if deduplicator is None:
+            deduplicator = ExactDeduplicator
 
-    def export(
+        return deduplicator()(items)
+
+    def _get_checkpoint_profile(self) -> str:
+        return f"{type(self).__name__}:{os.path.abspath(self.history_file)}"
+
+    def iter_export(
         self,
         kinds: Union[str, Iterable[str]] = "all",
         drop_duplicates: bool = True,
-    ) -> Dict[str, List]:
-        def _wrapper(name, f):
-            if drop_duplicates:
-                if name == "cloud_tabs":
-                    return [
-                        {
-                            key: list(self._deduplicate(value))
-                            if key == "tabs"
-                            else value
-                            for key, value in result.items()
-                        }
-                        for result in f()
-                    ]
-
-                return self._deduplicate(f())
-
-            return f()
+        checkpoint: Optional[Checkpoint] = None,
+        deduplicator: Optional[Callable[[], Deduplicator]] = None,
+        metrics: Optional[Metrics] = None,
+        history_filters: Optional[Mapping[str, Any]] = None,
+        raw_time: bool = False,
+    ) -> Iterator[Tuple[str, Iterator]]:
+        # `history_filters` are passed to `get_histories`, e.g. `since`,
+        # `domain` or `limit`. They cannot advance a checkpoint, since the
+        # filtered out visits would never be exported.
+        if history_filters is None:
+            history_filters = {}
+
+        if history_filters and checkpoint is not None:
+            msg = "History filters cannot be used with a checkpoint."
+            raise ValueError(msg)
+
+        def _get_cloud_tabs():
+            # Devices are few, only their tabs are deduplicated and collected.
+            for device in self.get_cloud_tabs():
+                tabs = device["tabs"]
+                if drop_duplicates:
+                    tabs = self._deduplicate(tabs, deduplicator)
+
+                yield replace_item(device, tabs=list(tabs))
+
+        def _get_histories():
+            if checkpoint is None:
+                yield from self.get_histories(raw_time=raw_time, **history_filters)
+                return
+
+            # Only emit visits newer than the last exported one. The upper
+            # bound is taken before reading so that visits written by the
+            # browser during the export are left for the next run.
+            profile = self._get_checkpoint_profile()
+            watermark = self.get_history_watermark()
+
+            yield from self.get_histories(
+                after=checkpoint.get(profile, "histories"),
+                upto=watermark,
+                raw_time=raw_time,
+            )
+
+            if watermark is not None:
+                checkpoint.update(profile, "histories", watermark)
 
         factory = {
             "opened_tabs": self.get_opened_tabs,
-            "cloud_tabs": self.get_cloud_tabs,
+            "cloud_tabs": _get_cloud_tabs,
             "readings": self.get_readings,
             "bookmarks": self.get_bookmarks,
-            "histories": self.get_histories,
+            "histories": _get_histories,
         }
+        # Sources the browser doesn't implement are skipped for "all" only.
+        skip_unsupported = kinds == "all"
         if kinds == "all":
-            return {k: list(_wrapper(k, v)) for k, v in factory.items()}
+            kinds = list(factory)
 
         if isinstance(kinds, str):
             kinds = [kinds]
 
-        return {kind: list(_wrapper(kind, factory[kind])) for kind in kinds}
+        # All sources of one export read the same state of the databases.
+        with self.connections.session():
+            for kind in kinds:
+                try:
+                    records = _peek(iter(factory[kind]()))
+                except NotImplementedError:
+                    if not skip_unsupported:
+                        raise
+                    continue
+
+                if metrics is not None:
+                    records = metrics.track("extract", kind, records)
+
+                if drop_duplicates and kind != "cloud_tabs":
+                    records = self._deduplicate(records, deduplicator)
+                    if metrics is not None:
+                        records = metrics.track("dedup", kind, records)
+
+                yield kind, records
+
+    def export(
+        self,
+        kinds: Union[str, Iterable[str]] = "all",
+        drop_duplicates: bool = True,
+        checkpoint: Optional[Checkpoint] = None,
+        deduplicator: Optional[Callable[[], Deduplicator]] = None,
+        metrics: Optional[Metrics] = None,
+        history_filters: Optional[Mapping[str, Any]] = None,
+        raw_time: bool = False,
+    ) -> Dict[str, List]:
+        return {
+            kind: list(records)
+            for kind, records in self.iter_export(
+                kinds,
+                drop_duplicates=drop_duplicates,
+                checkpoint=checkpoint,
+                deduplicator=deduplicator,
+                metrics=metrics,
+                history_filters=history_filters,
+                raw_time=raw_time,
+            )
+        }
+
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# MessagePack exports: the magic, then frames of a header (length of the
+# source name, number of records, length of the payload), the source name and
+# the payload, an array of the records. See `resworb.reader`.
+MSGPACK_MAGIC = b"RESWORB\x01"
+MSGPACK_FRAME = struct.Struct("<HIQ")
+
+
+def format_timestamps(values: List[Any]) -> List[Any]:
+    # Epoch microseconds to local time strings, other values are kept. Each
+    # second of the batch is only formatted once.
+    formatted = {}
+    results = []
+    for value in values:
+        if isinstance(value, int):
+            seconds = value // 1000000
+            text = formatted.get(seconds)
+            if text is None:
+                text = time.strftime(TIME_FORMAT, time.localtime(seconds))
+                formatted[seconds] = text
+            value = text
+        results += [value]
+
+    return results
+
+
+def _parse_timestamp(value: Any) -> Any:
+    # Local time strings to epoch microseconds, other values are kept.
+    if isinstance(value, str):
+        # `TIME_FORMAT` is ISO 8601, which is parsed much faster than strptime.
+        return int(datetime.datetime.fromisoformat(value).timestamp() * 1000000)
+
+    return value
+
+
+class CountingWriter(io.BufferedIOBase):
+    # A binary file counting the bytes written to it, e.g. before they are
+    # compressed.
+    def __init__(self, raw: IO[bytes]) -> None:
+        super().__init__()
+        self.raw = raw
+        self.written = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: Any) -> int:
+        self.raw.write(data)
+        size = memoryview(data).nbytes
+        self.written += size
+
+        return size
+
+    def flush(self) -> None:
+        self.raw.flush()
+
+    def tell(self) -> int:
+        return self.raw.tell()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+
+        try:
+            super().close()
+        finally:
+            self.raw.close()
 
 
 class Exporter(metaclass=abc.ABCMeta):
-    @abc.abstractmethod
+    # Whether raw timestamps (epoch microseconds) are written as text.
+    text_timestamps = True
+    timestamp_batch_size = 4096
+
+    def __init__(self, compression: Optional[str] = None) -> None:
+        # Output is compressed while written, see `resworb.compression`.
+        self.compression = compression
+
+        self._writer: Optional[CountingWriter] = None
+
+    @property
+    def bytes_written(self) -> Optional[int]:
+        # Bytes written by the last export (before compression), if it wrote
+        # through `_open`.
+        if self._writer is None:
+            return None
+
+        return self._writer.written
+
+    def _open(self, filename: str, mode: str = "wb", **kwargs: Any) -> IO:
+        # Text is encoded on top of the counter, so that bytes are counted.
+        text_kwargs = {
+            key: kwargs.pop(key)
+            for key in ["encoding", "errors", "newline"]
+            if key in kwargs
+        }
+        binary = "b" in mode
+        mode = mode.replace("t", "") if binary else mode.replace("t", "") + "b"
+
+        self._writer = CountingWriter(
+            open_compressed(filename, mode=mode, compression=self.compression, **kwargs)
+        )
+        if binary:
+            return self._writer
+
+        return io.TextIOWrapper(self._writer, **text_kwargs)
+
+    def _prepare_records(
+        self,
+        records: Iterable[Tuple[str, Iterable]],
+    ) -> Iterator[Tuple[str, Iterator]]:
+        # Records become plain dicts here, with text timestamps if needed.
+        def _prepare(items):
+            items = iter(items)
+            batch = list(itertools.islice(items, self.timestamp_batch_size))
+            while batch:
+                batch = [to_dict(x) for x in batch]
+                if self.text_timestamps:
+                    texts = format_timestamps([x.get("visit_time") for x in batch])
+                    for item, text in zip(batch, texts):
+                        if "visit_time" in item:
+                            item["visit_time"] = text
+
+                yield from batch
+
+                batch = list(itertools.islice(items, self.timestamp_batch_size))
+
+        for source, items in records:
+            yield source, _prepare(items)
+
+    def _collect(self, records: Iterable[Tuple[str, Iterable]]) -> Dict[str, List]:
+        return {source: list(items) for source, items in self._prepare_records(records)}
+
+    def _write(
+        self,
+        data: Dict[str, List],
+        filename: str,
+        file_kwargs: Optional[Mapping] = None,
+        dump_kwargs: Optional[Mapping] = None,
+    ) -> None:
+        # Writes the prepared records of all sources as one document.
+        raise NotImplementedError
+
     def export_to_file(
         self,
         data: Any,
@@ -72,10 +323,33 @@ class Exporter(metaclass=abc.ABCMeta):
         file_kwargs: Optional[Mapping] = None,
         dump_kwargs: Optional[Mapping] = None,
     ) -> None:
-        raise NotImplementedError
+        self._write(
+            self._collect(data.items()),
+            filename,
+            file_kwargs=file_kwargs,
+            dump_kwargs=dump_kwargs,
+        )
 
+    def export_stream(
+        self,
+        records: Iterable[Tuple[str, Iterable]],
+        filename: str,
+        file_kwargs: Optional[Mapping] = None,
+        dump_kwargs: Optional[Mapping] = None,
+    ) -> None:
+        # Document formats need the whole tree at once, other formats are
+        # `StreamingExporter`s.
+        self._write(
+            self._collect(records),
+            filename,
+            file_kwargs=file_kwargs,
+            dump_kwargs=dump_kwargs,
+        )
 
-class YAMLExporter(Exporter):
+
+class StreamingExporter(Exporter):
+    # Records are written as they are read, exporting a dict streams its
+    # items.
     def export_to_file(
         self,
         data: Any,
@@ -83,6 +357,49 @@ class YAMLExporter(Exporter):
         file_kwargs: Optional[Mapping] = None,
         dump_kwargs: Optional[Mapping] = None,
     ) -> None:
+        self.export_stream(
+            data.items(),
+            filename,
+            file_kwargs=file_kwargs,
+            dump_kwargs=dump_kwargs,
+        )
+
+    @abc.abstractmethod
+    def export_stream(
+        self,
+        records: Iterable[Tuple[str, Iterable]],
+        filename: str,
+        file_kwargs: Optional[Mapping] = None,
+        dump_kwargs: Optional[Mapping] = None,
+    ) -> None:
+        raise NotImplementedError
+
+
+@functools.lru_cache(maxsize=None)
+def _get_yaml_dumper():
+    # pylint: disable=import-outside-toplevel
+    import yaml
+
+    class _SafeDumper(yaml.SafeDumper):
+        # pylint: disable=too-many-ancestors
+
+        def ignore_aliases(self, data: Any) -> bool:
+            return True
+
+    return _SafeDumper
+
+
+class YAMLExporter(Exporter):
+    def _write(
+        self,
+        data: Dict[str, List],
+        filename: str,
+        file_kwargs: Optional[Mapping] = None,
+        dump_kwargs: Optional[Mapping] = None,
+    ) -> None:
+        # pylint: disable=import-outside-toplevel
+        import yaml
+
         if not file_kwargs:
             file_kwargs = {
                 "mode": "w",
@@ -96,18 +413,23 @@ class YAMLExporter(Exporter):
                 "indent": 2,
             }
 
-        with open(filename, **file_kwargs) as f:  # pylint: disable=unspecified-encoding
-            yaml.safe_dump(data, f, **dump_kwargs)
+        with self._open(filename, **file_kwargs) as f:
+            # Records may share objects (e.g. folder paths), don't emit them
+            # as anchors and aliases.
+            yaml.dump(data, f, Dumper=_get_yaml_dumper(), **dump_kwargs)
 
 
 class TOMLExporter(Exporter):
-    def export_to_file(
+    def _write(
         self,
-        data: Any,
+        data: Dict[str, List],
         filename: str,
         file_kwargs: Optional[Mapping] = None,
         dump_kwargs: Optional[Mapping] = None,
     ) -> None:
+        # pylint: disable=import-outside-toplevel
+        import pytoml
+
         if not file_kwargs:
             file_kwargs = {
                 "mode": "w",
@@ -117,14 +439,14 @@ class TOMLExporter(Exporter):
         if not dump_kwargs:
             dump_kwargs = {}
 
-        with open(filename, **file_kwargs) as f:  # pylint: disable=unspecified-encoding
-            pytoml.dump(data, f, **dump_kwargs)
+        with self._open(filename, **file_kwargs) as f:
+            pytoml.dump(to_builtin(data), f, **dump_kwargs)
 
 
 class JSONExporter(Exporter):
-    def export_to_file(
+    def _write(
         self,
-        data: Any,
+        data: Dict[str, List],
         filename: str,
         file_kwargs: Optional[Mapping] = None,
         dump_kwargs: Optional[Mapping] = None,
@@ -141,14 +463,14 @@ class JSONExporter(Exporter):
                 "indent": 4,
             }
 
-        with open(filename, **file_kwargs) as f:  # pylint: disable=unspecified-encoding
+        with self._open(filename, **file_kwargs) as f:
             json.dump(data, f, **dump_kwargs)
 
 
 class PickleExporter(Exporter):
-    def export_to_file(
+    def _write(
         self,
-        data: Any,
+        data: Dict[str, List],
         filename: str,
         file_kwargs: Optional[Mapping] = None,
         dump_kwargs: Optional[Mapping] = None,
@@ -159,5 +481,195 @@ class PickleExporter(Exporter):
         if not dump_kwargs:
             dump_kwargs = {}
 
-        with open(filename, **file_kwargs) as f:  # pylint: disable=unspecified-encoding
+        with self._open(filename, **file_kwargs) as f:
             pickle.dump(data, f, **dump_kwargs)
+
+
+class JSONLinesExporter(StreamingExporter):
+    def export_stream(
+        self,
+        records: Iterable[Tuple[str, Iterable]],
+        filename: str,
+        file_kwargs: Optional[Mapping] = None,
+        dump_kwargs: Optional[Mapping] = None,
+    ) -> None:
+        if not file_kwargs:
+            file_kwargs = {
+                "mode": "w",
+                "encoding": "utf-8",
+            }
+
+        if not dump_kwargs:
+            dump_kwargs = {
+                "ensure_ascii": False,
+            }
+
+        with self._open(filename, **file_kwargs) as f:
+            for source, items in self._prepare_records(records):
+                for item in items:
+                    f.write(json.dumps({"source": source, **item}, **dump_kwargs))
+                    f.write("\n")
+
+
+class MessagePackExporter(StreamingExporter):
+    # Records are written in frames of at most `chunk_size` records of one
+    # source, so that readers can skip the sources they don't need.
+    chunk_size = 4096
+    text_timestamps = False
+
+    def export_stream(
+        self,
+        records: Iterable[Tuple[str, Iterable]],
+        filename: str,
+        file_kwargs: Optional[Mapping] = None,
+        dump_kwargs: Optional[Mapping] = None,
+    ) -> None:
+        # pylint: disable=import-outside-toplevel
+        import msgpack
+
+        if not file_kwargs:
+            file_kwargs = {"mode": "wb"}
+
+        if not dump_kwargs:
+            dump_kwargs = {}
+
+        packer = msgpack.Packer(autoreset=False, **dump_kwargs)
+        with self._open(filename, **file_kwargs) as f:
+            f.write(MSGPACK_MAGIC)
+            for source, items in self._prepare_records(records):
+                name = source.encode("utf-8")
+                chunk = list(itertools.islice(items, self.chunk_size))
+                while chunk:
+                    packer.pack_array_header(len(chunk))
+                    for item in chunk:
+                        packer.pack(item)
+                    payload = packer.getbuffer()
+
+                    f.write(MSGPACK_FRAME.pack(len(name), len(chunk), len(payload)))
+                    f.write(name)
+                    f.write(payload)
+
+                    del payload
+                    packer.reset()
+                    chunk = list(itertools.islice(items, self.chunk_size))
+
+
+class _ArrowExporter(StreamingExporter):
+    # Records of all sources are flattened into one table, one row per url
+    # (cloud tabs are expanded with their device).
+    chunk_size = 65536
+    text_timestamps = False
+
+    def _get_schema(self, pa):
+        # pylint: disable=no-self-use
+
+        string = pa.dictionary(pa.int32(), pa.string())
+
+        return pa.schema(
+            [
+                ("source", string),
+                ("id", pa.int64()),
+                ("url", string),
+                ("title", string),
+                ("visit_time", pa.timestamp("us", tz="UTC")),
+                ("folders", pa.list_(pa.string())),
+                ("device_id", string),
+                ("device_name", string),
+                ("profile", string),
+            ]
+        )
+
+    def _get_columns(self, records, names):
+        columns = {name: [] for name in names}
+        for source, items in records:
+            for item in items:
+                if source == "cloud_tabs":
+                    rows = [(tab, item) for tab in item["tabs"]]
+                else:
+                    rows = [(item, None)]
+
+                for row, device in rows:
+                    columns["source"] += [source]
+                    columns["id"] += [row.get("id")]
+                    columns["url"] += [row.get("url")]
+                    columns["title"] += [row.get("title")]
+                    columns["visit_time"] += [row.get("visit_time")]
+                    columns["folders"] += [row.get("folders")]
+                    columns["device_id"] += [device["id"] if device else None]
+                    columns["device_name"] += [device["name"] if device else None]
+                    columns["profile"] += [item.get("profile")]
+
+                if len(columns["source"]) >= self.chunk_size:
+                    yield columns
+                    columns = {name: [] for name in names}
+
+        if columns["source"]:
+            yield columns
+
+    def _get_batches(self, records, pa, schema):
+        for columns in self._get_columns(records, schema.names):
+            arrays = []
+            for field in schema:
+                values = columns[field.name]
+                if field.name == "visit_time":
+                    # Local time strings of `raw_time=False` are converted too.
+                    values = [_parse_timestamp(x) for x in values]
+                    array = pa.array(values, pa.int64()).cast(field.type)
+                elif pa.types.is_dictionary(field.type):
+                    array = pa.array(values, pa.string()).dictionary_encode()
+                else:
+                    array = pa.array(values, field.type)
+
+                arrays += [array]
+
+            yield pa.record_batch(arrays, schema=schema)
+
+    @abc.abstractmethod
+    def _open_writer(self, f, schema, dump_kwargs):
+        raise NotImplementedError
+
+    def export_stream(
+        self,
+        records: Iterable[Tuple[str, Iterable]],
+        filename: str,
+        file_kwargs: Optional[Mapping] = None,
+        dump_kwargs: Optional[Mapping] = None,
+    ) -> None:
+        # pylint: disable=import-outside-toplevel
+        import pyarrow as pa
+
+        if not file_kwargs:
+            file_kwargs = {"mode": "wb"}
+
+        schema = self._get_schema(pa)
+        with self._open(filename, **file_kwargs) as f:
+            writer = self._open_writer(f, schema, dump_kwargs)
+            try:
+                for batch in self._get_batches(records, pa, schema):
+                    writer.write_batch(batch)
+            finally:
+                writer.close()
+
+
+class ParquetExporter(_ArrowExporter):
+    def _open_writer(self, f, schema, dump_kwargs):
+        # pylint: disable=import-outside-toplevel
+        import pyarrow.parquet as pq
+
+        if not dump_kwargs:
+            dump_kwargs = {"compression": "zstd"}
+
+        return pq.ParquetWriter(f, schema, **dump_kwargs)
+
+
+class ArrowExporter(_ArrowExporter):
+    # Arrow IPC streaming format: unlike the file format, it allows every
+    # batch to carry its own dictionaries.
+    def _open_writer(self, f, schema, dump_kwargs):
+        # pylint: disable=import-outside-toplevel
+        import pyarrow as pa
+
+        if not dump_kwargs:
+            dump_kwargs = {}
+
+        return pa.ipc.new_stream(f, schema, **dump_kwargs)
@@ -0,0 +1,19 @@
+import os
+import tempfile
+from typing import IO, Callable
+
+
+def write_atomic(filename: str, write: Callable[[IO[str]], None]) -> None:
+    # Writes to a temp file next to `filename` and then replaces it, so that
+    # readers (and interrupted runs) never see a partial file.
+    dirname = os.path.dirname(os.path.abspath(filename))
+    os.makedirs(dirname, exist_ok=True)
+
+    fd, temp = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode="w", encoding="utf-8") as f:
+            write(f)
+        os.replace(temp, filename)
+    except BaseException:
+        os.remove(temp)
+        raise
@@ -1,18 +1,196 @@
 import abc
-import urllib.request
+import collections
+import concurrent.futures
+import io
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
-import lxml.html
+from resworb.base import URLItem, replace_item
 
-from resworb.base import URLItem
+if TYPE_CHECKING:
+    import requests
+
+logger = logging.getLogger(__name__)
+
+
+class FormatterCache:
+    def __init__(
+        self,
+        filename: str,
+        ttl: Optional[float] = 30 * 24 * 3600,
+        negative_ttl: Optional[float] = 24 * 3600,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ) -> None:
+        self.filename = filename
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        # Formatters may be called from the threads of `FormatterRunner`.
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            filename,
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self.conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS cache (
+                namespace TEXT NOT NULL,
+                url TEXT NOT NULL,
+                value TEXT,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL,
+                PRIMARY KEY (namespace, url)
+            );
+            CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+            """)
+        self.purge()
+
+    def get(self, namespace: str, url: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        # Returns whether the url is cached, and the cached value which is
+        # `None` for failures.
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value, created FROM cache WHERE namespace = ? AND url = ?",
+                (namespace, url),
+            ).fetchone()
+            if row is None:
+                return False, None
+
+            value, created = row
+            now = time.time()
+            ttl = self.ttl if value is not None else self.negative_ttl
+            if ttl is not None and created + ttl < now:
+                return False, None
+
+            self.conn.execute(
+                "UPDATE cache SET accessed = ? WHERE namespace = ? AND url = ?",
+                (now, namespace, url),
+            )
+
+            return True, json.loads(value) if value is not None else None
+
+    def set(self, namespace: str, url: str, value: Optional[Dict[str, Any]]) -> None:
+        data = json.dumps(value, ensure_ascii=False) if value is not None else None
+        size = len(url) + (len(data) if data is not None else 0)
+        now = time.time()
+
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?)",
+                (namespace, url, data, size, now, now),
+            )
+            self._evict()
+
+    def purge(self) -> None:
+        # Expired entries are never read again, drop them and the ones beyond
+        # the limits (e.g. lowered since the cache was written).
+        now = time.time()
+        with self.lock:
+            for ttl, condition in [
+                (self.ttl, "value IS NOT NULL"),
+                (self.negative_ttl, "value IS NULL"),
+            ]:
+                if ttl is not None:
+                    self.conn.execute(
+                        f"DELETE FROM cache WHERE {condition} AND created + ? < ?",
+                        (ttl, now),
+                    )
+            self._evict()
+
+    def _evict(self) -> None:
+        if self.max_entries is None and self.max_bytes is None:
+            return
+
+        entries, size = self.conn.execute(
+            "SELECT COUNT(*), TOTAL(size) FROM cache"
+        ).fetchone()
+
+        # Drop the least recently used entries beyond either limit.
+        if self.max_entries is not None and entries > self.max_entries:
+            self.conn.execute(
+                """
+                DELETE FROM cache WHERE rowid IN (
+                    SELECT rowid FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+        if self.max_bytes is not None and size > self.max_bytes:
+            self.conn.execute(
+                """
+                DELETE FROM cache WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, SUM(size) OVER (ORDER BY accessed DESC) AS total
+                        FROM cache
+                    ) WHERE total > ?
+                )
+                """,
+                (self.max_bytes,),
+            )
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
 
 
 class Formatter(metaclass=abc.ABCMeta):
+    cache: Optional[FormatterCache] = None
+
     def __call__(self, item: URLItem) -> URLItem:
         if self.match(item):
-            return self.format(item)
+            if self.cache is not None:
+                return self._format_cached(item)
+
+            try:
+                return self.format(item)
+            except Exception as e:  # pylint: disable=broad-except
+                # Failures (e.g. timeouts) keep the record as it is.
+                logger.warning("Failed to format %s: %s", item["url"], e)
 
         return item
 
+    def _format_cached(self, item: URLItem) -> URLItem:
+        namespace = type(self).__name__
+
+        found, changes = self.cache.get(namespace, item["url"])
+        if found:
+            return replace_item(item, **changes) if changes is not None else item
+
+        try:
+            formatted = self.format(item)
+        except Exception as e:  # pylint: disable=broad-except
+            # Remember the failure so that it is not retried until it expires.
+            logger.warning("Failed to format %s: %s", item["url"], e)
+            self.cache.set(namespace, item["url"], None)
+
+            return item
+
+        # Only fields changed by the formatter are cached, others (e.g. visit
+        # times) vary between records of the same url.
+        changes = {k: v for k, v in formatted.items() if item.get(k) != v}
+        self.cache.set(namespace, item["url"], changes)
+
+        return formatted
+
     def match(self, item: URLItem) -> bool:
         raise NotImplementedError
 
@@ -20,14 +198,113 @@ class Formatter(metaclass=abc.ABCMeta):
         raise NotImplementedError
 
 
-class WeixinFormatter(Formatter):
+class HTTPFormatter(Formatter):
+    def __init__(
+        self,
+        session: Optional["requests.Session"] = None,
+        timeout: Optional[float] = 10.0,
+        pool_size: int = 10,
+        cache: Optional[FormatterCache] = None,
+    ) -> None:
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.cache = cache
+
+        # The session (and `requests`) is only created once a url matches.
+        self._session = session
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self) -> "requests.Session":
+        # pylint: disable=import-outside-toplevel
+        with self._session_lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                # Keep up to `pool_size` alive connections per host so that
+                # concurrent fetches against the same site reuse them.
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=self.pool_size,
+                    pool_maxsize=self.pool_size,
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+
+            return self._session
+
+    def fetch(self, url: str) -> bytes:
+        response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+
+        return response.content
+
+
+class WeixinFormatter(HTTPFormatter):
     def match(self, item: URLItem) -> bool:
         return item["url"].startswith("https://mp.weixin.qq.com")
 
     def format(self, item: URLItem) -> URLItem:
-        with urllib.request.urlopen(item["url"]) as io:
-            parsed = lxml.html.parse(io)
-            match = parsed.find("//h1[@class='rich_media_title']")
-            title = match.text.strip() if match is not None else item["title"]
+        # pylint: disable=import-outside-toplevel
+        import lxml.html
+
+        parsed = lxml.html.parse(io.BytesIO(self.fetch(item["url"])))
+        match = parsed.find(".//h1[@class='rich_media_title']")
+        title = match.text.strip() if match is not None else item["title"]
+
+        return replace_item(item, title=title)
+
+
+class FormatterRunner:
+    def __init__(
+        self,
+        formatters: Sequence[Formatter],
+        max_workers: int = 8,
+        prefetch: Optional[int] = None,
+    ) -> None:
+        self.formatters = formatters
+        self.max_workers = max_workers
+        self.prefetch = prefetch if prefetch is not None else 4 * max_workers
+
+    def match(self, item: URLItem) -> bool:
+        return any(f.match(item) for f in self.formatters)
+
+    def format(self, item: URLItem) -> URLItem:
+        for f in self.formatters:
+            item = f(item)
+
+        return item
+
+    def __call__(self, items: Iterable[URLItem]) -> Iterator[URLItem]:
+        if self.max_workers <= 1:
+            yield from map(self.format, items)
+            return
+
+        # Only items matched by some formatter go through the pool, the others
+        # are queued as they are. At most `prefetch` items are in flight and
+        # results are yielded in input order.
+        with concurrent.futures.ThreadPoolExecutor(self.max_workers) as executor:
+            pending = collections.deque()
+            for item in items:
+                if self.match(item):
+                    pending.append(executor.submit(self.format, item))
+                else:
+                    pending.append(item)
+
+                while len(pending) > self.prefetch or (
+                    pending and not isinstance(pending[0], concurrent.futures.Future)
+                ):
+                    yield self._resolve(pending.popleft())
+
+            while pending:
+                yield self._resolve(pending.popleft())
+
+    def _resolve(self, pending):
+        # pylint: disable=no-self-use
+
+        if isinstance(pending, concurrent.futures.Future):
+            return pending.result()
 
-            return {**item, "title": title}
+        return pending
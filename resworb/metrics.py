@@ -0,0 +1,241 @@
+import json
+import logging
+import sys
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from resworb.files import write_atomic
+
+logger = logging.getLogger(__name__)
+
+Stats = List[Dict[str, Any]]
+
+
+def peak_memory() -> Optional[int]:
+    # Peak resident set size of the process in bytes.
+    try:
+        import resource  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports kilobytes, macOS bytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _count(source: str, item: Any) -> int:
+    return len(item["tabs"]) if source == "cloud_tabs" else 1
+
+
+class Metrics:
+    # Stages of a source are chained generators: every `track` wraps the
+    # output of the previous stage, so the time spent pulling from a stage
+    # includes all stages below it. Stage times are reported exclusive.
+    # Consumers of the records (`consume`) are timed as a whole.
+
+    def __init__(self) -> None:
+        self._stages: Dict[str, List[Dict[str, Any]]] = {}
+
+    def track(self, stage: str, source: str, items: Iterable) -> Iterator:
+        stats = {
+            "stage": stage,
+            "source": source,
+            "rows": 0,
+            "busy": 0.0,
+            "bytes": None,
+            "peak_memory": None,
+        }
+        self._stages.setdefault(source, []).append(stats)
+
+        def _track():
+            iterator = iter(items)
+            try:
+                while True:
+                    pull = time.perf_counter()
+                    try:
+                        item = next(iterator)
+                    finally:
+                        stats["busy"] += time.perf_counter() - pull
+
+                    stats["rows"] += _count(source, item)
+                    yield item
+            except StopIteration:
+                pass
+            finally:
+                stats["peak_memory"] = peak_memory()
+
+        # Stages are registered when wrapped (inner first), not when pulled.
+        return _track()
+
+    def track_records(
+        self,
+        stage: str,
+        records: Iterable[Tuple[str, Iterable]],
+        **kwargs: Any,
+    ) -> Iterator[Tuple[str, Iterator]]:
+        for source, items in records:
+            yield source, self.track(stage, source, items, **kwargs)
+
+    def consume(
+        self,
+        stage: str,
+        records: Iterable[Tuple[str, Iterable]],
+        consumer: Callable[[Iterable[Tuple[str, Iterable]]], Any],
+        bytes_: Optional[Callable[[], Optional[int]]] = None,
+    ) -> Any:
+        # Times a consumer of the records of all sources (e.g. an exporter):
+        # its wall time minus the time spent pulling records. Document
+        # exporters only write once the last record is pulled, so the stage
+        # is not split by source. `bytes_` is called once it is done.
+        stats = {"rows": 0, "busy": 0.0}
+
+        def _pull(iterator):
+            while True:
+                pull = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    stats["busy"] += time.perf_counter() - pull
+
+                yield item
+
+        def _items(source, items):
+            for item in _pull(iter(items)):
+                stats["rows"] += _count(source, item)
+                yield item
+
+        def _records():
+            for source, items in _pull(iter(records)):
+                yield source, _items(source, items)
+
+        start = time.perf_counter()
+        result = consumer(_records())
+        self.add(
+            stage,
+            "all",
+            rows=stats["rows"],
+            seconds=max(time.perf_counter() - start - stats["busy"], 0.0),
+            bytes_=bytes_() if bytes_ is not None else None,
+        )
+
+        return result
+
+    def add(
+        self,
+        stage: str,
+        source: str,
+        rows: int,
+        seconds: float,
+        bytes_: Optional[int] = None,
+    ) -> None:
+        self._stages.setdefault(source, []).append(
+            {
+                "stage": stage,
+                "source": source,
+                "rows": rows,
+                "seconds": seconds,
+                "bytes": bytes_,
+                "peak_memory": peak_memory(),
+            }
+        )
+
+    def report(self) -> Stats:
+        results = []
+        for source, stages in self._stages.items():
+            below = 0.0
+            for stats in stages:
+                if "seconds" in stats:
+                    seconds = stats["seconds"]
+                else:
+                    seconds = max(stats["busy"] - below, 0.0)
+                below = stats.get("busy", 0.0)
+
+                results += [
+                    {
+                        "source": source,
+                        "stage": stats["stage"],
+                        "rows": stats["rows"],
+                        "seconds": seconds,
+                        "rows_per_second": (
+                            stats["rows"] / seconds if seconds > 0 else None
+                        ),
+                        "bytes": stats["bytes"],
+                        "peak_memory": stats["peak_memory"],
+                    }
+                ]
+
+        return results
+
+
+class LogSink:
+    def __init__(self, log: Optional[logging.Logger] = None) -> None:
+        self.log = log or logger
+
+    def __call__(self, stats: Stats) -> None:
+        self.log.info("Export metrics:")
+        for x in stats:
+            self.log.info(
+                "%s\t%s\trows=%d\tseconds=%.3f\trows/s=%s\tbytes=%s\tpeak_memory=%s",
+                x["source"],
+                x["stage"],
+                x["rows"],
+                x["seconds"],
+                "-" if x["rows_per_second"] is None else f"{x['rows_per_second']:.0f}",
+                "-" if x["bytes"] is None else x["bytes"],
+                "-" if x["peak_memory"] is None else x["peak_memory"],
+            )
+
+
+class JSONSink:
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+
+    def __call__(self, stats: Stats) -> None:
+        write_atomic(
+            self.filename,
+            lambda f: json.dump(stats, f, ensure_ascii=False, indent=4),
+        )
+
+
+class PrometheusSink:
+    # Textfile collector format of the Prometheus node exporter.
+    metrics = [
+        ("rows", "rows", "gauge", "Number of rows of the stage."),
+        ("seconds", "seconds", "gauge", "Time spent in the stage."),
+        ("rows_per_second", "rows_per_second", "gauge", "Throughput of the stage."),
+        ("bytes", "bytes", "gauge", "Bytes written by the stage."),
+        ("peak_memory", "peak_memory_bytes", "gauge", "Peak resident memory."),
+    ]
+
+    def __init__(self, filename: str, prefix: str = "resworb_export") -> None:
+        self.filename = filename
+        self.prefix = prefix
+
+    def __call__(self, stats: Stats) -> None:
+        def _write(f):
+            for key, name, type_, help_ in self.metrics:
+                f.write(f"# HELP {self.prefix}_{name} {help_}\n")
+                f.write(f"# TYPE {self.prefix}_{name} {type_}\n")
+                for x in stats:
+                    if x[key] is None:
+                        continue
+
+                    labels = f'source="{x["source"]}",stage="{x["stage"]}"'
+                    f.write(f"{self.prefix}_{name}{{{labels}}} {x[key]}\n")
+
+        write_atomic(self.filename, _write)
+
+
+def get_sink(name: str) -> Callable[[Stats], None]:
+    # `log`, or a filename: `.prom` files are written in the Prometheus
+    # textfile format, anything else as JSON.
+    if name == "log":
+        return LogSink()
+
+    if name.endswith(".prom"):
+        return PrometheusSink(name)
+
+    return JSONSink(name)
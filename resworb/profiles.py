@@ -0,0 +1,123 @@
+import concurrent.futures
+import itertools
+import json
+import os
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple, Type
+
+from resworb.base import to_dict
+from resworb.checkpoint import Checkpoint
+
+
+def _export_profile(
+    browser_class: Type,
+    library: str,
+    checkpoint: Optional[Checkpoint],
+    export_kwargs: Dict[str, Any],
+    directory: str,
+) -> Tuple[Dict[str, str], Dict[str, Dict[str, float]]]:
+    # Records are spooled to a JSON lines file per source as they are read,
+    # only the file names are sent back.
+    browser = browser_class(library=library)
+
+    filenames = {}
+    for source, items in browser.iter_export(checkpoint=checkpoint, **export_kwargs):
+        fd, filename = tempfile.mkstemp(suffix=".jsonl", dir=directory)
+        with open(fd, mode="w", encoding="utf-8") as f:
+            for item in items:
+                f.write(json.dumps(to_dict(item), ensure_ascii=False))
+                f.write("\n")
+        filenames[source] = filename
+
+    # The checkpoint is a copy in the worker, send back what was updated.
+    watermarks = {}
+    if checkpoint is not None:
+        profile = browser._get_checkpoint_profile()  # pylint: disable=protected-access
+        watermarks = {profile: checkpoint.watermarks.get(profile, {})}
+
+    return filenames, watermarks
+
+
+class SpooledRecords:
+    # Records of a profile spooled by a worker, read back lazily by source.
+    # The files are removed once read, and their directory when it is no
+    # longer referenced.
+    def __init__(
+        self,
+        filenames: Dict[str, str],
+        directory: tempfile.TemporaryDirectory,
+    ) -> None:
+        self.filenames = filenames
+        self.directory = directory
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.filenames)
+
+    def __contains__(self, source: object) -> bool:
+        return source in self.filenames
+
+    def _read(self, filename: str) -> Iterator[Dict[str, Any]]:
+        try:
+            with open(filename, encoding="utf-8") as f:
+                for line in f:
+                    yield json.loads(line)
+        finally:
+            os.remove(filename)
+
+    def get(self, source: str, default: Iterable = ()) -> Iterable:
+        filename = self.filenames.get(source)
+        if filename is None:
+            return default
+
+        return self._read(filename)
+
+
+def export_profiles(
+    browser_class: Type,
+    library: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    checkpoint: Optional[Checkpoint] = None,
+    **export_kwargs: Any,
+) -> Iterator[Tuple[str, SpooledRecords]]:
+    # Exports every profile of the browser in a process pool. Results are
+    # yielded in profile order.
+    profiles = browser_class.get_profiles(library)
+    directory = tempfile.TemporaryDirectory(prefix="resworb-")
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers) as executor:
+        futures = {
+            name: executor.submit(
+                _export_profile,
+                browser_class,
+                path,
+                checkpoint,
+                export_kwargs,
+                directory.name,
+            )
+            for name, path in profiles.items()
+        }
+
+        for name, future in futures.items():
+            filenames, watermarks = future.result()
+            if checkpoint is not None:
+                checkpoint.watermarks.update(watermarks)
+
+            yield name, SpooledRecords(filenames, directory)
+
+
+def merge_profiles(
+    results: Iterable[Tuple[str, SpooledRecords]],
+) -> Iterator[Tuple[str, Iterator]]:
+    # Merges the records of all profiles by source, tagged with the profile.
+    # Only the spooled results are collected, records are read as consumed.
+    results = list(results)
+
+    sources = []
+    for _, records in results:
+        sources += [x for x in records if x not in sources]
+
+    for source in sources:
+        yield source, itertools.chain.from_iterable(
+            ({**x, "profile": name} for x in records.get(source, []))
+            for name, records in results
+        )
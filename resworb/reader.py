@@ -0,0 +1,213 @@
+import json
+import os
+import pickle
+import sqlite3
+from typing import IO, Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from resworb.compression import open_compressed, split_compression
+from resworb.exporter import MSGPACK_FRAME, MSGPACK_MAGIC
+
+
+class MessagePackReader:
+    # Reads the exports of `MessagePackExporter` back lazily, one frame at a
+    # time. Frames of other sources are skipped by their header only.
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self.compression = split_compression(filename)[1]
+
+    def _open(self) -> IO[bytes]:
+        # Compressed exports are decompressed on the fly, skipping frames
+        # then reads (but does not keep) their payloads.
+        return open_compressed(self.filename, compression=self.compression)
+
+    def _iter_frames(self, f: IO[bytes]) -> Iterator[Tuple[str, int, int]]:
+        # Yields the source, number of records and payload length of every
+        # frame, the payload can be read before the next one.
+        if f.read(len(MSGPACK_MAGIC)) != MSGPACK_MAGIC:
+            msg = f"Not a MessagePack export: {self.filename}"
+            raise ValueError(msg)
+
+        while True:
+            header = f.read(MSGPACK_FRAME.size)
+            if not header:
+                return
+
+            if len(header) < MSGPACK_FRAME.size:
+                msg = f"Truncated frame in {self.filename}"
+                raise ValueError(msg)
+
+            name_length, count, length = MSGPACK_FRAME.unpack(header)
+            source = f.read(name_length).decode("utf-8")
+            offset = f.tell()
+
+            yield source, count, length
+
+            f.seek(offset + length)
+
+    def get_counts(self) -> Dict[str, int]:
+        with self._open() as f:
+            counts: Dict[str, int] = {}
+            for source, count, _ in self._iter_frames(f):
+                counts[source] = counts.get(source, 0) + count
+
+            return counts
+
+    def iter_records(
+        self,
+        sources: Optional[Iterable[str]] = None,
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        # pylint: disable=import-outside-toplevel
+        import msgpack
+
+        if sources is not None:
+            sources = set(sources)
+
+        with self._open() as f:
+            for source, _, length in self._iter_frames(f):
+                if sources is not None and source not in sources:
+                    continue
+
+                payload = f.read(length)
+                if len(payload) < length:
+                    msg = f"Truncated frame in {self.filename}"
+                    raise ValueError(msg)
+
+                for item in msgpack.unpackb(payload, raw=False):
+                    yield source, item
+
+    def read(self, source: str) -> Iterator[Dict[str, Any]]:
+        for _, item in self.iter_records([source]):
+            yield item
+
+    def __iter__(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        return self.iter_records()
+
+
+def _read_archive(filename: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    # Archives of `ArchiveExporter`, cloud tabs are flattened with their device.
+    conn = sqlite3.connect(filename)
+    try:
+        for url, title, visit_time, profile in conn.execute("""
+            SELECT url, title, visit_time, profiles.name
+            FROM visits
+            INNER JOIN urls ON urls.id = visits.url_id
+            INNER JOIN profiles ON profiles.id = visits.profile_id
+            """):
+            yield "histories", {
+                "url": url,
+                "title": title,
+                "visit_time": visit_time,
+                "profile": profile,
+            }
+
+        for url, title, path, profile in conn.execute("""
+            SELECT url, bookmarks.title, path, profiles.name
+            FROM bookmarks
+            INNER JOIN urls ON urls.id = bookmarks.url_id
+            INNER JOIN folders ON folders.id = bookmarks.folder_id
+            INNER JOIN profiles ON profiles.id = bookmarks.profile_id
+            """):
+            yield "bookmarks", {
+                "title": title,
+                "url": url,
+                "folders": json.loads(path),
+                "profile": profile,
+            }
+
+        for source, url, title, device_id, device_name, profile in conn.execute("""
+            SELECT source, url, tabs.title, uuid, devices.name, profiles.name
+            FROM tabs
+            INNER JOIN urls ON urls.id = tabs.url_id
+            INNER JOIN profiles ON profiles.id = tabs.profile_id
+            LEFT JOIN devices ON devices.id = tabs.device_id
+            ORDER BY source
+            """):
+            row = {"title": title, "url": url, "profile": profile}
+            if device_id is not None:
+                row.update(device_id=device_id, device_name=device_name)
+            yield source, row
+    finally:
+        conn.close()
+
+
+def _read_arrow(
+    filename: str,
+    compression: Optional[str],
+    file_type: str,
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    # Rows of the flat table, without the columns they don't use.
+    # pylint: disable=import-outside-toplevel
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    with open_compressed(filename, compression=compression) as f:
+        if file_type == ".parquet":
+            batches = pq.ParquetFile(f).iter_batches()
+        else:
+            batches = pa.ipc.open_stream(f)
+
+        for batch in batches:
+            for row in batch.to_pylist():
+                source = row.pop("source")
+                if row["visit_time"] is not None:
+                    row["visit_time"] = int(row["visit_time"].timestamp() * 1000000)
+                yield source, {k: v for k, v in row.items() if v is not None}
+
+
+def read_export(
+    filename: str,
+    trust_pickle: bool = False,
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    # (source, record) pairs of an export of any exporter. Line, frame and
+    # batch based formats are read lazily, documents (JSON, YAML, TOML and
+    # pickle) have to be loaded at once. Unpickling can run arbitrary code,
+    # pickle exports are only read if trusted.
+    # pylint: disable=import-outside-toplevel
+    base, compression = split_compression(filename)
+    file_type = os.path.splitext(base)[1]
+
+    if file_type in {".pkl", ".pickle"} and not trust_pickle:
+        msg = f"Refusing to unpickle {filename}, it is not trusted."
+        raise ValueError(msg)
+
+    if file_type == ".msgpack":
+        yield from MessagePackReader(filename)
+        return
+
+    if file_type == ".sqlite":
+        yield from _read_archive(filename)
+        return
+
+    if file_type in {".parquet", ".arrows"}:
+        yield from _read_arrow(filename, compression, file_type)
+        return
+
+    if file_type in {".jsonl", ".ndjson"}:
+        with open_compressed(filename, "r", compression, encoding="utf-8") as f:
+            for line in f:
+                item = json.loads(line)
+                yield item.pop("source"), item
+        return
+
+    if file_type in {".pkl", ".pickle"}:
+        with open_compressed(filename, "rb", compression) as f:
+            data = pickle.load(f)
+    else:
+        with open_compressed(filename, "r", compression, encoding="utf-8") as f:
+            if file_type == ".json":
+                data = json.load(f)
+            elif file_type in {".yml", ".yaml"}:
+                import yaml
+
+                data = yaml.safe_load(f)
+            elif file_type == ".toml":
+                import pytoml
+
+                data = pytoml.load(f)
+            else:
+                msg = f"Unsupported file type: {file_type}"
+                raise ValueError(msg)
+
+    for source, items in data.items():
+        for item in items:
+            yield source, item
@@ -0,0 +1,262 @@
+import itertools
+import re
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# Documents are the urls of every source and profile, with the latest visit
+# time of histories. The FTS5 table only indexes them (external content) and
+# is kept in sync by triggers. Watermarks are raw visit times which may be
+# beyond the precision of floats (e.g. Chrome's), they must not be REAL.
+SCHEMA = """
+PRAGMA journal_mode=WAL;
+
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    browser TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    source TEXT NOT NULL,
+    url TEXT NOT NULL,
+    title TEXT,
+    folders TEXT NOT NULL DEFAULT '',
+    visit_time INTEGER,
+    seen INTEGER NOT NULL,
+    UNIQUE (browser, profile, source, url, folders)
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+    title,
+    url,
+    folders,
+    content='documents',
+    content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS documents_insert AFTER INSERT ON documents BEGIN
+    INSERT INTO documents_fts (rowid, title, url, folders)
+    VALUES (new.id, new.title, new.url, new.folders);
+END;
+
+CREATE TRIGGER IF NOT EXISTS documents_delete AFTER DELETE ON documents BEGIN
+    INSERT INTO documents_fts (documents_fts, rowid, title, url, folders)
+    VALUES ('delete', old.id, old.title, old.url, old.folders);
+END;
+
+CREATE TRIGGER IF NOT EXISTS documents_update AFTER UPDATE OF title ON documents
+WHEN old.title IS NOT new.title BEGIN
+    INSERT INTO documents_fts (documents_fts, rowid, title, url, folders)
+    VALUES ('delete', old.id, old.title, old.url, old.folders);
+    INSERT INTO documents_fts (rowid, title, url, folders)
+    VALUES (new.id, new.title, new.url, new.folders);
+END;
+
+CREATE TABLE IF NOT EXISTS watermarks (
+    browser TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    source TEXT NOT NULL,
+    watermark INTEGER,
+    PRIMARY KEY (browser, profile, source)
+);
+"""
+
+DEFAULT_SOURCES = ["cloud_tabs", "readings", "bookmarks", "histories"]
+
+
+def to_match_query(text: str) -> str:
+    # Free text to an FTS5 query: every word must match, as a prefix.
+    return " ".join(f'"{x}"*' for x in re.findall(r"\w+", text))
+
+
+class SearchIndex:
+    # Matches are ranked by bm25 (titles weigh most, then urls, then folders)
+    # and boosted by the recency of their last visit: a visit now doubles the
+    # score, one `half_life` days ago multiplies it by 1.5.
+    bm25_weights = (10.0, 5.0, 2.0)
+    half_life = 30
+    batch_size = 10000
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+
+        self.conn = sqlite3.connect(filename)
+        self._drop_rounded_watermarks()
+        self.conn.executescript(SCHEMA)
+        weights = ", ".join(str(x) for x in self.bm25_weights)
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO documents_fts (documents_fts, rank) VALUES ('rank', ?)",
+                (f"bm25({weights})",),
+            )
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def _drop_rounded_watermarks(self) -> None:
+        # Indexes created with REAL watermarks may have skipped visits since,
+        # histories are read again from the start (documents are upserted).
+        columns = self.conn.execute("PRAGMA table_info(watermarks)").fetchall()
+        if any(x[1] == "watermark" and x[2] == "REAL" for x in columns):
+            with self.conn:
+                self.conn.execute("DROP TABLE watermarks")
+
+    def _get_documents(self, browser, source, after, upto):
+        # (url, title, folders, visit_time) of a source.
+        if source == "histories":
+            for item in browser.get_histories(after=after, upto=upto, raw_time=True):
+                yield item["url"], item["title"], "", item["visit_time"]
+
+        elif source == "bookmarks":
+            for item in browser.get_bookmarks():
+                yield item["url"], item["title"], " / ".join(item["folders"]), None
+
+        elif source == "cloud_tabs":
+            for device in browser.get_cloud_tabs():
+                for tab in device["tabs"]:
+                    yield tab["url"], tab["title"], device["name"] or "", None
+
+        else:
+            getter = getattr(browser, f"get_{source}")
+            for item in getter():
+                yield item["url"], item["title"], "", None
+
+    def _update_source(self, browser, name, profile, source, seen):
+        watermark, upto = None, None
+        if source == "histories":
+            row = self.conn.execute(
+                "SELECT watermark FROM watermarks"
+                " WHERE browser = ? AND profile = ? AND source = ?",
+                (name, profile, source),
+            ).fetchone()
+            watermark = row[0] if row else None
+            upto = browser.get_history_watermark()
+
+        count = 0
+        documents = self._get_documents(browser, source, watermark, upto)
+        rows = (
+            (name, profile, source, url, title, folders, visit_time, seen)
+            for url, title, folders, visit_time in documents
+            if url
+        )
+        batch = list(itertools.islice(rows, self.batch_size))
+        while batch:
+            with self.conn:
+                self.conn.executemany(
+                    """
+                    INSERT INTO documents (
+                        browser, profile, source, url, title, folders, visit_time, seen
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (browser, profile, source, url, folders) DO UPDATE SET
+                        title = IFNULL(excluded.title, title),
+                        visit_time = MAX(
+                            IFNULL(excluded.visit_time, visit_time),
+                            IFNULL(visit_time, excluded.visit_time)
+                        ),
+                        seen = excluded.seen
+                    """,
+                    batch,
+                )
+            count += len(batch)
+            batch = list(itertools.islice(rows, self.batch_size))
+
+        with self.conn:
+            if source == "histories":
+                # Histories only grow, other sources are replaced.
+                if upto is not None:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO watermarks VALUES (?, ?, ?, ?)",
+                        (name, profile, source, upto),
+                    )
+            else:
+                self.conn.execute(
+                    "DELETE FROM documents"
+                    " WHERE browser = ? AND profile = ? AND source = ? AND seen < ?",
+                    (name, profile, source, seen),
+                )
+
+        return count
+
+    def update(
+        self,
+        browser: Any,
+        name: str,
+        profile: str = "default",
+        sources: Optional[Iterable[str]] = None,
+    ) -> Dict[str, int]:
+        # Indexes the sources of a browser profile. Only histories newer than
+        # the previous update are read. Sources the browser doesn't support
+        # are skipped.
+        if sources is None:
+            sources = DEFAULT_SOURCES
+
+        seen = time.time_ns() // 1000
+        counts = {}
+        with browser.connections.session():
+            for source in sources:
+                try:
+                    counts[source] = self._update_source(
+                        browser, name, profile, source, seen
+                    )
+                except NotImplementedError:
+                    continue
+
+        return counts
+
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        sources: Optional[Iterable[str]] = None,
+        browsers: Optional[Iterable[str]] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        match = to_match_query(query)
+        if not match:
+            return
+
+        conditions: List[str] = ["documents_fts MATCH ?"]
+        params: List[Any] = [match]
+        for column, values in [("source", sources), ("browser", browsers)]:
+            if values is not None:
+                values = list(values)
+                conditions += [
+                    f"documents.{column} IN ({', '.join('?' for _ in values)})"
+                ]
+                params += values
+
+        # The best bm25 matches are reranked with their recency, so that only
+        # a few rows are scored however common the terms are.
+        now = time.time_ns() // 1000
+        half_life = self.half_life * 86400 * 1000000
+        params += [max(limit * 10, 200), now, half_life, limit]
+
+        sql = f"""
+        WITH matches AS (
+            SELECT documents_fts.rowid AS id, documents_fts.rank AS rank
+            FROM documents_fts INNER JOIN documents ON documents.id = documents_fts.rowid
+            WHERE {' AND '.join(conditions)}
+            ORDER BY documents_fts.rank
+            LIMIT ?
+        )
+        SELECT
+            browser, profile, source, url, title, folders, visit_time,
+            -rank * (
+                1.0 + CASE WHEN visit_time IS NULL THEN 0
+                ELSE 1.0 / (1.0 + MAX(? - visit_time, 0) * 1.0 / ?) END
+            ) AS score
+        FROM matches INNER JOIN documents ON documents.id = matches.id
+        ORDER BY score DESC
+        LIMIT ?
+        """
+
+        columns = [
+            "browser",
+            "profile",
+            "source",
+            "url",
+            "title",
+            "folders",
+            "visit_time",
+            "score",
+        ]
+        for row in self.conn.execute(sql, params):
+            yield dict(zip(columns, row))
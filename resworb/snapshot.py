@@ -0,0 +1,51 @@
+import os
+import pathlib
+import shutil
+import sqlite3
+import tempfile
+
+
+def _backup(source: sqlite3.Connection, target: sqlite3.Connection) -> None:
+    try:
+        # Hold a read transaction first: `backup` retries forever while the
+        # database is locked, whereas a plain read fails after the timeout.
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+
+        # Copy all pages in a single step so that the copy is a consistent
+        # point-in-time state of the source.
+        source.backup(target, pages=-1)
+    finally:
+        source.close()
+
+
+def connect(
+    filename: str,
+    in_memory: bool = False,
+    timeout: float = 1.0,
+) -> sqlite3.Connection:
+    # An empty filename makes SQLite create a private on-disk temp database
+    # which is deleted on close, only its page cache is kept in memory. An
+    # in-memory copy is faster to query but holds the whole database.
+    target = sqlite3.connect(":memory:" if in_memory else "")
+
+    uri = f"{pathlib.Path(filename).absolute().as_uri()}?mode=ro"
+    try:
+        _backup(sqlite3.connect(uri, uri=True, timeout=timeout), target)
+
+        return target
+    except sqlite3.OperationalError:
+        # The browser may hold an exclusive lock (or the shared memory file of
+        # the WAL is not writable), read a copy of the database files instead.
+        # Committed pages in the WAL are replayed when the copy is opened.
+        pass
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        copy = os.path.join(tempdir, os.path.basename(filename))
+        for suffix in ["", "-wal", "-journal"]:
+            if os.path.exists(filename + suffix):
+                shutil.copyfile(filename + suffix, copy + suffix)
+
+        _backup(sqlite3.connect(copy), target)
+
+    return target
@@ -0,0 +1,174 @@
+import mmap
+import os
+import struct
+from typing import Any, Dict, Iterator, List, Tuple
+
+from resworb.base import Tab
+
+# Chrome's session files (`Sessions/Session_*`, `Current Session`) are logs of
+# commands: a "SNSS" header and version, then for each command a uint16 size,
+# a uint8 id and `size - 1` bytes of payload. Payloads are either plain
+# structs or `base::Pickle`s (a uint32 size, then 4 bytes aligned fields).
+#
+# References:
+# https://source.chromium.org/chromium/chromium/src/+/main:components/sessions/core/session_service_commands.cc
+
+SNSS_MAGIC = b"SNSS"
+SNSS_VERSIONS = {1, 3}
+
+SET_TAB_WINDOW = 0
+SET_TAB_INDEX_IN_WINDOW = 2
+TAB_NAVIGATION_PATH_PRUNED_FROM_BACK = 5
+UPDATE_TAB_NAVIGATION = 6
+SET_SELECTED_NAVIGATION_INDEX = 7
+SET_SELECTED_TAB_IN_INDEX = 8
+TAB_CLOSED = 16
+WINDOW_CLOSED = 17
+TAB_NAVIGATION_PATH_PRUNED = 24
+
+_INT = struct.Struct("<i")
+_INT_PAIR = struct.Struct("<ii")
+_INT_TRIPLE = struct.Struct("<iii")
+_SIZE = struct.Struct("<H")
+
+
+def iter_commands(buffer: memoryview) -> Iterator[Tuple[int, memoryview]]:
+    # Payloads are slices of the buffer, valid until the next command.
+    if bytes(buffer[:4]) != SNSS_MAGIC:
+        msg = "Not a SNSS file."
+        raise ValueError(msg)
+
+    version = _INT.unpack_from(buffer, 4)[0]
+    if version not in SNSS_VERSIONS:
+        msg = f"Unsupported SNSS version: {version}"
+        raise ValueError(msg)
+
+    offset, end = 8, len(buffer)
+    while offset + _SIZE.size <= end:
+        size = _SIZE.unpack_from(buffer, offset)[0]
+        offset += _SIZE.size
+
+        # The last command may be truncated while Chrome is writing.
+        if size == 0 or offset + size > end:
+            break
+
+        yield buffer[offset], buffer[offset + 1 : offset + size]
+        offset += size
+
+
+def _read_navigation(payload: memoryview) -> Tuple[int, int, str, str]:
+    # Pickle of the tab id, navigation index, url (string) and title
+    # (string16), followed by fields which are not needed.
+    tab_id, index, length = _INT_TRIPLE.unpack_from(payload, 4)
+    offset = 16
+    url = str(payload[offset : offset + length], "utf-8", "replace")
+    offset += (length + 3) & ~3
+
+    length = _INT.unpack_from(payload, offset)[0]
+    offset += 4
+    title = str(payload[offset : offset + 2 * length], "utf-16-le", "replace")
+
+    return tab_id, index, url, title
+
+
+def _replay(commands: Iterator[Tuple[int, memoryview]]) -> List[Dict[str, Any]]:
+    tabs: Dict[int, Dict[str, Any]] = {}
+    windows: Dict[int, Dict[str, Any]] = {}
+
+    def _tab(tab_id):
+        tab = tabs.get(tab_id)
+        if tab is None:
+            tab = tabs[tab_id] = {
+                "window": None,
+                "index": 0,
+                "navigations": {},
+                "selected": None,
+            }
+
+        return tab
+
+    for command, payload in commands:
+        try:
+            if command == UPDATE_TAB_NAVIGATION:
+                tab_id, index, url, title = _read_navigation(payload)
+                _tab(tab_id)["navigations"][index] = (url, title)
+
+            elif command == SET_TAB_WINDOW:
+                window_id, tab_id = _INT_PAIR.unpack_from(payload)
+                _tab(tab_id)["window"] = window_id
+                windows.setdefault(window_id, {"selected": 0})
+
+            elif command == SET_TAB_INDEX_IN_WINDOW:
+                tab_id, index = _INT_PAIR.unpack_from(payload)
+                _tab(tab_id)["index"] = index
+
+            elif command == SET_SELECTED_NAVIGATION_INDEX:
+                tab_id, index = _INT_PAIR.unpack_from(payload)
+                _tab(tab_id)["selected"] = index
+
+            elif command == SET_SELECTED_TAB_IN_INDEX:
+                window_id, index = _INT_PAIR.unpack_from(payload)
+                windows.setdefault(window_id, {})["selected"] = index
+
+            elif command == TAB_NAVIGATION_PATH_PRUNED_FROM_BACK:
+                # Navigations from `index` on are removed.
+                tab_id, index = _INT_PAIR.unpack_from(payload)
+                navigations = _tab(tab_id)["navigations"]
+                for i in [x for x in navigations if x >= index]:
+                    del navigations[i]
+
+            elif command == TAB_NAVIGATION_PATH_PRUNED:
+                # `count` navigations from `index` on are removed, the next
+                # ones are shifted down.
+                tab_id, index, count = _INT_TRIPLE.unpack_from(payload)
+                tab = _tab(tab_id)
+                tab["navigations"] = {
+                    (i - count if i >= index + count else i): x
+                    for i, x in tab["navigations"].items()
+                    if not index <= i < index + count
+                }
+
+            elif command == TAB_CLOSED:
+                tabs.pop(_INT.unpack_from(payload)[0], None)
+
+            elif command == WINDOW_CLOSED:
+                window_id = _INT.unpack_from(payload)[0]
+                windows.pop(window_id, None)
+                for tab_id in [k for k, v in tabs.items() if v["window"] == window_id]:
+                    del tabs[tab_id]
+
+        except struct.error:
+            # A payload shorter than expected, e.g. of another version.
+            continue
+
+    results = {
+        window_id: {"id": window_id, "selected": window.get("selected", 0), "tabs": []}
+        for window_id, window in windows.items()
+    }
+    for tab in sorted(tabs.values(), key=lambda x: x["index"]):
+        window = results.get(tab["window"])
+        navigations = tab["navigations"]
+        if window is None or not navigations:
+            continue
+
+        selected = tab["selected"]
+        if selected not in navigations:
+            selected = max(navigations)
+
+        url, title = navigations[selected]
+        window["tabs"] += [Tab(title, url)]
+
+    return [x for x in results.values() if x["tabs"]]
+
+
+def read_session(filename: str) -> List[Dict[str, Any]]:
+    # Replays the commands of a session file to the open windows and their
+    # tabs. The file is mapped and only navigation urls and titles are
+    # copied out of it.
+    with open(filename, mode="rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as buffer:
+                return _replay(iter_commands(buffer))
@@ -0,0 +1,8 @@
+import fixtures
+import pytest
+
+
+@pytest.fixture(scope="session")
+def libraries(tmp_path_factory):
+    # Synthetic libraries of every browser, see `benchmarks/fixtures.py`.
+    return fixtures.generate(str(tmp_path_factory.mktemp("libraries")), size=2000)
@@ -0,0 +1,57 @@
+import sys
+
+from resworb.base import walk_tree
+
+
+def walk(roots):
+    return walk_tree(roots, lambda x: x.get("children"), lambda x: x["name"])
+
+
+def test_walk_tree_order():
+    tree = {
+        "name": "root",
+        "children": [
+            {"name": "a", "children": [{"name": "a1"}, {"name": "a2"}]},
+            {"name": "b"},
+        ],
+    }
+
+    assert [(node["name"], path) for node, path in walk([tree])] == [
+        ("root", ()),
+        ("a", ("root",)),
+        ("a1", ("root", "a")),
+        ("a2", ("root", "a")),
+        ("b", ("root",)),
+    ]
+
+
+def test_walk_tree_deep():
+    # Deeper than the recursion limit.
+    depth = sys.getrecursionlimit() * 2
+    root = node = {"name": "0"}
+    for i in range(1, depth):
+        child = {"name": str(i)}
+        node["children"] = [child]
+        node = child
+    node["children"] = [{"name": "leaf"}, {"name": "sibling"}]
+
+    *_, (leaf, leaf_path), (sibling, sibling_path) = walk([root])
+
+    assert (leaf["name"], sibling["name"]) == ("leaf", "sibling")
+    assert len(leaf_path) == depth
+    assert leaf_path[-1] == str(depth - 1)
+
+    # Siblings share the path of their parent.
+    assert leaf_path is sibling_path
+
+
+def test_walk_tree_shared_paths():
+    # Folders with the same path (e.g. in different roots) share it too.
+    roots = [
+        {"name": "Bar", "children": [{"name": f"b{i}"} for i in range(3)]},
+        {"name": "Bar", "children": [{"name": "c"}]},
+    ]
+    paths = [path for node, path in walk(roots) if "children" not in node]
+
+    assert paths == [("Bar",)] * 4
+    assert all(x is paths[0] for x in paths)
@@ -0,0 +1,60 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+from resworb.checkpoint import Checkpoint
+from resworb.commands.cli import get_browser_class
+
+# A visit newer than all others, of an existing url.
+NEW_VISIT = {
+    "chrome": (
+        "History",
+        "UPDATE urls SET last_visit_time = (SELECT MAX(last_visit_time) + 1 FROM urls)"
+        " WHERE id = 1",
+    ),
+    "firefox": (
+        "places.sqlite",
+        "INSERT INTO moz_historyvisits (place_id, visit_date, visit_type)"
+        " SELECT 1, MAX(visit_date) + 1, 1 FROM moz_historyvisits",
+    ),
+    "safari": (
+        "History.db",
+        "INSERT INTO history_visits (history_item, visit_time, title)"
+        " SELECT 1, MAX(visit_time) + 1, 'new' FROM history_visits",
+    ),
+}
+
+
+def count_histories(browser, checkpoint):
+    (source, records), *_ = browser.iter_export(["histories"], checkpoint=checkpoint)
+    assert source == "histories"
+
+    return len(list(records))
+
+
+@pytest.mark.parametrize("name", ["chrome", "firefox", "safari"])
+def test_incremental_histories(tmp_path, libraries, name):
+    library = str(tmp_path / "library")
+    shutil.copytree(libraries[name], library)
+    browser = get_browser_class(name)(library)
+    filename = str(tmp_path / "checkpoint.json")
+
+    checkpoint = Checkpoint(filename)
+    assert count_histories(browser, checkpoint) > 0
+    assert count_histories(browser, checkpoint) == 0
+    checkpoint.save()
+
+    # Only the new visit is exported by the next run.
+    history_file, sql = NEW_VISIT[name]
+    with sqlite3.connect(os.path.join(library, history_file)) as conn:
+        conn.execute(sql)
+    conn.close()
+
+    checkpoint = Checkpoint(filename)
+    assert count_histories(browser, checkpoint) == 1
+    assert count_histories(browser, checkpoint) == 0
+
+    # Without a checkpoint, everything is exported.
+    assert count_histories(browser, None) > 1
@@ -0,0 +1,285 @@
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import sys
+
+import pytest
+
+from resworb.commands import cli
+from resworb.exporter import JSONLinesExporter
+
+
+def run(monkeypatch, *args):
+    monkeypatch.setattr(sys, "argv", ["resworb", *args])
+    cli.main()
+
+
+def read_sources(filename):
+    with open(filename, encoding="utf-8") as f:
+        return {json.loads(line)["source"] for line in f}
+
+
+@pytest.mark.parametrize("browser", ["chrome", "firefox"])
+def test_export_all_sources(monkeypatch, tmp_path, libraries, browser):
+    # Cloud tabs and readings are not implemented, they are skipped.
+    target = str(tmp_path / "export.jsonl")
+    run(
+        monkeypatch,
+        "export",
+        "-b",
+        browser,
+        "-l",
+        libraries[browser],
+        "-t",
+        target,
+        "--no-cache",
+    )
+
+    assert read_sources(target) == {"opened_tabs", "bookmarks", "histories"}
+
+
+@pytest.mark.parametrize("browser", ["chrome", "firefox"])
+def test_export_unsupported_source(monkeypatch, tmp_path, libraries, browser):
+    target = str(tmp_path / "export.jsonl")
+    with pytest.raises(NotImplementedError):
+        run(
+            monkeypatch,
+            "export",
+            "-b",
+            browser,
+            "-l",
+            libraries[browser],
+            "-s",
+            "cloud_tabs",
+            "-t",
+            target,
+            "--no-cache",
+        )
+
+
+def test_export_checkpoint(monkeypatch, tmp_path, libraries):
+    checkpoint = str(tmp_path / "checkpoint.json")
+    target = str(tmp_path / "export.jsonl")
+    args = [
+        "export",
+        "-b",
+        "chrome",
+        "-l",
+        libraries["chrome"],
+        "-s",
+        "histories",
+        "-t",
+        target,
+        "--checkpoint",
+        checkpoint,
+        "--no-cache",
+    ]
+
+    # Watermarks are not saved when the target could not be written.
+    def _fail(self, records, filename):
+        for _, items in records:
+            list(items)
+        raise OSError
+
+    with monkeypatch.context() as m:
+        m.setattr(JSONLinesExporter, "export_stream", _fail)
+        with pytest.raises(OSError):
+            run(m, *args)
+    assert not os.path.exists(checkpoint)
+
+    run(monkeypatch, *args)
+    assert os.path.exists(checkpoint)
+    with open(target, encoding="utf-8") as f:
+        assert len(f.readlines()) > 0
+
+    run(monkeypatch, *args)
+    with open(target, encoding="utf-8") as f:
+        assert not f.read()
+
+
+def test_export_all_profiles_archive(monkeypatch, tmp_path, libraries):
+    target = str(tmp_path / "archive.sqlite")
+    run(
+        monkeypatch,
+        "export",
+        "-b",
+        "chrome",
+        "-l",
+        libraries["chrome"],
+        "-a",
+        "-p",
+        "1",
+        "-t",
+        target,
+        "--no-cache",
+    )
+
+    conn = sqlite3.connect(target)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM visits").fetchone()[0] > 0
+        assert conn.execute("SELECT COUNT(*) FROM bookmarks").fetchone()[0] > 0
+        assert conn.execute("SELECT COUNT(*) FROM tabs").fetchone()[0] > 0
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize(
+    "browser, profiles, session",
+    [
+        ("chrome", ["Default", "Profile 1"], "Sessions"),
+        ("firefox", ["a.default-release", "b.other"], "sessionstore-backups"),
+    ],
+)
+def test_export_profile_without_session(
+    monkeypatch, tmp_path, libraries, browser, profiles, session
+):
+    # A profile which has never been opened has no opened tabs.
+    library = tmp_path / browser
+    shutil.copytree(libraries[browser], library / profiles[0])
+    shutil.copytree(
+        libraries[browser],
+        library / profiles[1],
+        ignore=shutil.ignore_patterns(session),
+    )
+
+    target = str(tmp_path / "export.jsonl")
+    run(
+        monkeypatch,
+        "export",
+        "-b",
+        browser,
+        "-l",
+        str(library),
+        "-a",
+        "-p",
+        "1",
+        "-t",
+        target,
+        "--no-cache",
+    )
+
+    with open(target, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert {(x["profile"], x["source"]) for x in records} == {
+        (profiles[0], "opened_tabs"),
+        (profiles[0], "bookmarks"),
+        (profiles[0], "histories"),
+        (profiles[1], "bookmarks"),
+        (profiles[1], "histories"),
+    }
+
+
+def test_export_archive_profile(monkeypatch, tmp_path, libraries):
+    # The default profile of the profiles directory and the same profile
+    # exported with all profiles are archived once.
+    target = str(tmp_path / "archive.sqlite")
+    profiles = os.path.dirname(libraries["firefox"])
+    for args in [["-l", profiles], ["-l", profiles, "-a", "-p", "1"]]:
+        run(monkeypatch, "export", "-b", "firefox", *args, "-t", target, "--no-cache")
+
+    conn = sqlite3.connect(target)
+    try:
+        assert conn.execute("SELECT browser, name FROM profiles").fetchall() == [
+            ("firefox", os.path.basename(libraries["firefox"]))
+        ]
+    finally:
+        conn.close()
+
+
+def test_summary(monkeypatch, capsys, tmp_path, libraries):
+    args = ["summary", "-b", "firefox", "-l", libraries["firefox"]]
+
+    run(monkeypatch, *args, "-g", "domain", "-n", "3")
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 3
+    counts = [int(x.split("\t")[0]) for x in lines]
+    assert counts == sorted(counts, reverse=True)
+
+    # All rows, filtered.
+    run(monkeypatch, *args, "-g", "domain", "-n", "0", "--domain", "org")
+    assert {x.split("\t")[2] for x in capsys.readouterr().out.splitlines()} == {
+        "en.wikipedia.org",
+        "docs.python.org",
+        "arxiv.org",
+    }
+
+    target = str(tmp_path / "summary.jsonl")
+    run(monkeypatch, *args, "-g", "day", "--since", "2020-03-01", "-t", target)
+    with open(target, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f]
+    days = [x["day"] for x in rows]
+    assert len(days) == 100
+    assert days == sorted(days, reverse=True)
+    assert min(days) >= "2020-03-01"
+    assert all(x["source"] == "summary" for x in rows)
+
+
+def test_diff_exports(monkeypatch, tmp_path, libraries):
+    old = str(tmp_path / "old.jsonl")
+    run(
+        monkeypatch,
+        "export",
+        "-b",
+        "chrome",
+        "-l",
+        libraries["chrome"],
+        "-s",
+        "bookmarks",
+        "-t",
+        old,
+        "--no-cache",
+    )
+
+    # The newer export drops the first bookmark, renames the second and adds
+    # one.
+    with open(old, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    for record in records:
+        del record["source"]
+    removed, renamed, *records = records
+    added = {**removed, "url": "https://example.com/added"}
+    records += [{**renamed, "title": "Renamed"}, added]
+
+    new = str(tmp_path / "new.json.gz")
+    with gzip.open(new, mode="wt", encoding="utf-8") as f:
+        json.dump({"bookmarks": records}, f)
+
+    target = str(tmp_path / "diff.jsonl")
+    run(monkeypatch, "diff", old, new, "-t", target)
+    with open(target, encoding="utf-8") as f:
+        changes = [json.loads(line) for line in f]
+
+    assert [(x["change"], x["url"], x["title"]) for x in changes] == [
+        ("added", added["url"], added["title"]),
+        ("removed", removed["url"], removed["title"]),
+        ("changed", renamed["url"], "Renamed"),
+    ]
+    assert changes[-1]["previous"] == {"title": renamed["title"]}
+
+
+def test_diff_pickle(monkeypatch, tmp_path, libraries):
+    old = str(tmp_path / "old.pkl")
+    run(
+        monkeypatch,
+        "export",
+        "-b",
+        "chrome",
+        "-l",
+        libraries["chrome"],
+        "-s",
+        "bookmarks",
+        "-t",
+        old,
+        "--no-cache",
+    )
+
+    args = ["diff", old, "-b", "chrome", "-l", libraries["chrome"], "-s", "bookmarks"]
+    with pytest.raises(ValueError):
+        run(monkeypatch, *args)
+
+    target = str(tmp_path / "diff.jsonl")
+    run(monkeypatch, *args, "--trust-pickle", "-t", target)
+    with open(target, encoding="utf-8") as f:
+        assert not f.read()
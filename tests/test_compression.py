@@ -0,0 +1,73 @@
+import os
+
+import pytest
+
+from resworb.base import Bookmark, CloudTabDevice, HistoryItem, Tab
+from resworb.commands.cli import get_exporter
+from resworb.compression import open_compressed, split_compression
+from resworb.reader import read_export
+
+MAGICS = {
+    "gzip": b"\x1f\x8b",
+    "zstd": b"\x28\xb5\x2f\xfd",
+    "lz4": b"\x04\x22\x4d\x18",
+}
+
+
+def get_data():
+    return {
+        "cloud_tabs": [
+            CloudTabDevice("device", "Phone", [Tab("t", "https://example.com/t")])
+        ],
+        "bookmarks": [Bookmark("b", "https://example.com/b", ("Bar", "Folder"))],
+        "histories": [
+            HistoryItem(i, f"https://example.com/{i}", "h", 1675123200000000 + i)
+            for i in range(1000)
+        ],
+    }
+
+
+@pytest.mark.parametrize(
+    "filename, expected",
+    [
+        ("export.jsonl.gz", ("export.jsonl", "gzip")),
+        ("export.yaml.ZST", ("export.yaml", "zstd")),
+        ("export.msgpack.lz4", ("export.msgpack", "lz4")),
+        ("export.jsonl", ("export.jsonl", None)),
+        ("export.jsonl.bz2", ("export.jsonl.bz2", None)),
+    ],
+)
+def test_split_compression(filename, expected):
+    assert split_compression(filename) == expected
+
+
+@pytest.mark.parametrize(
+    "extension, compression",
+    [(".jsonl", ".gz"), (".yaml", ".zst"), (".msgpack", ".lz4")],
+)
+def test_round_trip(tmp_path, extension, compression):
+    if compression == ".zst":
+        pytest.importorskip("zstandard")
+    elif compression == ".lz4":
+        pytest.importorskip("lz4")
+    if extension == ".msgpack":
+        pytest.importorskip("msgpack")
+
+    plain = str(tmp_path / f"export{extension}")
+    compressed = plain + compression
+    for filename in [plain, compressed]:
+        get_exporter(filename).export_to_file(get_data(), filename)
+
+    # The compressed export is smaller and reads back like the plain one.
+    with open(compressed, mode="rb") as f:
+        assert f.read(4).startswith(MAGICS[split_compression(compressed)[1]])
+    assert os.path.getsize(compressed) < os.path.getsize(plain)
+
+    records = list(read_export(compressed))
+    assert records == list(read_export(plain))
+    assert len(records) == 1002
+
+
+def test_unsupported_compression(tmp_path):
+    with pytest.raises(ValueError):
+        open_compressed(str(tmp_path / "export.jsonl.bz2"), "wb", "bzip2")
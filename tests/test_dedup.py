@@ -0,0 +1,65 @@
+import pytest
+
+from resworb.dedup import (
+    BloomDeduplicator,
+    DigestDeduplicator,
+    ExactDeduplicator,
+    canonicalize_url,
+)
+
+URLS = [
+    "https://example.com/a",
+    "https://example.com/a#comments",
+    "https://EXAMPLE.com/a?utm_source=feed",
+    "https://example.com/b?page=2",
+]
+
+
+def urls(deduplicator, items):
+    return [x["url"] for x in deduplicator({"url": x} for x in items)]
+
+
+def test_canonicalize_url():
+    assert {canonicalize_url(x) for x in URLS[:3]} == {"https://example.com/a"}
+    assert canonicalize_url(URLS[3]) == URLS[3]
+
+
+@pytest.mark.parametrize(
+    "factory",
+    [
+        ExactDeduplicator,
+        DigestDeduplicator,
+        lambda **kwargs: DigestDeduplicator(bits=128, **kwargs),
+        BloomDeduplicator,
+    ],
+)
+def test_canonicalize_is_opt_in(factory):
+    assert urls(factory(), URLS + URLS) == URLS
+    assert urls(factory(canonicalize=True), URLS) == [URLS[0], URLS[3]]
+
+
+@pytest.mark.parametrize("bits", [64, 128])
+def test_digest_table_grows(bits):
+    items = [f"https://example.com/{i % 5000}" for i in range(20000)]
+
+    deduplicator = DigestDeduplicator(bits=bits)
+    assert urls(deduplicator, items) == items[:5000]
+    assert len(deduplicator) == 5000
+
+    # At most half of the slots are used, 8 bytes a slot per 64 bits.
+    assert deduplicator.num_slots == 16384
+    assert len(deduplicator.table) * 64 == deduplicator.num_slots * bits
+
+
+def test_invalid_digest_size():
+    with pytest.raises(ValueError):
+        DigestDeduplicator(bits=32)
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [{"capacity": 0}, {"capacity": -1}, {"error_rate": 0}, {"error_rate": 1}],
+)
+def test_invalid_bloom_parameters(kwargs):
+    with pytest.raises(ValueError):
+        BloomDeduplicator(**kwargs)
@@ -0,0 +1,163 @@
+import datetime
+
+from resworb.base import Bookmark, CloudTabDevice, HistoryItem, Tab
+from resworb.diff import diff_records
+
+
+def diff(old, new, sources=None):
+    # The streams are consumed in order.
+    return {
+        change: list(rows)
+        for change, rows in diff_records(lambda: iter(old), iter(new), sources)
+    }
+
+
+def test_diff_bookmarks():
+    # Folders identify a bookmark, titles can change.
+    old = [
+        ("bookmarks", Bookmark("A", "https://a.test/", ("Bar",))),
+        ("bookmarks", Bookmark("B", "https://b.test/", ("Bar",))),
+        ("bookmarks", Bookmark("C", "https://c.test/", ("Bar",))),
+    ]
+    new = [
+        ("bookmarks", Bookmark("A", "https://a.test/", ("Bar",))),
+        ("bookmarks", Bookmark("B2", "https://b.test/", ("Bar",))),
+        ("bookmarks", Bookmark("C", "https://c.test/", ("Bar", "Sub"))),
+        ("bookmarks", Bookmark("D", "https://d.test/", ())),
+    ]
+
+    assert diff(old, new) == {
+        "added": [
+            {
+                "change": "added",
+                "source": "bookmarks",
+                "title": "C",
+                "url": "https://c.test/",
+                "folders": ("Bar", "Sub"),
+            },
+            {
+                "change": "added",
+                "source": "bookmarks",
+                "title": "D",
+                "url": "https://d.test/",
+                "folders": (),
+            },
+        ],
+        "removed": [
+            {
+                "change": "removed",
+                "source": "bookmarks",
+                "title": "C",
+                "url": "https://c.test/",
+                "folders": ("Bar",),
+            }
+        ],
+        "changed": [
+            {
+                "change": "changed",
+                "source": "bookmarks",
+                "title": "B2",
+                "url": "https://b.test/",
+                "folders": ("Bar",),
+                "previous": {"title": "B"},
+            }
+        ],
+    }
+
+
+def test_diff_unchanged():
+    # Records of other sources and profiles are ignored.
+    old = [
+        ("readings", {"title": "r", "url": "https://r.test/", "profile": "Default"}),
+        ("bookmarks", Bookmark("A", "https://a.test/", ())),
+    ]
+    new = [
+        ("readings", Tab("r", "https://r.test/")),
+        ("bookmarks", Bookmark("A2", "https://a.test/", ())),
+    ]
+
+    assert diff(old, new, sources=["readings"]) == {
+        "added": [],
+        "removed": [],
+        "changed": [],
+    }
+    assert [x["url"] for x in diff(old, new)["changed"]] == ["https://a.test/"]
+
+
+def test_diff_cloud_tabs():
+    # Devices are flattened to their tabs, renamed devices change their tabs.
+    old = [
+        (
+            "cloud_tabs",
+            CloudTabDevice("d1", "iPhone", [Tab("a", "https://a.test/")]),
+        ),
+    ]
+    new = [
+        (
+            "cloud_tabs",
+            {
+                "id": "d1",
+                "name": "My iPhone",
+                "tabs": [Tab("a", "https://a.test/"), Tab("b", "https://b.test/")],
+                "profile": "default",
+            },
+        ),
+        ("cloud_tabs", CloudTabDevice("d2", "iPad", [Tab("a", "https://a.test/")])),
+    ]
+
+    changes = diff(old, new)
+    assert changes["added"] == [
+        {
+            "change": "added",
+            "source": "cloud_tabs",
+            "title": "b",
+            "url": "https://b.test/",
+            "device_id": "d1",
+            "device_name": "My iPhone",
+            "profile": "default",
+        },
+        {
+            "change": "added",
+            "source": "cloud_tabs",
+            "title": "a",
+            "url": "https://a.test/",
+            "device_id": "d2",
+            "device_name": "iPad",
+        },
+    ]
+    assert not changes["removed"]
+    assert changes["changed"] == [
+        {
+            "change": "changed",
+            "source": "cloud_tabs",
+            "title": "a",
+            "url": "https://a.test/",
+            "device_id": "d1",
+            "device_name": "My iPhone",
+            "previous": {"title": "a", "device_name": "iPhone"},
+        }
+    ]
+
+
+def test_diff_histories():
+    # Text timestamps of exports only keep the seconds, raw ones match them.
+    visit = datetime.datetime(2020, 1, 1, 10, 0, 0)
+    raw = int(visit.timestamp()) * 1000000
+
+    old = [
+        ("histories", HistoryItem(1, "https://a.test/", "a", "2020-01-01 10:00:00")),
+        ("histories", HistoryItem(1, "https://a.test/", "a", "2020-01-01 11:00:00")),
+    ]
+    new = [
+        ("histories", HistoryItem(1, "https://a.test/", "a", raw + 999999)),
+        ("histories", HistoryItem(1, "https://a.test/", "a", raw + 1000000)),
+    ]
+
+    changes = diff(old, new)
+    assert [(x["change"], x["visit_time"]) for x in changes["added"]] == [
+        ("added", raw + 1000000)
+    ]
+    assert [(x["change"], x["visit_time"]) for x in changes["removed"]] == [
+        ("removed", raw + 3600 * 1000000)
+    ]
+    assert not changes["changed"]
@@ -0,0 +1,107 @@
+import datetime
+
+import pytest
+
+from resworb.base import Bookmark, CloudTabDevice, HistoryItem, Tab
+from resworb.commands.cli import EXPORT_FACTORY, get_exporter
+
+# 2023-01-31 00:00:00 UTC in epoch microseconds.
+VISIT_TIME = 1675123200000000
+
+
+def get_data():
+    return {
+        "cloud_tabs": [
+            CloudTabDevice("device", "Phone", [Tab("t", "https://example.com/t")])
+        ],
+        "bookmarks": [Bookmark("b", "https://example.com/b", ("Bar", "Folder"))],
+        "histories": [HistoryItem(1, "https://example.com/h", "h", VISIT_TIME)],
+    }
+
+
+@pytest.mark.parametrize(
+    "extension",
+    [x for x in EXPORT_FACTORY if x not in {".yaml", ".ndjson", ".pickle", ".sqlite"}],
+)
+def test_entry_points_agree(tmp_path, extension):
+    # Exporting a dict or streaming its items writes the same file.
+    if extension in {".parquet", ".arrows"}:
+        pytest.importorskip("pyarrow")
+    elif extension == ".msgpack":
+        pytest.importorskip("msgpack")
+
+    to_file, stream = tmp_path / f"file{extension}", tmp_path / f"stream{extension}"
+    get_exporter(str(to_file)).export_to_file(get_data(), str(to_file))
+    get_exporter(str(stream)).export_stream(iter(get_data().items()), str(stream))
+
+    assert to_file.read_bytes() == stream.read_bytes()
+
+
+@pytest.mark.parametrize("extension", [".json", ".yml", ".toml", ".jsonl"])
+def test_text_timestamps(tmp_path, extension):
+    filename = tmp_path / f"export{extension}"
+    get_exporter(str(filename)).export_to_file(get_data(), str(filename))
+
+    text = filename.read_text(encoding="utf-8")
+    assert str(VISIT_TIME) not in text
+    assert "2023-01-3" in text
+
+
+def read_arrow(filename):
+    # The schema and the number of rows of every batch (row group).
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    if filename.endswith(".parquet"):
+        parquet = pq.ParquetFile(filename)
+        sizes = [
+            parquet.metadata.row_group(i).num_rows
+            for i in range(parquet.num_row_groups)
+        ]
+        return parquet.read(), sizes
+
+    with pa.ipc.open_stream(filename) as reader:
+        batches = list(reader)
+
+    return pa.Table.from_batches(batches), [x.num_rows for x in batches]
+
+
+@pytest.mark.parametrize("extension", [".parquet", ".arrows"])
+def test_arrow_table(tmp_path, extension):
+    pa = pytest.importorskip("pyarrow")
+
+    data = get_data()
+    data["cloud_tabs"][0].tabs += [Tab("u", "https://example.com/u")]
+    data["histories"] += [
+        HistoryItem(i, f"https://example.com/h{i}", "h", "2023-01-31 08:00:00")
+        for i in range(2, 12)
+    ]
+
+    filename = str(tmp_path / f"export{extension}")
+    exporter = get_exporter(filename)
+    exporter.chunk_size = 4
+    exporter.export_to_file(data, filename)
+
+    table, sizes = read_arrow(filename)
+    assert sizes == [4, 4, 4, 2]
+
+    schema = table.schema
+    assert schema.field("visit_time").type == pa.timestamp("us", tz="UTC")
+    for name in ["source", "url", "title", "device_id", "device_name"]:
+        assert pa.types.is_dictionary(schema.field(name).type)
+
+    rows = table.to_pylist()
+    # Cloud tabs are expanded with their device.
+    assert [
+        (x["source"], x["url"], x["device_id"], x["device_name"]) for x in rows[:3]
+    ] == [
+        ("cloud_tabs", "https://example.com/t", "device", "Phone"),
+        ("cloud_tabs", "https://example.com/u", "device", "Phone"),
+        ("bookmarks", "https://example.com/b", None, None),
+    ]
+    assert rows[2]["folders"] == ["Bar", "Folder"]
+
+    # Raw and local time strings are both converted to UTC timestamps.
+    visit_times = [int(x["visit_time"].timestamp() * 1000000) for x in rows[3:]]
+    local = int(datetime.datetime(2023, 1, 31, 8).timestamp() * 1000000)
+    assert visit_times == [VISIT_TIME] + [local] * 10
@@ -0,0 +1,136 @@
+import json
+import os
+
+import fixtures
+import lz4.block
+import pytest
+
+from resworb.base import Tab
+from resworb.browsers.firefox import Firefox, _prune_session_object
+
+
+def session(name):
+    # One window with a tab, a closed tab and a closed window.
+    def _tab(index, *urls):
+        tab = {
+            "entries": [
+                {
+                    "url": f"https://example.com/{name}/{x}",
+                    "title": f"{name} {x}",
+                    "formdata": {"id": {"q": "query"}},
+                    "children": [{"url": "https://ads.example.com/", "scroll": "0"}],
+                }
+                for x in urls
+            ],
+        }
+        if index is not None:
+            tab["index"] = index
+
+        return tab
+
+    return {
+        "windows": [
+            {
+                "tabs": [_tab(2, "a", "b", "c"), _tab(None, "d", "e")],
+                "_closedTabs": [{"state": _tab(1, "f"), "closedAt": 0}],
+            }
+        ],
+        "_closedWindows": [{"title": "closed", "tabs": [_tab(1, "g")]}],
+    }
+
+
+def test_prune_session_object():
+    data = json.loads(json.dumps(session("s")), object_hook=_prune_session_object)
+
+    window = data["windows"][0]
+    # The current entry, or the last one without an index.
+    assert window["tabs"] == [
+        Tab("s b", "https://example.com/s/b"),
+        Tab("s e", "https://example.com/s/e"),
+    ]
+    assert window["_closedTabs"][0]["state"] == Tab("s f", "https://example.com/s/f")
+
+    # Entries are reduced to their url and title.
+    assert _prune_session_object(
+        {"url": "https://example.com/", "title": "t", "scroll": "0"}
+    ) == {"url": "https://example.com/", "title": "t"}
+
+
+@pytest.mark.parametrize(
+    "index, expected",
+    [(0, "a"), (1, "a"), (2, "b"), (5, "b")],
+)
+def test_prune_session_object_index(index, expected):
+    entries = [{"url": x, "title": x} for x in ["a", "b"]]
+    tab = _prune_session_object({"entries": entries, "index": index})
+
+    assert tab == Tab(expected, expected)
+
+
+def test_prune_session_object_empty():
+    assert _prune_session_object({"entries": []}) == Tab(None, None)
+    assert _prune_session_object({"windows": []}) == {"windows": []}
+
+
+@pytest.fixture
+def profile(tmp_path):
+    # A profile directory with no session file yet.
+    os.makedirs(tmp_path / "sessionstore-backups")
+    (tmp_path / "places.sqlite").touch()
+
+    return tmp_path
+
+
+def write(profile, name, data):
+    filename = os.path.join(profile, name)
+    if isinstance(data, bytes):
+        with open(filename, mode="wb") as f:
+            f.write(data)
+    else:
+        fixtures.write_jsonlz4(filename, data)
+
+
+def get_urls(profile):
+    return [x.url for x in Firefox(str(profile)).get_opened_tabs()]
+
+
+def test_session_order(profile):
+    write(profile, "sessionstore.jsonlz4", session("sessionstore"))
+    assert get_urls(profile)[0] == "https://example.com/sessionstore/b"
+
+    write(profile, "sessionstore-backups/previous.jsonlz4", session("previous"))
+    assert get_urls(profile)[0] == "https://example.com/previous/b"
+
+    write(profile, "sessionstore-backups/recovery.baklz4", session("backup"))
+    assert get_urls(profile)[0] == "https://example.com/backup/b"
+
+    write(profile, "sessionstore-backups/recovery.jsonlz4", session("recovery"))
+    assert get_urls(profile)[0] == "https://example.com/recovery/b"
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        # Not LZ4 at all, a corrupted block and truncated JSON.
+        json.dumps(session("recovery")).encode("utf-8"),
+        b"mozLz40\0" + b"\xff" * 64,
+        b"mozLz40\0" + lz4.block.compress(b'{"windows": [{"tabs": '),
+    ],
+    ids=["json", "lz4", "truncated"],
+)
+def test_session_fallback(profile, data):
+    write(profile, "sessionstore-backups/recovery.jsonlz4", data)
+    write(profile, "sessionstore-backups/previous.jsonlz4", session("previous"))
+
+    assert get_urls(profile)[0] == "https://example.com/previous/b"
+
+
+def test_session_missing(profile):
+    # A profile which has never been opened has no tabs, unreadable session
+    # files are an error.
+    assert not get_urls(profile)
+    assert not list(Firefox(str(profile)).get_closed_tabs())
+
+    write(profile, "sessionstore.jsonlz4", b"mozLz40\0")
+    with pytest.raises(RuntimeError):
+        Firefox(str(profile)).get_session()
@@ -0,0 +1,246 @@
+import http.server
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from resworb.base import HistoryItem, Tab, replace_item
+from resworb.formatter import FormatterCache, FormatterRunner, HTTPFormatter
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    # Keep-alive needs HTTP/1.1 (and a content length).
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        server = self.server
+        with server.lock:
+            server.connections.add(self.client_address)
+            server.requests += 1
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+
+        try:
+            # `/<delay in ms>/<title>`, `/error` or `/slow`.
+            if self.path == "/error":
+                self.send_error(500)
+                return
+
+            if self.path == "/slow":
+                time.sleep(1.0)
+                delay, title = 0, "slow"
+            else:
+                delay, title = self.path.strip("/").split("/")
+            time.sleep(int(delay) / 1000)
+
+            body = title.upper().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except ConnectionError:
+            # The client timed out.
+            self.close_connection = True
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.lock = threading.Lock()
+    server.connections = set()
+    server.requests = 0
+    server.active = 0
+    server.max_active = 0
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+class TitleFormatter(HTTPFormatter):
+    # Titles of the local server's urls are fetched, in upper case.
+    def __init__(self, base, **kwargs):
+        super().__init__(**kwargs)
+        self.base = base
+
+    def match(self, item):
+        return item["url"].startswith(self.base)
+
+    def format(self, item):
+        return replace_item(item, title=self.fetch(item["url"]).decode("utf-8"))
+
+
+def get_base(server):
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def test_order(server):
+    # Later urls respond first, unmatched ones are not fetched.
+    base = get_base(server)
+    items = []
+    for i in range(40):
+        if i % 3 == 0:
+            items += [Tab(title=f"t{i}", url=f"https://example.com/{i}")]
+        else:
+            items += [Tab(title=f"t{i}", url=f"{base}/{(40 - i) * 2}/t{i}")]
+
+    formatter = TitleFormatter(base, pool_size=8)
+    results = list(FormatterRunner([formatter], max_workers=8)(items))
+
+    assert [x["url"] for x in results] == [x["url"] for x in items]
+    assert [x["title"] for x in results] == [
+        f"t{i}" if i % 3 == 0 else f"T{i}" for i in range(40)
+    ]
+
+
+def test_concurrency_limit(server):
+    base = get_base(server)
+    items = [Tab(title=f"t{i}", url=f"{base}/20/t{i}") for i in range(40)]
+
+    formatter = TitleFormatter(base, pool_size=4)
+    results = list(FormatterRunner([formatter], max_workers=4)(items))
+
+    assert len(results) == 40
+    assert 1 < server.max_active <= 4
+
+
+def test_keep_alive(server):
+    # Connections are reused: no more than one per worker.
+    base = get_base(server)
+    items = [Tab(title=f"t{i}", url=f"{base}/5/t{i}") for i in range(40)]
+
+    formatter = TitleFormatter(base, pool_size=4)
+    list(FormatterRunner([formatter], max_workers=4)(items))
+
+    assert len(server.connections) <= 4
+
+
+@pytest.mark.parametrize("path", ["/slow", "/error"])
+def test_failures_keep_records(server, path):
+    base = get_base(server)
+    items = [
+        Tab(title="failed", url=f"{base}{path}"),
+        Tab(title="t1", url=f"{base}/0/t1"),
+    ]
+
+    formatter = TitleFormatter(base, timeout=0.2)
+    results = list(FormatterRunner([formatter], max_workers=2)(items))
+
+    assert [x["title"] for x in results] == ["failed", "T1"]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = FormatterCache(str(tmp_path / "cache.sqlite"))
+    try:
+        yield cache
+    finally:
+        cache.close()
+
+
+def age(cache, seconds):
+    with cache.lock:
+        cache.conn.execute(
+            "UPDATE cache SET created = created - ?, accessed = accessed - ?",
+            (seconds, seconds),
+        )
+
+
+def test_cache(server, cache):
+    # Repeated urls are not fetched again until they expire, other fields of
+    # the records are kept.
+    base = get_base(server)
+    formatter = TitleFormatter(base, cache=cache)
+    url = f"{base}/0/title"
+
+    assert formatter(HistoryItem(1, url, "t", 1))["title"] == "TITLE"
+    assert formatter(HistoryItem(2, url, "t", 2)) == HistoryItem(2, url, "TITLE", 2)
+    assert server.requests == 1
+
+    age(cache, cache.ttl - 60)
+    assert formatter(HistoryItem(3, url, "t", 3))["title"] == "TITLE"
+    assert server.requests == 1
+
+    age(cache, 120)
+    assert formatter(HistoryItem(4, url, "t", 4))["title"] == "TITLE"
+    assert server.requests == 2
+
+
+def test_cache_failures(server, cache):
+    # Failures are cached for `negative_ttl`, the records are kept.
+    base = get_base(server)
+    formatter = TitleFormatter(base, cache=cache)
+    item = Tab(title="failed", url=f"{base}/error")
+
+    assert formatter(item) == item
+    assert cache.get("TitleFormatter", item["url"]) == (True, None)
+    assert formatter(item) == item
+    assert server.requests == 1
+
+    age(cache, cache.negative_ttl + 60)
+    assert cache.get("TitleFormatter", item["url"]) == (False, None)
+    assert formatter(item) == item
+    assert server.requests == 2
+
+
+@pytest.mark.parametrize(
+    "limits",
+    [{"max_entries": 2}, {"max_bytes": 2 * len('https://example.com/0{"title": "0"}')}],
+    ids=["entries", "bytes"],
+)
+def test_cache_eviction(tmp_path, monkeypatch, limits):
+    # The least recently used entries are evicted.
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+
+    cache = FormatterCache(str(tmp_path / "cache.sqlite"), **limits)
+    try:
+        for i in range(3):
+            now[0] += 1
+            cache.set("ns", f"https://example.com/{i}", {"title": str(i)})
+            if i == 1:
+                now[0] += 1
+                assert cache.get("ns", "https://example.com/0")[0]
+
+        assert [cache.get("ns", f"https://example.com/{i}")[0] for i in range(3)] == [
+            True,
+            False,
+            True,
+        ]
+    finally:
+        cache.close()
+
+
+def test_cache_purge(tmp_path):
+    filename = str(tmp_path / "cache.sqlite")
+    cache = FormatterCache(filename)
+    cache.set("ns", "https://example.com/expired", {"title": "t"})
+    cache.set("ns", "https://example.com/failed", None)
+    cache.set("ns", "https://example.com/fresh", {"title": "t"})
+    age(cache, 2 * 24 * 3600)
+    cache.set("ns", "https://example.com/fresh", {"title": "t"})
+    cache.close()
+
+    # Expired entries are dropped when the cache is opened.
+    cache = FormatterCache(filename, ttl=24 * 3600)
+    cache.close()
+
+    conn = sqlite3.connect(filename)
+    try:
+        assert conn.execute("SELECT url FROM cache").fetchall() == [
+            ("https://example.com/fresh",)
+        ]
+    finally:
+        conn.close()
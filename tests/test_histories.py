@@ -0,0 +1,209 @@
+import datetime
+import os
+import sqlite3
+import urllib.parse
+
+import pytest
+
+from resworb.commands.cli import get_browser_class
+
+# 100 and 200 days after the first visit of the fixtures.
+SINCE = 1577836800 + 100 * 86400
+UNTIL = 1577836800 + 200 * 86400
+
+
+@pytest.fixture(params=["chrome", "firefox", "safari"])
+def browser(request, libraries):
+    return get_browser_class(request.param)(libraries[request.param])
+
+
+def get_histories(browser, **kwargs):
+    return [
+        (x["url"], x["visit_time"])
+        for x in browser.get_histories(raw_time=True, **kwargs)
+    ]
+
+
+def test_order(browser):
+    # The most recent first, whatever the unit of the raw column.
+    histories = get_histories(browser)
+    times = [x for _, x in histories]
+    assert times == sorted(times, reverse=True)
+    # The visits of the fixtures span 2020.
+    assert SINCE * 1000000 < times[0] < (SINCE + 300 * 86400) * 1000000
+
+    local = [x["visit_time"] for x in browser.get_histories()]
+    assert local == sorted(local, reverse=True)
+
+
+@pytest.mark.parametrize(
+    "since, until",
+    [
+        (SINCE, None),
+        (None, UNTIL),
+        (SINCE, UNTIL),
+        (
+            datetime.datetime.fromtimestamp(SINCE, tz=datetime.timezone.utc),
+            datetime.datetime.fromtimestamp(UNTIL, tz=datetime.timezone.utc),
+        ),
+    ],
+)
+def test_since_until(browser, since, until):
+    # `since` is inclusive and `until` exclusive.
+    def _timestamp(x):
+        return x.timestamp() if isinstance(x, datetime.datetime) else x
+
+    histories = get_histories(browser)
+    expected = [
+        (url, x)
+        for url, x in histories
+        if (since is None or x >= _timestamp(since) * 1000000)
+        and (until is None or x < _timestamp(until) * 1000000)
+    ]
+    assert 0 < len(expected) < len(histories)
+
+    assert get_histories(browser, since=since, until=until) == expected
+
+
+def test_url_like(browser):
+    histories = get_histories(browser)
+    expected = [x for x in histories if "/python/" in x[0]]
+    assert 0 < len(expected) < len(histories)
+
+    assert get_histories(browser, url_like="%/python/%") == expected
+    assert get_histories(browser, url_like="%/PYTHON/%") == expected
+
+
+@pytest.mark.parametrize(
+    "domain, hostnames",
+    [
+        ("google.com", {"www.google.com"}),
+        (".GitHub.com.", {"github.com"}),
+        ("wikipedia.org", {"en.wikipedia.org"}),
+        ("org", {"en.wikipedia.org", "docs.python.org", "arxiv.org"}),
+        ("ikipedia.org", set()),
+        # LIKE wildcards are matched literally.
+        ("git_ub.com", set()),
+        ("%.com", set()),
+    ],
+)
+def test_domain(browser, domain, hostnames):
+    histories = get_histories(browser)
+    expected = [
+        x for x in histories if urllib.parse.urlsplit(x[0]).hostname in hostnames
+    ]
+
+    assert get_histories(browser, domain=domain) == expected
+
+
+def test_limit(browser):
+    histories = get_histories(browser)
+    github = [
+        x for x in histories if urllib.parse.urlsplit(x[0]).hostname == "github.com"
+    ]
+
+    assert get_histories(browser, limit=10) == histories[:10]
+    assert get_histories(browser, domain="github.com", limit=5) == github[:5]
+    assert not get_histories(browser, limit=0)
+
+
+# Every visit of the fixtures as (url, unix time).
+VISITS = {
+    "chrome": (
+        "History",
+        "SELECT urls.url, visits.visit_time / 1000000 - 11644473600"
+        " FROM visits INNER JOIN urls ON urls.id = visits.url",
+    ),
+    "firefox": (
+        "places.sqlite",
+        "SELECT url, visit_date / 1000000 FROM moz_historyvisits"
+        " INNER JOIN moz_places ON moz_places.id = place_id",
+    ),
+    "safari": (
+        "History.db",
+        "SELECT url, visit_time + 978307200 FROM history_visits"
+        " INNER JOIN history_items ON history_items.id = history_item",
+    ),
+}
+
+GROUPS = {
+    "url": lambda url, _: url,
+    "domain": lambda url, _: urllib.parse.urlsplit(url).hostname,
+    "day": lambda _, x: datetime.datetime.fromtimestamp(x).strftime("%Y-%m-%d"),
+}
+
+
+def get_visits(browser):
+    filename, sql = VISITS[type(browser).__name__.lower()]
+    conn = sqlite3.connect(os.path.join(browser.library, filename))
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def summarize(visits, group_by):
+    # {key: (visits, last visit time)}
+    summary = {}
+    for url, x in visits:
+        key = GROUPS[group_by](url, x)
+        count, last = summary.get(key, (0, x))
+        summary[key] = (count + 1, max(last, x))
+
+    return {
+        key: (
+            count,
+            datetime.datetime.fromtimestamp(int(last)).strftime("%Y-%m-%d %H:%M:%S"),
+        )
+        for key, (count, last) in summary.items()
+    }
+
+
+@pytest.mark.parametrize("group_by", ["url", "domain", "day"])
+def test_summary(browser, group_by):
+    rows = list(browser.get_history_summary(group_by=group_by))
+
+    assert {x[group_by]: (x["visits"], x["last_visit_time"]) for x in rows} == (
+        summarize(get_visits(browser), group_by)
+    )
+
+    # Days are the most recent first, others the most visited first.
+    if group_by == "day":
+        keys = [x["day"] for x in rows]
+        assert keys == sorted(keys, reverse=True)
+    else:
+        counts = [x["visits"] for x in rows]
+        assert counts == sorted(counts, reverse=True)
+
+    assert list(browser.get_history_summary(group_by=group_by, top_n=3)) == rows[:3]
+
+
+def test_summary_filters(browser):
+    visits = [
+        (url, x)
+        for url, x in get_visits(browser)
+        if SINCE <= x < UNTIL and "/python/" in url
+    ]
+    rows = browser.get_history_summary(
+        group_by="domain",
+        since=SINCE,
+        until=UNTIL,
+        url_like="%/python/%",
+    )
+    expected = summarize(visits, "domain")
+    assert 1 < len(expected) < len(summarize(get_visits(browser), "url"))
+    assert {x["domain"]: (x["visits"], x["last_visit_time"]) for x in rows} == (
+        expected
+    )
+
+    rows = browser.get_history_summary(group_by="domain", domain="org")
+    assert {x["domain"] for x in rows} == {
+        "en.wikipedia.org",
+        "docs.python.org",
+        "arxiv.org",
+    }
+
+
+def test_summary_unsupported_group(browser):
+    with pytest.raises(ValueError):
+        list(browser.get_history_summary(group_by="title"))
@@ -0,0 +1,74 @@
+import gzip
+import os
+import time
+
+import pytest
+
+from resworb.base import HistoryItem
+from resworb.exporter import JSONExporter
+from resworb.files import write_atomic
+from resworb.metrics import Metrics
+
+
+def make_records():
+    yield "histories", (
+        HistoryItem(id=i, url=f"https://example.com/{i}", title="Example")
+        for i in range(100)
+    )
+
+
+def test_consume_times_consumer():
+    # Work done after the last record is pulled belongs to the consumer.
+    def _consumer(records):
+        items = [x for _, values in records for x in values]
+        time.sleep(0.1)
+        return len(items)
+
+    metrics = Metrics()
+    assert metrics.consume("serialize", make_records(), _consumer) == 100
+
+    (stats,) = metrics.report()
+    assert stats["stage"] == "serialize"
+    assert stats["rows"] == 100
+    assert stats["seconds"] >= 0.1
+    assert stats["bytes"] is None
+
+
+def test_consume_counts_bytes(tmp_path):
+    metrics = Metrics()
+    for filename, compression in [("export.json", None), ("export.json.gz", "gzip")]:
+        target = str(tmp_path / filename)
+        exporter = JSONExporter(compression=compression)
+        metrics.consume(
+            "serialize",
+            make_records(),
+            lambda x: exporter.export_stream(
+                x, target
+            ),  # pylint: disable=cell-var-from-loop
+            bytes_=lambda: exporter.bytes_written,  # pylint: disable=cell-var-from-loop
+        )
+
+    plain, compressed = metrics.report()
+    size = os.path.getsize(tmp_path / "export.json")
+    assert plain["bytes"] == size
+
+    # Bytes are counted before compression.
+    assert compressed["bytes"] == size
+    with gzip.open(tmp_path / "export.json.gz", "rb") as f:
+        assert len(f.read()) == size
+
+
+def test_write_atomic(tmp_path):
+    filename = tmp_path / "metrics.json"
+    write_atomic(str(filename), lambda f: f.write("old"))
+
+    # A failed write keeps the previous file and leaves no temp file behind.
+    def _fail(f):
+        f.write("new")
+        raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        write_atomic(str(filename), _fail)
+
+    assert filename.read_text() == "old"
+    assert os.listdir(tmp_path) == ["metrics.json"]
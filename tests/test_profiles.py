@@ -0,0 +1,89 @@
+import os
+import shutil
+
+import pytest
+
+from resworb.browsers.chrome import Chrome
+from resworb.checkpoint import Checkpoint
+from resworb.profiles import export_profiles, merge_profiles
+
+
+@pytest.fixture
+def user_data(tmp_path, libraries):
+    # A Chrome user data directory with two profiles.
+    for name in ["Default", "Profile 1"]:
+        shutil.copytree(libraries["chrome"], tmp_path / name)
+
+    return str(tmp_path)
+
+
+def test_merge_profiles(user_data):
+    browser = Chrome(os.path.join(user_data, "Default"))
+    expected = {
+        source: len(list(records))
+        for source, records in browser.iter_export(["bookmarks", "histories"])
+    }
+
+    results = list(
+        export_profiles(
+            Chrome,
+            library=user_data,
+            max_workers=2,
+            kinds=["bookmarks", "histories"],
+        )
+    )
+    assert [name for name, _ in results] == ["Default", "Profile 1"]
+
+    filenames = [x for _, records in results for x in records.filenames.values()]
+    assert all(os.path.exists(x) for x in filenames)
+
+    merged = {}
+    for source, records in merge_profiles(results):
+        for record in records:
+            key = (source, record["profile"])
+            merged[key] = merged.get(key, 0) + 1
+
+    assert merged == {
+        (source, profile): count
+        for source, count in expected.items()
+        for profile in ["Default", "Profile 1"]
+    }
+
+    # Spooled records are removed once read.
+    assert not any(os.path.exists(x) for x in filenames)
+
+
+def test_export_profiles_checkpoint(tmp_path, user_data):
+    # Workers export with a copy of the checkpoint, their watermarks are
+    # merged back.
+    def _export(checkpoint):
+        return {
+            (name, source): len(list(records.get(source)))
+            for name, records in export_profiles(
+                Chrome,
+                library=user_data,
+                max_workers=2,
+                checkpoint=checkpoint,
+                kinds=["histories"],
+            )
+            for source in records
+        }
+
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.json"))
+    counts = _export(checkpoint)
+    assert set(counts) == {("Default", "histories"), ("Profile 1", "histories")}
+    assert all(x > 0 for x in counts.values())
+
+    assert checkpoint.watermarks == {
+        browser._get_checkpoint_profile(): {  # pylint: disable=protected-access
+            "histories": browser.get_history_watermark()
+        }
+        for browser in [
+            Chrome(os.path.join(user_data, x)) for x in ["Default", "Profile 1"]
+        ]
+    }
+
+    assert _export(checkpoint) == {
+        ("Default", "histories"): 0,
+        ("Profile 1", "histories"): 0,
+    }
@@ -0,0 +1,88 @@
+import os
+import pickle
+
+import pytest
+
+from resworb.base import Bookmark, HistoryItem
+from resworb.exporter import MSGPACK_FRAME, MSGPACK_MAGIC, MessagePackExporter
+from resworb.reader import MessagePackReader, read_export
+
+
+def test_read_pickle(tmp_path):
+    filename = str(tmp_path / "export.pkl")
+    with open(filename, mode="wb") as f:
+        pickle.dump({"bookmarks": [{"title": "b", "url": "https://example.com/"}]}, f)
+
+    # Unpickling can run arbitrary code, it has to be asked for.
+    with pytest.raises(ValueError):
+        list(read_export(filename))
+
+    assert list(read_export(filename, trust_pickle=True)) == [
+        ("bookmarks", {"title": "b", "url": "https://example.com/"})
+    ]
+
+
+@pytest.fixture
+def msgpack_export(tmp_path):
+    # Frames of at most 3 records: 4 of histories, then 1 of bookmarks.
+    pytest.importorskip("msgpack")
+
+    filename = str(tmp_path / "export.msgpack")
+    exporter = MessagePackExporter()
+    exporter.chunk_size = 3
+    exporter.export_stream(
+        [
+            (
+                "histories",
+                (HistoryItem(i, f"https://example.com/{i}", "h", i) for i in range(10)),
+            ),
+            ("bookmarks", [Bookmark(f"b{i}", f"https://b.test/{i}") for i in range(2)]),
+        ],
+        filename,
+    )
+
+    return filename
+
+
+def test_msgpack_frames(msgpack_export):
+    reader = MessagePackReader(msgpack_export)
+    # pylint: disable=protected-access
+    with open(msgpack_export, mode="rb") as f:
+        frames = [(source, count) for source, count, _ in reader._iter_frames(f)]
+    assert frames == [("histories", 3)] * 3 + [("histories", 1), ("bookmarks", 2)]
+
+    assert reader.get_counts() == {"histories": 10, "bookmarks": 2}
+    assert [x["id"] for x in reader.read("histories")] == list(range(10))
+    assert [x["title"] for x in reader.read("bookmarks")] == ["b0", "b1"]
+    assert [source for source, _ in reader] == ["histories"] * 10 + ["bookmarks"] * 2
+
+
+def test_msgpack_skip_frames(msgpack_export):
+    # Frames of other sources are skipped without reading their payloads.
+    offset = len(MSGPACK_MAGIC) + MSGPACK_FRAME.size + len("histories")
+    with open(msgpack_export, mode="r+b") as f:
+        f.seek(offset)
+        f.write(b"\xc1")
+
+    reader = MessagePackReader(msgpack_export)
+    assert len(list(reader.read("bookmarks"))) == 2
+    with pytest.raises(ValueError):
+        list(reader.read("histories"))
+
+
+@pytest.mark.parametrize("size", [len(MSGPACK_MAGIC) + 4, -5])
+def test_msgpack_truncated(msgpack_export, size):
+    # In a frame header, or in the payload of the last frame.
+    with open(msgpack_export, mode="r+b") as f:
+        f.truncate(size if size > 0 else os.path.getsize(msgpack_export) + size)
+
+    with pytest.raises(ValueError, match="Truncated frame"):
+        list(MessagePackReader(msgpack_export))
+
+
+def test_msgpack_invalid(tmp_path):
+    filename = tmp_path / "export.msgpack"
+    filename.write_bytes(b"\x92\x01\x02")
+
+    with pytest.raises(ValueError, match="Not a MessagePack export"):
+        MessagePackReader(str(filename)).get_counts()
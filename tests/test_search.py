@@ -0,0 +1,160 @@
+import sqlite3
+import time
+
+import pytest
+
+from resworb.base import Bookmark, HistoryItem
+from resworb.browsers.chrome import Chrome
+from resworb.connection import ConnectionManager
+from resworb.search import SearchIndex
+
+
+class Browser:
+    # Histories with raw visit times and bookmarks, held in memory.
+    def __init__(self, histories=(), bookmarks=()):
+        self.connections = ConnectionManager()
+        self.histories = list(histories)
+        self.bookmarks = list(bookmarks)
+
+    def get_history_watermark(self):
+        return max((x.visit_time for x in self.histories), default=None)
+
+    def get_histories(self, after=None, upto=None, raw_time=False):
+        assert raw_time
+        for x in self.histories:
+            if (after is None or x.visit_time > after) and (
+                upto is None or x.visit_time <= upto
+            ):
+                yield x
+
+    def get_bookmarks(self):
+        return iter(self.bookmarks)
+
+    def get_cloud_tabs(self):
+        raise NotImplementedError
+
+    def get_readings(self):
+        raise NotImplementedError
+
+
+def history(url, title, visit_time):
+    return HistoryItem(None, url, title, visit_time)
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = SearchIndex(str(tmp_path / "search.sqlite"))
+    try:
+        yield index
+    finally:
+        index.close()
+
+
+def urls(rows):
+    return [x["url"] for x in rows]
+
+
+def test_update_histories(index, libraries):
+    browser = Chrome(libraries["chrome"])
+
+    counts = index.update(browser, "chrome", sources=["histories"])
+    assert counts["histories"] > 0
+    assert index.update(browser, "chrome", sources=["histories"]) == {"histories": 0}
+
+    # Unsupported sources are skipped.
+    assert set(index.update(browser, "chrome")) == {"bookmarks", "histories"}
+
+
+def test_update_watermark_precision(index):
+    # Raw watermarks (e.g. Chrome's microseconds since 1601) are beyond the
+    # precision of floats, a rounded up watermark would skip the next visit.
+    watermark = 2**53 + 3
+    assert float(watermark) > watermark
+
+    browser = Browser([history("https://a.test/1", "first", watermark)])
+    assert index.update(browser, "b") == {"bookmarks": 0, "histories": 1}
+
+    browser.histories += [history("https://a.test/2", "second", watermark + 1)]
+    assert index.update(browser, "b") == {"bookmarks": 0, "histories": 1}
+    assert urls(index.search("second")) == ["https://a.test/2"]
+
+
+def test_rounded_watermarks_dropped(tmp_path):
+    filename = str(tmp_path / "search.sqlite")
+    with sqlite3.connect(filename) as conn:
+        conn.execute(
+            "CREATE TABLE watermarks (browser, profile, source, watermark REAL)"
+        )
+        conn.execute("INSERT INTO watermarks VALUES ('b', 'default', 'histories', 1)")
+    conn.close()
+
+    index = SearchIndex(filename)
+    try:
+        assert not index.conn.execute("SELECT * FROM watermarks").fetchall()
+
+        browser = Browser([history("https://a.test/", "page", 1)])
+        assert index.update(browser, "b")["histories"] == 1
+    finally:
+        index.close()
+
+
+def test_update_removes_stale_documents(index):
+    browser = Browser(
+        [history("https://a.test/visited", "page", 1)],
+        [
+            Bookmark("page", "https://a.test/kept", ("Bar",)),
+            Bookmark("page", "https://a.test/removed", ("Bar",)),
+        ],
+    )
+    index.update(browser, "b")
+
+    # Bookmarks are replaced, histories are kept.
+    browser.histories, browser.bookmarks = [], browser.bookmarks[:1]
+    index.update(browser, "b")
+
+    assert sorted(urls(index.search("page"))) == [
+        "https://a.test/kept",
+        "https://a.test/visited",
+    ]
+
+
+def test_search_filters(index):
+    for name in ["a", "b"]:
+        browser = Browser(
+            [history(f"https://{name}.test/history", "page", 1)],
+            [Bookmark("page", f"https://{name}.test/bookmark", ("Bar",))],
+        )
+        index.update(browser, name)
+
+    assert sorted(urls(index.search("page", sources=["bookmarks"]))) == [
+        "https://a.test/bookmark",
+        "https://b.test/bookmark",
+    ]
+    assert sorted(urls(index.search("page", browsers=["b"]))) == [
+        "https://b.test/bookmark",
+        "https://b.test/history",
+    ]
+    assert urls(index.search("page", sources=["histories"], browsers=["a"])) == [
+        "https://a.test/history"
+    ]
+    assert not list(index.search("page", browsers=[]))
+    assert not list(index.search("!!"))
+
+
+def test_search_recency(index):
+    # Equal matches are ranked by the recency of their last visit, never
+    # visited ones last.
+    now = time.time_ns() // 1000
+    day = 86400 * 1000000
+    browser = Browser(
+        [
+            history("https://a.test/1", "page", now - 365 * day),
+            history("https://a.test/2", "page", now - day),
+        ],
+        [Bookmark("page", "https://a.test/3", ())],
+    )
+    index.update(browser, "b")
+
+    rows = list(index.search("page"))
+    assert urls(rows) == ["https://a.test/2", "https://a.test/1", "https://a.test/3"]
+    assert rows[0]["score"] > rows[1]["score"] > rows[2]["score"] > 0
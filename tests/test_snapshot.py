@@ -0,0 +1,41 @@
+import sqlite3
+
+import pytest
+
+from resworb import snapshot
+from resworb.browsers.chrome import Chrome
+
+
+@pytest.fixture
+def database(tmp_path):
+    filename = str(tmp_path / "test.sqlite")
+    conn = sqlite3.connect(filename)
+    with conn:
+        conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, value TEXT)")
+        conn.executemany("INSERT INTO items (value) VALUES (?)", [("a",), ("b",)])
+    conn.close()
+
+    return filename
+
+
+@pytest.mark.parametrize("in_memory", [False, True])
+def test_connect(database, in_memory):
+    conn = snapshot.connect(database, in_memory=in_memory)
+
+    # Later writes are not seen by the snapshot.
+    source = sqlite3.connect(database)
+    with source:
+        source.execute("INSERT INTO items (value) VALUES ('c')")
+    source.close()
+
+    assert conn.execute("SELECT value FROM items").fetchall() == [("a",), ("b",)]
+    conn.close()
+
+
+def test_browser_in_memory(libraries):
+    on_disk = Chrome(libraries["chrome"])
+    in_memory = Chrome(libraries["chrome"], in_memory=True)
+
+    assert not on_disk.connections.in_memory
+    assert in_memory.connections.in_memory
+    assert list(on_disk.get_histories()) == list(in_memory.get_histories())
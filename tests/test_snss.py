@@ -0,0 +1,159 @@
+import struct
+
+import fixtures
+import pytest
+
+from resworb.snss import read_session
+
+
+def tab(window_id, tab_id, index):
+    return [
+        (0, struct.pack("<ii", window_id, tab_id)),
+        (2, struct.pack("<ii", tab_id, index)),
+    ]
+
+
+def navigation(tab_id, index):
+    url = f"https://example.com/{tab_id}/{index}"
+    return 6, fixtures._pickle(  # pylint: disable=protected-access
+        tab_id, index, url.encode("utf-8"), f"Tab {tab_id} {index}", b"state", 0
+    )
+
+
+def navigations(tab_id, count):
+    return [navigation(tab_id, i) for i in range(count)]
+
+
+def select(tab_id, index):
+    return 7, struct.pack("<ii", tab_id, index)
+
+
+def read(tmp_path, commands):
+    filename = str(tmp_path / "Session")
+    fixtures.write_snss(filename, commands)
+
+    return read_session(filename)
+
+
+def urls(windows):
+    return {x["id"]: [tab["url"] for tab in x["tabs"]] for x in windows}
+
+
+def test_selected_navigation(tmp_path):
+    # Tabs are ordered by their index, not by when they were opened.
+    windows = read(
+        tmp_path,
+        [
+            *tab(1, 11, 1),
+            *navigations(11, 3),
+            select(11, 1),
+            *tab(1, 10, 0),
+            *navigations(10, 2),
+            select(10, 0),
+            (8, struct.pack("<ii", 1, 1)),
+        ],
+    )
+
+    assert windows[0]["selected"] == 1
+    assert [(x["title"], x["url"]) for x in windows[0]["tabs"]] == [
+        ("Tab 10 0", "https://example.com/10/0"),
+        ("Tab 11 1", "https://example.com/11/1"),
+    ]
+
+
+def test_unknown_selected_navigation(tmp_path):
+    # The last navigation is used.
+    windows = read(tmp_path, [*tab(1, 10, 0), *navigations(10, 3), select(10, 7)])
+
+    assert urls(windows) == {1: ["https://example.com/10/2"]}
+
+
+def test_pruned_from_back(tmp_path):
+    windows = read(
+        tmp_path,
+        [
+            *tab(1, 10, 0),
+            *navigations(10, 4),
+            select(10, 3),
+            (5, struct.pack("<ii", 10, 2)),
+        ],
+    )
+
+    assert urls(windows) == {1: ["https://example.com/10/1"]}
+
+
+def test_pruned(tmp_path):
+    # Navigations 1 and 2 are removed, 3 and 4 become 1 and 2.
+    windows = read(
+        tmp_path,
+        [
+            *tab(1, 10, 0),
+            *navigations(10, 5),
+            (24, struct.pack("<iii", 10, 1, 2)),
+            select(10, 1),
+            *tab(1, 11, 1),
+            *navigations(11, 5),
+            (24, struct.pack("<iii", 11, 1, 2)),
+            select(11, 3),
+        ],
+    )
+
+    assert urls(windows) == {
+        1: ["https://example.com/10/3", "https://example.com/11/4"]
+    }
+
+
+def test_closed(tmp_path):
+    windows = read(
+        tmp_path,
+        [
+            *tab(1, 10, 0),
+            *navigations(10, 1),
+            *tab(1, 11, 1),
+            *navigations(11, 1),
+            (16, struct.pack("<iiq", 11, 0, 0)),
+            *tab(2, 20, 0),
+            *navigations(20, 1),
+            (17, struct.pack("<iiq", 2, 0, 0)),
+        ],
+    )
+
+    assert urls(windows) == {1: ["https://example.com/10/0"]}
+
+
+def test_truncated(tmp_path):
+    # A command still being written is ignored, so is a too short payload.
+    filename = str(tmp_path / "Session")
+    fixtures.write_snss(
+        filename,
+        [*tab(1, 10, 0), *navigations(10, 2), (7, b"\x01\x00")],
+    )
+    with open(filename, mode="ab") as f:
+        f.write(struct.pack("<HB", 100, 7) + b"\x0a\x00")
+
+    assert urls(read_session(filename)) == {1: ["https://example.com/10/1"]}
+
+
+def test_generated_session(tmp_path):
+    # Closed tabs and windows of the fixtures leave 20 tabs a window.
+    generator = fixtures.Generator(1000)
+    windows = read(
+        tmp_path,
+        fixtures._snss_commands(generator, 45),  # pylint: disable=protected-access
+    )
+
+    assert [len(x["tabs"]) for x in windows] == [20, 20, 5]
+
+
+def test_invalid(tmp_path):
+    filename = tmp_path / "Session"
+    filename.write_bytes(b"")
+    assert read_session(str(filename)) == []
+
+    filename.write_bytes(b"SNSX" + struct.pack("<i", 3))
+    with pytest.raises(ValueError):
+        read_session(str(filename))
+
+    filename.write_bytes(b"SNSS" + struct.pack("<i", 2))
+    with pytest.raises(ValueError):
+        read_session(str(filename))